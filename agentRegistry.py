@@ -0,0 +1,26 @@
+"""
+Search agents and evaluation functions by name, shared by the programs that
+build agents from their command line or from requests (tournament.py and
+decisionServer.py).
+"""
+
+import importlib
+
+import multiAgent
+
+AGENTS = {
+    'minimax': multiAgent.MinimaxAgent,
+    'alphabeta': multiAgent.AlphaBetaAgent,
+    'expectimax': multiAgent.ExpectimaxAgent,
+}
+
+
+def loadEvaluationFunction(name: str):
+    """
+    Returns the evaluation function with the given name. Plain names are
+    looked up in multiAgent, and 'module:name' loads them from another module.
+    """
+    if ':' in name:
+        moduleName, name = name.split(':', 1)
+        return getattr(importlib.import_module(moduleName), name)
+    return getattr(multiAgent, name)
@@ -0,0 +1,92 @@
+"""
+Agent searches that do not freeze the Tk window.
+
+`BackgroundSearch` runs `agent.getAction` in a background thread and hands
+the action to a callback on the Tk event loop, so the window keeps redrawing
+and handling events while the agent thinks. Tk may only be used from the
+thread that runs its event loop, so the search thread never touches it:
+it puts its result in a queue that the event loop polls with `after`.
+
+The search still shares the interpreter with the window, which gets a turn
+every few milliseconds. Agents created with `workers` search in other
+processes and leave the main one almost idle.
+
+Example:
+    search = BackgroundSearch(root, agent)
+    search.start(gameState, 0, onResult)
+    root.bind('<Escape>', lambda event: search.cancel())
+"""
+
+import queue
+import threading
+
+from multiAgent import SearchCancelled
+
+
+class BackgroundSearch:
+    """
+    Runs the searches of one agent, one at a time, in a background thread.
+    """
+    def __init__(self, root, agent, pollInterval: int = 20):
+        self.root = root
+        self.agent = agent
+        self.pollInterval = pollInterval  # Milliseconds between checks for the result
+        self.results = queue.Queue()
+        self.thread = None
+        self.cancelled = False
+        self.onResult = None
+        self.onCancel = None
+
+    @property
+    def running(self) -> bool:
+        """
+        Whether a search has been started and its result not delivered yet.
+        """
+        return self.thread is not None
+
+    def start(self, gameState, agentIndex: int, onResult, onCancel=None):
+        """
+        Starts searching the action of the given agent. `onResult(action)` is
+        called on the Tk event loop when the search ends, or `onCancel()` if
+        it was cancelled.
+        """
+        if self.running:
+            raise RuntimeError("The previous search has not finished yet")
+        self.cancelled = False
+        self.onResult = onResult
+        self.onCancel = onCancel
+        self.thread = threading.Thread(target=self._search, args=(gameState, agentIndex), daemon=True)
+        self.thread.start()
+        self.root.after(self.pollInterval, self._poll)
+
+    def cancel(self):
+        """
+        Stops the search in progress, if any. Its result is discarded even if
+        the search finishes before noticing.
+        """
+        if self.running:
+            self.cancelled = True
+            self.agent.cancel()
+
+    def _search(self, gameState, agentIndex: int):
+        try:
+            self.results.put(('action', self.agent.getAction(gameState, agentIndex)))
+        except SearchCancelled:
+            self.results.put(('cancelled', None))
+        except Exception as error:
+            self.results.put(('error', error))
+
+    def _poll(self):
+        try:
+            kind, value = self.results.get_nowait()
+        except queue.Empty:
+            self.root.after(self.pollInterval, self._poll)
+            return
+        self.thread = None
+        if kind == 'error':
+            raise value
+        if kind == 'cancelled' or self.cancelled:
+            if self.onCancel is not None:
+                self.onCancel()
+        else:
+            self.onResult(value)
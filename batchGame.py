@@ -0,0 +1,287 @@
+"""
+Batched 2048 engine built on NumPy.
+
+`BatchGame` holds N boards in a single (N, 4, 4) array of tile exponents and
+advances all of them at once: moves, legality masks, random spawns and
+terminal checks are vectorized over the whole batch using the row tables of
+rowTables.py. Policies are functions `policy(game, legal) -> actions` that
+receive the (N, 4) legality mask and return one action index per board, in
+the order of ACTIONS.
+
+`batchedEvaluationFunction2048` lets the search agents score the leaves of
+their trees in batches (see the batchLeaves option of the agents).
+
+This module needs NumPy, unlike the rest of the project.
+
+Example:
+    python batchGame.py --games 10000 --policy greedy
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from gameState import SPAWN_PROBABILITIES, LEFT, RIGHT, UP, DOWN, ACTION_NAMES
+from multiAgent import batchEvaluation, evaluationFunction2048
+from rowTables import getRowTables, TILE_VALUES, LEFT_CHANGED, RIGHT_CHANGED
+
+ACTIONS = ACTION_NAMES  # Action indices are the player action codes of gameState
+WIN_EXPONENT = 11  # 2 ** 11 == 2048
+
+_VALUES = np.array(TILE_VALUES, dtype=np.int64)
+_SHIFTS = np.array([0, 4, 8, 12], dtype=np.uint16)
+_tables = None
+
+
+def _rowTableArrays() -> tuple:
+    """
+    Returns the row tables as NumPy arrays (left, right, changed), wrapping
+    the arrays of rowTables.py without copying them.
+    """
+    global _tables
+    if _tables is None:
+        tables = getRowTables()
+        _tables = (np.frombuffer(tables.left, dtype=np.uint16),
+                   np.frombuffer(tables.right, dtype=np.uint16),
+                   np.frombuffer(tables.changed, dtype=np.uint8))
+    return _tables
+
+
+def rowKeys(boards: np.ndarray) -> np.ndarray:
+    """
+    Packs every row of a (N, 4, 4) exponent array into its row table index.
+    """
+    return (boards.astype(np.uint16) << _SHIFTS).sum(axis=-1, dtype=np.uint16)
+
+
+def unpackRows(keys: np.ndarray) -> np.ndarray:
+    """
+    Unpacks an array of row table entries into the exponents of their cells.
+    """
+    return ((keys[..., None] >> _SHIFTS) & 0xF).astype(np.uint8)
+
+
+def moveBoards(boards: np.ndarray, action: int) -> np.ndarray:
+    """
+    Returns the boards after applying the same move to all of them.
+    """
+    left, right, _ = _rowTableArrays()
+    table = left if action in (LEFT, UP) else right
+    if action in (LEFT, RIGHT):
+        return unpackRows(table[rowKeys(boards)])
+    columns = boards.transpose(0, 2, 1)
+    return unpackRows(table[rowKeys(columns)]).transpose(0, 2, 1)
+
+
+def legalMoves(boards: np.ndarray) -> np.ndarray:
+    """
+    Returns a (N, 4) boolean mask with the legal moves of every board.
+    """
+    _, _, changed = _rowTableArrays()
+    rowFlags = np.bitwise_or.reduce(changed[rowKeys(boards)], axis=1)
+    columnFlags = np.bitwise_or.reduce(changed[rowKeys(boards.transpose(0, 2, 1))], axis=1)
+    return np.stack([rowFlags & LEFT_CHANGED != 0, rowFlags & RIGHT_CHANGED != 0,
+                     columnFlags & LEFT_CHANGED != 0, columnFlags & RIGHT_CHANGED != 0], axis=1)
+
+
+def evaluateBoards(boards: np.ndarray) -> np.ndarray:
+    """
+    Vectorized `evaluationFunction2048`: sum of the tiles plus ten times the
+    maximum tile plus five points per empty cell.
+    """
+    values = _VALUES[boards]
+    return (values.sum(axis=(1, 2)) + 10 * values.max(axis=(1, 2))
+            + 5 * (boards == 0).sum(axis=(1, 2)))
+
+
+def unpackSizedBoards(keys: list, size: int) -> np.ndarray:
+    """
+    Unpacks board keys of `size` x `size` boards (4 bits per cell, see
+    `getBoardKey`) into a (N, size, size) exponent array.
+    """
+    cells = size * size
+    length = (cells + 1) // 2
+    data = np.frombuffer(b''.join(key.to_bytes(length, 'little') for key in keys), dtype=np.uint8)
+    nibbles = np.stack([data & 0xF, data >> 4], axis=1).reshape(len(keys), 2 * length)
+    return nibbles[:, :cells].reshape(-1, size, size)
+
+
+def evaluateStates2048(states: list) -> list:
+    """
+    Evaluates a list of game states of any engine with `evaluateBoards`.
+    All the states must have the same board size.
+    """
+    if not states:
+        return []
+    size = states[0].size
+    if size != 4:
+        return evaluateBoards(unpackSizedBoards([state.getBoardKey() for state in states], size)).tolist()
+    bitboards = np.fromiter((state.getBoardKey() for state in states), dtype=np.uint64, count=len(states))
+    return evaluateBoards(unpackBoards(bitboards)).tolist()
+
+
+@batchEvaluation(evaluateStates2048)
+def batchedEvaluationFunction2048(currentGameState) -> int:
+    """
+    `evaluationFunction2048` declared as accepting batches, for agents
+    created with batchLeaves=True.
+    """
+    return evaluationFunction2048(currentGameState)
+
+
+def packBoards(boards: np.ndarray) -> np.ndarray:
+    """
+    Packs the boards into the 64-bit layout of `BitboardGameState`.
+    """
+    keys = rowKeys(boards).astype(np.uint64)
+    return keys[:, 0] | (keys[:, 1] << np.uint64(16)) | (keys[:, 2] << np.uint64(32)) | (keys[:, 3] << np.uint64(48))
+
+
+def unpackBoards(bitboards) -> np.ndarray:
+    """
+    Unpacks 64-bit bitboards into a (N, 4, 4) exponent array.
+    """
+    bitboards = np.asarray(bitboards, dtype=np.uint64)
+    shifts = np.arange(0, 64, 4, dtype=np.uint64)
+    return ((bitboards[:, None] >> shifts) & np.uint64(0xF)).astype(np.uint8).reshape(-1, 4, 4)
+
+
+class BatchGame:
+    """
+    N games of 2048 advanced together.
+    """
+    def __init__(self, numGames: int, seed: int = None):
+        self.rng = np.random.default_rng(seed)
+        self.boards = np.zeros((numGames, 4, 4), dtype=np.uint8)
+        self.moves = np.zeros(numGames, dtype=np.int64)
+        self.spawn()
+        self.spawn()
+
+    def __len__(self) -> int:
+        return len(self.boards)
+
+    def spawn(self, mask: np.ndarray = None):
+        """
+        Places a random tile in an empty cell of every board selected by
+        `mask` (all of them by default), using the real spawn rates.
+        """
+        cells = self.boards.reshape(len(self), 16)
+        empty = cells == 0
+        # Picking the highest random key among the empty cells chooses one uniformly
+        keys = self.rng.random(cells.shape)
+        keys[~empty] = -1.0
+        chosen = keys.argmax(axis=1)
+        selected = empty.any(axis=1)
+        if mask is not None:
+            selected &= mask
+        exponents = np.where(self.rng.random(len(self)) < SPAWN_PROBABILITIES[2], 1, 2).astype(np.uint8)
+        rows = np.nonzero(selected)[0]
+        cells[rows, chosen[rows]] = exponents[rows]
+
+    def legalMoves(self) -> np.ndarray:
+        """
+        Returns a (N, 4) boolean mask with the legal moves of every board.
+        """
+        return legalMoves(self.boards)
+
+    def isWin(self) -> np.ndarray:
+        """
+        Returns which boards hold a 2048 tile.
+        """
+        return (self.boards == WIN_EXPONENT).any(axis=(1, 2))
+
+    def isLose(self, legal: np.ndarray = None) -> np.ndarray:
+        """
+        Returns which boards have no legal moves left.
+        """
+        if legal is None:
+            legal = self.legalMoves()
+        return ~legal.any(axis=1)
+
+    def move(self, actions: np.ndarray, mask: np.ndarray = None):
+        """
+        Applies one action per board to the boards selected by `mask`.
+        """
+        for action in range(4):
+            selected = actions == action
+            if mask is not None:
+                selected &= mask
+            if selected.any():
+                self.boards[selected] = moveBoards(self.boards[selected], action)
+        self.moves += np.ones(len(self), dtype=np.int64) if mask is None else mask
+
+    def scores(self) -> np.ndarray:
+        """
+        Returns the score of every board, the sum of its tiles.
+        """
+        return _VALUES[self.boards].sum(axis=(1, 2))
+
+    def maxTiles(self) -> np.ndarray:
+        """
+        Returns the largest tile of every board.
+        """
+        return _VALUES[self.boards.max(axis=(1, 2))]
+
+    def play(self, policy, stopAtWin: bool = True) -> np.ndarray:
+        """
+        Plays all the games to the end with the given policy. Like GameNoUI,
+        a game stops when it reaches 2048 unless stopAtWin is False.
+        Returns the final scores.
+        """
+        while True:
+            legal = self.legalMoves()
+            active = legal.any(axis=1)
+            if stopAtWin:
+                active &= ~self.isWin()
+            if not active.any():
+                break
+            actions = policy(self, legal)
+            self.move(actions, active)
+            self.spawn(active)
+        return self.scores()
+
+
+def randomPolicy(game: BatchGame, legal: np.ndarray) -> np.ndarray:
+    """
+    Chooses a legal move uniformly at random for every board.
+    """
+    keys = game.rng.random(legal.shape)
+    keys[~legal] = -1.0
+    return keys.argmax(axis=1)
+
+
+def greedyPolicy(game: BatchGame, legal: np.ndarray) -> np.ndarray:
+    """
+    Chooses for every board the legal move whose result has the best
+    `evaluationFunction2048` value, preferring the first move in ACTIONS on ties.
+    """
+    values = np.stack([evaluateBoards(moveBoards(game.boards, action)) for action in range(4)], axis=1)
+    values = values.astype(np.float64)
+    values[~legal] = -np.inf
+    return values.argmax(axis=1)
+
+
+POLICIES = {'random': randomPolicy, 'greedy': greedyPolicy}
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Plays a batch of 2048 games with a vectorized policy.")
+    parser.add_argument('--games', type=int, default=10000)
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='greedy')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    game = BatchGame(args.games, seed=args.seed)
+    start = time.perf_counter()
+    scores = game.play(POLICIES[args.policy])
+    elapsed = time.perf_counter() - start
+    moves = int(game.moves.sum())
+    tiles, counts = np.unique(game.maxTiles(), return_counts=True)
+    print(f"{args.games} games, {moves} moves in {elapsed:.2f} s ({moves / elapsed:.0f} moves/s)")
+    print(f"Mean score: {scores.mean():.1f}")
+    print("Max tiles: " + ' '.join(f"{tile}:{count}" for tile, count in zip(tiles, counts)))
+
+
+if __name__ == '__main__':
+    main()
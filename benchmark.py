@@ -0,0 +1,459 @@
+"""
+Benchmark suite for the game engines and the search agents.
+
+Every run uses the same fixed corpus of boards (benchmarks/corpus.json,
+sampled from seeded random games) and measures:
+
+- the throughput of the engine primitives (moves in each direction, tile
+  placements, legal actions of both agents, isLose, isWin and
+  evaluationFunction2048) on the list, bitboard and packed engines;
+- the time of full searches at fixed depths on the bitboard engine;
+- that the engines follow the rules exactly like `ReferenceGameState`, a
+  direct implementation of the rules kept only for these checks, and that
+  the optimised agents (caches, move ordering, symmetries, and batched leaf
+  evaluation on 3x3 and 5x5 boards) choose the same actions as the plain agents.
+
+Results can be written as JSON. With a stored baseline, the run fails when
+a throughput drops more than `--tolerance` below it or when a check fails.
+Baselines depend on the machine, so create one with --save-baseline on the
+machine that runs the benchmark.
+
+Example:
+    python benchmark.py --save-baseline
+    python benchmark.py --output results.json
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+from bitboardState import BitboardGameState, fromBoard, toBoard
+from gameState import GameState, LEFT, RIGHT, UP, DOWN, ACTION_NAMES, decodeTileAction
+from multiAgent import MinimaxAgent, AlphaBetaAgent, ExpectimaxAgent, evaluationFunction2048
+from packedState import PackedGameState, getLayout
+from rowTables import getRowTables
+from transposition import TranspositionTable
+
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks')
+CORPUS_PATH = os.path.join(BENCHMARK_DIR, 'corpus.json')
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, 'baseline.json')
+
+CORPUS_SEED = 2048
+CORPUS_SIZE = 256
+MIN_RUN_TIME = 0.05  # Seconds
+
+
+def _slideLeft(row: list) -> list:
+    """
+    Slides and merges a row of tile values to the left.
+    """
+    filtered = [value for value in row if value != 0]
+    merged = []
+    skip = False
+    for j in range(len(filtered)):
+        if skip:
+            skip = False
+            continue
+        if j + 1 < len(filtered) and filtered[j] == filtered[j + 1]:
+            merged.append(filtered[j] * 2)
+            skip = True
+        else:
+            merged.append(filtered[j])
+    return merged + [0] * (4 - len(merged))
+
+
+class ReferenceGameState:
+    """
+    Straightforward implementation of the rules, cell by cell, used as the
+    reference the engines are checked against. It is deliberately not optimised.
+    """
+    def __init__(self, board: list = None):
+        self.board = board if board is not None else [[0] * 4 for _ in range(4)]
+
+    def isLose(self) -> bool:
+        return not self.getLegalActions(0)
+
+    def isWin(self) -> bool:
+        return any(cell == 2048 for row in self.board for cell in row)
+
+    def moved(self, action: int) -> list:
+        """
+        Returns the board after the player's move.
+        """
+        board = self.board
+        if action == LEFT:
+            return [_slideLeft(row) for row in board]
+        if action == RIGHT:
+            return [_slideLeft(row[::-1])[::-1] for row in board]
+        columns = [list(column) for column in zip(*board)]
+        if action == UP:
+            columns = [_slideLeft(column) for column in columns]
+        else:
+            columns = [_slideLeft(column[::-1])[::-1] for column in columns]
+        return [list(row) for row in zip(*columns)]
+
+    def getLegalActions(self, agentIndex: int = 0) -> list:
+        if agentIndex == 0:
+            return [action for action in (LEFT, RIGHT, UP, DOWN) if self.moved(action) != self.board]
+        actions = []
+        for i in range(4):
+            for j in range(4):
+                if self.board[i][j] == 0:
+                    cell = (4 * i + j) << 4
+                    actions.append(cell | 1)
+                    actions.append(cell | 2)
+        return actions
+
+    def generateSuccessor(self, agentIndex: int, action: int) -> 'ReferenceGameState':
+        if agentIndex == 0:
+            return ReferenceGameState(self.moved(action))
+        board = [row[:] for row in self.board]
+        i, j, value = decodeTileAction(action)
+        board[i][j] = value
+        return ReferenceGameState(board)
+
+    def getNumAgents(self) -> int:
+        return 2
+
+
+def buildCorpus(size: int = CORPUS_SIZE, seed: int = CORPUS_SEED) -> list:
+    """
+    Plays seeded random games on the reference engine and samples `size`
+    boards from all their stages, returned as packed board keys.
+    """
+    rng = random.Random(seed)
+    boards = []
+    while len(boards) < size:
+        state = ReferenceGameState()
+        for _ in range(2):
+            state = state.generateSuccessor(1, rng.choice(state.getLegalActions(1)))
+        history = []
+        while True:
+            actions = state.getLegalActions(0)
+            if not actions:
+                break
+            state = state.generateSuccessor(0, rng.choice(actions))
+            state = state.generateSuccessor(1, rng.choice(state.getLegalActions(1)))
+            history.append(state)
+        boards.extend(fromBoard(s.board) for s in rng.sample(history, min(16, len(history))))
+    return boards[:size]
+
+
+def loadCorpus(path: str = CORPUS_PATH) -> list:
+    """
+    Reads the corpus of packed boards.
+    """
+    with open(path) as f:
+        return json.load(f)['boards']
+
+
+def saveCorpus(boards: list, path: str = CORPUS_PATH):
+    """
+    Writes a corpus of packed boards.
+    """
+    with open(path, 'w') as f:
+        json.dump({'seed': CORPUS_SEED, 'boards': boards}, f, indent=0)
+
+
+def makeStates(boards: list, engine: str) -> list:
+    """
+    Builds the game states of the corpus for an engine ('reference', 'list',
+    'bitboard' or 'packed').
+    """
+    if engine == 'bitboard':
+        return [BitboardGameState(board) for board in boards]
+    if engine == 'packed':
+        layout = getLayout()
+        return [PackedGameState(bitboard=board, layout=layout) for board in boards]
+    states = []
+    for board in boards:
+        state = ReferenceGameState() if engine == 'reference' else GameState()
+        state.board = toBoard(board)
+        states.append(state)
+    return states
+
+
+def timeLoop(function, items: list, repeat: int) -> float:
+    """
+    Returns the best throughput, in calls per second, of calling `function`
+    on every item, over `repeat` runs. Each run goes over the items as many
+    times as needed to last at least MIN_RUN_TIME seconds.
+    """
+    passes = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(passes):
+            for item in items:
+                function(item)
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_RUN_TIME:
+            break
+        passes *= 2
+    best = elapsed
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(passes):
+            for item in items:
+                function(item)
+        best = min(best, time.perf_counter() - start)
+    return passes * len(items) / best
+
+
+def benchmarkPrimitives(boards: list, repeat: int) -> dict:
+    """
+    Measures the throughput of the engine primitives on the corpus. Every
+    primitive runs once over the corpus before it is timed, so building the
+    row tables and any lazily filled table is not measured.
+    """
+    getRowTables()
+    results = {}
+    for engine in ('list', 'bitboard', 'packed'):
+        states = makeStates(boards, engine)
+        placements = [(state, state.getLegalActions(1)[0]) for state in states if state.getLegalActions(1)]
+        primitives = [(f'generateSuccessor.{ACTION_NAMES[action]}',
+                       lambda state, action=action: state.generateSuccessor(0, action), states)
+                      for action in (LEFT, RIGHT, UP, DOWN)]
+        primitives += [
+            ('generateSuccessor.tile', lambda item: item[0].generateSuccessor(1, item[1]), placements),
+            ('getLegalActions.player', lambda state: state.getLegalActions(0), states),
+            ('getLegalActions.tiles', lambda state: state.getLegalActions(1), states),
+            ('isLose', lambda state: state.isLose(), states),
+            ('isWin', lambda state: state.isWin(), states),
+            ('evaluationFunction2048', evaluationFunction2048, states),
+        ]
+        for _, function, items in primitives:
+            for item in items:
+                function(item)
+        for name, function, items in primitives:
+            results[f'{engine}.{name}'] = timeLoop(function, items, repeat)
+    return results
+
+
+# Searches timed by the suite: (name, agent factory, depth)
+SEARCHES = [
+    ('minimax', lambda depth: MinimaxAgent(evalFn=evaluationFunction2048, depth=depth), 2),
+    ('alphabeta', lambda depth: AlphaBetaAgent(evalFn=evaluationFunction2048, depth=depth), 3),
+    ('alphabeta+cache', lambda depth: AlphaBetaAgent(evalFn=evaluationFunction2048, depth=depth,
+                                                     cache=TranspositionTable()), 3),
+    ('expectimax', lambda depth: ExpectimaxAgent(evalFn=evaluationFunction2048, depth=depth), 2),
+    ('expectimax+cache', lambda depth: ExpectimaxAgent(evalFn=evaluationFunction2048, depth=depth,
+                                                       cache=TranspositionTable()), 2),
+]
+
+
+def benchmarkSearches(boards: list, repeat: int) -> dict:
+    """
+    Measures full searches for the player, in searches per second, on the
+    bitboard engine. Every run starts with a new agent, so caches start empty.
+    """
+    states = [state for state in makeStates(boards, 'bitboard') if not state.isLose()]
+    results = {}
+    for name, factory, depth in SEARCHES:
+        best = float('inf')
+        for _ in range(repeat):
+            agent = factory(depth)
+            start = time.perf_counter()
+            for state in states:
+                agent.getAction(state)
+            best = min(best, time.perf_counter() - start)
+        results[f'search.{name}.depth{depth}'] = len(states) / best
+    return results
+
+
+def checkEngines(boards: list) -> list:
+    """
+    Compares the list, bitboard and packed engines with the reference on
+    every board of the corpus. Returns a description of every difference found.
+    """
+    failures = []
+    reference = makeStates(boards, 'reference')
+    for engine in ('list', 'bitboard', 'packed'):
+        for board, expected, state in zip(boards, reference, makeStates(boards, engine)):
+            for agentIndex in (0, 1):
+                if state.getLegalActions(agentIndex) != expected.getLegalActions(agentIndex):
+                    failures.append(f"{engine}: legal actions of agent {agentIndex} differ on board {board:#x}")
+            for action in (LEFT, RIGHT, UP, DOWN):
+                if state.generateSuccessor(0, action).board != expected.generateSuccessor(0, action).board:
+                    failures.append(f"{engine}: {ACTION_NAMES[action]} differs on board {board:#x}")
+            for action in expected.getLegalActions(1)[:2]:
+                if state.generateSuccessor(1, action).board != expected.generateSuccessor(1, action).board:
+                    failures.append(f"{engine}: tile placement {action} differs on board {board:#x}")
+            if state.isLose() != expected.isLose() or state.isWin() != expected.isWin():
+                failures.append(f"{engine}: terminal checks differ on board {board:#x}")
+            if state.getBoardKey() != board:
+                failures.append(f"{engine}: board key differs on board {board:#x}")
+    return failures
+
+
+# Optimised agents checked against a plain agent on the reference engine:
+# (name, reference factory, optimised factory, agent index)
+DECISION_CHECKS = [
+    ('alphabeta', lambda: MinimaxAgent(evalFn=evaluationFunction2048, depth=2),
+     lambda: AlphaBetaAgent(evalFn=evaluationFunction2048, depth=2, cache=TranspositionTable(),
+                            symmetricCache=True), 0),
+    ('alphabeta.tiles', lambda: MinimaxAgent(evalFn=evaluationFunction2048, depth=2),
+     lambda: AlphaBetaAgent(evalFn=evaluationFunction2048, depth=2, cache=TranspositionTable(),
+                            symmetricCache=True), 1),
+    ('expectimax', lambda: ExpectimaxAgent(evalFn=evaluationFunction2048, depth=2),
+     lambda: ExpectimaxAgent(evalFn=evaluationFunction2048, depth=2, cache=TranspositionTable(),
+                             symmetricCache=True), 0),
+]
+
+
+# Board sizes on which batched leaf evaluation is checked against the plain agents
+SIZED_DECISION_SIZES = (3, 5)
+SIZED_DECISION_BOARDS = 8
+
+
+def sampleSizedStates(size: int, count: int = SIZED_DECISION_BOARDS, seed: int = CORPUS_SEED) -> list:
+    """
+    Plays a seeded random game on the list engine with `size` rows and
+    columns and returns `count` of its non-terminal states.
+    """
+    rng = random.Random(seed)
+    states = []
+    while len(states) < count:
+        state = GameState(size, 32768)
+        history = []
+        while True:
+            state = state.generateSuccessor(1, rng.choice(state.getLegalActions(1)))
+            actions = state.getLegalActions(0)
+            if not actions:
+                break
+            history.append(state)
+            state = state.generateSuccessor(0, rng.choice(actions))
+        states.extend(rng.sample(history, min(count - len(states), len(history))))
+    return states
+
+
+def checkSizedDecisions() -> list:
+    """
+    Checks that agents with batched leaf evaluation on the packed engine
+    choose the same actions as the plain agents on the list engine, on the
+    boards of SIZED_DECISION_SIZES. Needs NumPy; without it nothing is checked.
+    Returns a description of every difference found.
+    """
+    try:
+        from batchGame import batchedEvaluationFunction2048
+    except ImportError:
+        return []
+    failures = []
+    for size in SIZED_DECISION_SIZES:
+        layout = getLayout(size, 32768)
+        states = sampleSizedStates(size)
+        for name, agentClass in (('minimax', MinimaxAgent), ('expectimax', ExpectimaxAgent)):
+            referenceAgent = agentClass(evalFn=evaluationFunction2048, depth=2)
+            batchedAgent = agentClass(evalFn=batchedEvaluationFunction2048, depth=2, batchLeaves=True)
+            for state in states:
+                packed = PackedGameState(layout=layout, bitboard=state.getBoardKey())
+                expected = referenceAgent.getAction(state)
+                actual = batchedAgent.getAction(packed)
+                if expected != actual:
+                    failures.append(f"{name}.batched.{size}x{size}: chose {actual} instead of {expected} "
+                                    f"on board {state.getBoardKey():#x}")
+    return failures
+
+
+def checkDecisions(boards: list) -> list:
+    """
+    Checks that the optimised agents on the bitboard engine choose the same
+    actions as the plain agents on the reference engine, and that batched
+    leaf evaluation does too on other board sizes (see `checkSizedDecisions`).
+    Returns a description of every difference found.
+    """
+    failures = []
+    pairs = [(board, reference, state) for board, reference, state
+             in zip(boards, makeStates(boards, 'reference'), makeStates(boards, 'bitboard'))
+             if not reference.isLose()]
+    for name, referenceFactory, optimisedFactory, agentIndex in DECISION_CHECKS:
+        referenceAgent = referenceFactory()
+        optimisedAgent = optimisedFactory()
+        for board, reference, state in pairs:
+            if agentIndex == 1 and not reference.getLegalActions(1):
+                continue
+            expected = referenceAgent.getAction(reference, agentIndex)
+            actual = optimisedAgent.getAction(state, agentIndex)
+            if expected != actual:
+                failures.append(f"{name}: chose {actual} instead of {expected} on board {board:#x}")
+    return failures + checkSizedDecisions()
+
+
+def compareWithBaseline(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Returns a description of every throughput more than `tolerance` (a
+    fraction) below its baseline.
+    """
+    regressions = []
+    for name, value in results.items():
+        expected = baseline.get(name)
+        if expected and value < expected * (1 - tolerance):
+            regressions.append(f"{name}: {value:,.1f}/s, baseline {expected:,.1f}/s ({value / expected - 1:+.0%})")
+    return regressions
+
+
+def formatResults(results: dict, baseline: dict) -> str:
+    """
+    Formats the throughputs as a text table, next to their baseline if there is one.
+    """
+    lines = [f"{'benchmark':<48}{'per second':>14}{'baseline':>14}{'change':>9}"]
+    lines.append('-' * len(lines[0]))
+    for name, value in results.items():
+        expected = baseline.get(name)
+        if expected:
+            lines.append(f"{name:<48}{value:>14,.1f}{expected:>14,.1f}{value / expected - 1:>+9.0%}")
+        else:
+            lines.append(f"{name:<48}{value:>14,.1f}")
+    return '\n'.join(lines)
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks the 2048 engines and agents on a fixed corpus.")
+    parser.add_argument('--quick', action='store_true', help="run every benchmark only once")
+    parser.add_argument('--repeat', type=int, default=5, help="runs of each benchmark, the best one counts")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help="store these results as the baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed drop below the baseline, as a fraction (default 0.25)")
+    parser.add_argument('--skip-checks', action='store_true', help="do not run the equivalence checks")
+    parser.add_argument('--output', help="also write the results to this JSON file")
+    parser.add_argument('--build-corpus', action='store_true', help="regenerate the corpus file and exit")
+    args = parser.parse_args(argv)
+
+    if args.build_corpus:
+        saveCorpus(buildCorpus())
+        return 0
+
+    boards = loadCorpus()
+    repeat = 1 if args.quick else args.repeat
+    results = benchmarkPrimitives(boards, repeat)
+    # Searches use every eighth board of the corpus, so they take about as long as the primitives
+    results.update(benchmarkSearches(boards[::8], max(1, repeat // 2)))
+
+    failures = [] if args.skip_checks else checkEngines(boards) + checkDecisions(boards[::8])
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+    regressions = compareWithBaseline(results, baseline, args.tolerance)
+
+    print(formatResults(results, baseline))
+    for failure in failures:
+        print(f"CHECK FAILED: {failure}")
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'results': results, 'failures': failures, 'regressions': regressions,
+                       'corpusSize': len(boards)}, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'results': results}, f, indent=2)
+    return 1 if failures or regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
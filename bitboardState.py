@@ -0,0 +1,358 @@
+"""
+Bitboard engine for 2048.
+
+The 16 cells of the board are packed as 4-bit tile exponents into a single
+integer: cell (i, j) lives in the nibble starting at bit 4 * (4 * i + j), so
+each row takes 16 bits and the leftmost cell of a row is its lowest nibble.
+An empty cell has exponent 0 and a tile of value 2**e has exponent e.
+"""
+
+from gameState import LEFT, RIGHT, UP, DOWN, encodeAction
+from rowTables import getRowTables, TILE_VALUES, LEFT_CHANGED, RIGHT_CHANGED
+
+WIN_EXPONENT = 11  # 2 ** 11 == 2048
+ROW_MASK = 0xFFFF
+WIN_PATTERN = WIN_EXPONENT * 0x1111111111111111
+
+def transpose(bitboard: int) -> int:
+    """
+    Returns the bitboard reflected over its main diagonal, so that the
+    columns of `bitboard` become the rows of the result.
+    """
+    a1 = bitboard & 0xF0F00F0FF0F00F0F
+    a2 = bitboard & 0x0000F0F00000F0F0
+    a3 = bitboard & 0x0F0F00000F0F0000
+    a = a1 | (a2 << 12) | (a3 >> 12)
+    b1 = a & 0xFF00FF0000FF00FF
+    b2 = a & 0x00FF00FF00000000
+    b3 = a & 0x00000000FF00FF00
+    return b1 | (b2 >> 24) | (b3 << 24)
+
+
+def mirrorRows(bitboard: int) -> int:
+    """
+    Returns the bitboard reflected left to right, reversing every row.
+    """
+    return (((bitboard & 0x000F000F000F000F) << 12) | ((bitboard & 0x00F000F000F000F0) << 4)
+            | ((bitboard >> 4) & 0x00F000F000F000F0) | ((bitboard >> 12) & 0x000F000F000F000F))
+
+
+def mirrorColumns(bitboard: int) -> int:
+    """
+    Returns the bitboard reflected top to bottom, reversing the order of the rows.
+    """
+    return (((bitboard & ROW_MASK) << 48) | ((bitboard & 0xFFFF0000) << 16)
+            | ((bitboard >> 16) & 0xFFFF0000) | (bitboard >> 48))
+
+
+# The eight symmetries of the board are numbered by three bits, applied in
+# this order: TRANSPOSE, then MIRROR_ROWS and MIRROR_COLUMNS.
+MIRROR_ROWS = 1
+MIRROR_COLUMNS = 2
+TRANSPOSE = 4
+
+# Player moves after each of the three basic transformations
+_ACTION_MAPS = {
+    MIRROR_ROWS: {LEFT: RIGHT, RIGHT: LEFT, UP: UP, DOWN: DOWN},
+    MIRROR_COLUMNS: {LEFT: LEFT, RIGHT: RIGHT, UP: DOWN, DOWN: UP},
+    TRANSPOSE: {LEFT: UP, RIGHT: DOWN, UP: LEFT, DOWN: RIGHT},
+}
+
+
+def transformBoard(bitboard: int, transform: int) -> int:
+    """
+    Returns the bitboard after applying one of the eight symmetries.
+    """
+    if transform & TRANSPOSE:
+        bitboard = transpose(bitboard)
+    if transform & MIRROR_ROWS:
+        bitboard = mirrorRows(bitboard)
+    if transform & MIRROR_COLUMNS:
+        bitboard = mirrorColumns(bitboard)
+    return bitboard
+
+
+def symmetries(bitboard: int) -> tuple:
+    """
+    Returns the eight symmetric versions of the bitboard, indexed by
+    transform number.
+    """
+    transposed = transpose(bitboard)
+    rows = mirrorRows(bitboard)
+    transposedRows = mirrorRows(transposed)
+    return (bitboard, rows, mirrorColumns(bitboard), mirrorColumns(rows),
+            transposed, transposedRows, mirrorColumns(transposed), mirrorColumns(transposedRows))
+
+
+def canonicalKey(bitboard: int) -> tuple[int, int]:
+    """
+    Returns the smallest of the eight symmetric versions of the bitboard and
+    the transform that produces it. All the rotations and reflections of a
+    board share the same canonical key.
+    """
+    keys = symmetries(bitboard)
+    best = min(keys)
+    return best, keys.index(best)
+
+
+def _transformCell(cell: int, transform: int, size: int = 4) -> int:
+    """
+    Returns the index of a cell after applying one of the eight symmetries.
+    """
+    i, j = divmod(cell, size)
+    if transform & TRANSPOSE:
+        i, j = j, i
+    if transform & MIRROR_ROWS:
+        j = size - 1 - j
+    if transform & MIRROR_COLUMNS:
+        i = size - 1 - i
+    return size * i + j
+
+
+def transformAction(agentIndex: int, action: int, transform: int, size: int = 4) -> int:
+    """
+    Maps an action on a board to the same action on the board transformed
+    by `transform`. `size` is the side of the board, for tile actions.
+    """
+    if agentIndex == 0:
+        for step in (TRANSPOSE, MIRROR_ROWS, MIRROR_COLUMNS):
+            if transform & step:
+                action = _ACTION_MAPS[step][action]
+        return action
+    return (_transformCell(action >> 4, transform, size) << 4) | (action & 0xF)
+
+
+def untransformAction(agentIndex: int, action: int, transform: int, size: int = 4) -> int:
+    """
+    Maps an action on the transformed board back to the original board, the
+    inverse of `transformAction`.
+    """
+    if agentIndex == 0:
+        for step in (MIRROR_COLUMNS, MIRROR_ROWS, TRANSPOSE):
+            if transform & step:
+                action = _ACTION_MAPS[step][action]
+        return action
+    cell = action >> 4
+    i, j = divmod(cell, size)
+    if transform & MIRROR_COLUMNS:
+        i = size - 1 - i
+    if transform & MIRROR_ROWS:
+        j = size - 1 - j
+    if transform & TRANSPOSE:
+        i, j = j, i
+    return ((size * i + j) << 4) | (action & 0xF)
+
+
+def _moveRows(bitboard: int, table) -> int:
+    """
+    Replaces each of the four rows of the bitboard by its entry in `table`.
+    """
+    return (table[bitboard & ROW_MASK]
+            | (table[(bitboard >> 16) & ROW_MASK] << 16)
+            | (table[(bitboard >> 32) & ROW_MASK] << 32)
+            | (table[(bitboard >> 48) & ROW_MASK] << 48))
+
+
+def _anyRowChanged(bitboard: int, changed: bytearray, flag: int) -> bool:
+    """
+    Checks if a move changes any of the four rows of the bitboard.
+    """
+    return bool((changed[bitboard & ROW_MASK]
+                 | changed[(bitboard >> 16) & ROW_MASK]
+                 | changed[(bitboard >> 32) & ROW_MASK]
+                 | changed[bitboard >> 48]) & flag)
+
+
+def move(bitboard: int, action: int) -> int:
+    """
+    Returns the bitboard after the player slides the tiles in the direction
+    given by `action`.
+    """
+    tables = getRowTables()
+    if action == LEFT:
+        return _moveRows(bitboard, tables.left)
+    if action == RIGHT:
+        return _moveRows(bitboard, tables.right)
+    if action == UP:
+        return transpose(_moveRows(transpose(bitboard), tables.left))
+    if action == DOWN:
+        return transpose(_moveRows(transpose(bitboard), tables.right))
+    return bitboard
+
+
+def playerMoves(bitboard: int) -> list[tuple[int, int]]:
+    """
+    Returns the (action, bitboard after the move) pairs of the player's legal
+    moves, transposing the board only once. Used by fast playouts.
+    """
+    tables = getRowTables()
+    moves = []
+    left = _moveRows(bitboard, tables.left)
+    if left != bitboard:
+        moves.append((LEFT, left))
+    right = _moveRows(bitboard, tables.right)
+    if right != bitboard:
+        moves.append((RIGHT, right))
+    transposed = transpose(bitboard)
+    up = _moveRows(transposed, tables.left)
+    if up != transposed:
+        moves.append((UP, transpose(up)))
+    down = _moveRows(transposed, tables.right)
+    if down != transposed:
+        moves.append((DOWN, transpose(down)))
+    return moves
+
+
+def emptyCells(bitboard: int) -> list[int]:
+    """
+    Returns the indices (4 * i + j) of the empty cells of the bitboard.
+    """
+    return [cell for cell in range(16) if not (bitboard >> (4 * cell)) & 0xF]
+
+
+def countEmpty(bitboard: int) -> int:
+    """
+    Returns the number of empty cells of the bitboard.
+    """
+    # Fold every nibble into its lowest bit, set if the nibble is not empty
+    x = bitboard | (bitboard >> 1)
+    x = (x | (x >> 2)) & 0x1111111111111111
+    return 16 - bin(x).count('1')
+
+
+_rowValuesCache = {}
+
+
+def _rowValues(row: int) -> tuple:
+    """
+    Returns the tile values of a packed row, memoised since only 65536
+    different rows exist.
+    """
+    values = _rowValuesCache.get(row)
+    if values is None:
+        values = tuple(TILE_VALUES[(row >> (4 * j)) & 0xF] for j in range(4))
+        _rowValuesCache[row] = values
+    return values
+
+
+def toBoard(bitboard: int) -> list[list[int]]:
+    """
+    Unpacks a bitboard into a 4x4 list of tile values.
+    """
+    return [list(_rowValues(bitboard & ROW_MASK)),
+            list(_rowValues((bitboard >> 16) & ROW_MASK)),
+            list(_rowValues((bitboard >> 32) & ROW_MASK)),
+            list(_rowValues((bitboard >> 48) & ROW_MASK))]
+
+
+def fromBoard(board: list[list[int]]) -> int:
+    """
+    Packs a 4x4 list of tile values into a bitboard.
+    """
+    bitboard = 0
+    for i in range(4):
+        for j in range(4):
+            value = board[i][j]
+            if value:
+                bitboard |= (value.bit_length() - 1) << (4 * (4 * i + j))
+    return bitboard
+
+
+class BitboardGameState:
+    """
+    A drop-in replacement for `GameState` that stores the board as a bitboard.
+    It only plays the classic game: 4x4 boards won with a 2048 tile.
+    """
+    size = 4
+    winTile = 2048
+
+    def __init__(self, bitboard: int = 0):
+        self.bitboard = bitboard
+
+    @property
+    def board(self) -> list[list[int]]:
+        """
+        The board as a 4x4 list of tile values. It is rebuilt on every access,
+        so changes to the returned lists are not reflected in the state.
+        """
+        return toBoard(self.bitboard)
+
+    @board.setter
+    def board(self, board: list[list[int]]):
+        self.bitboard = fromBoard(board)
+
+    def isLose(self) -> bool:
+        """
+        Check if there are no legal moves left
+        """
+        bitboard = self.bitboard
+        changed = getRowTables().changed
+        moves = LEFT_CHANGED | RIGHT_CHANGED
+        return not (_anyRowChanged(bitboard, changed, moves)
+                    or _anyRowChanged(transpose(bitboard), changed, moves))
+
+    def isWin(self) -> bool:
+        """
+        Check if there is a tile with value 2048
+        """
+        # A nibble equal to WIN_EXPONENT becomes zero after the XOR, and the
+        # classic "has zero byte" trick detects it without unpacking the board.
+        x = self.bitboard ^ WIN_PATTERN
+        return ((x - 0x1111111111111111) & ~x & 0x8888888888888888) != 0
+
+    def getLegalActions(self, agentIndex: int = 0) -> list:
+        """
+        Returns a list of legal actions for the given agent.
+        Agent 0 is the player, Agent 1 is the random tile generator.
+        """
+        actions = []
+        bitboard = self.bitboard
+        if agentIndex == 0:
+            changed = getRowTables().changed
+            if _anyRowChanged(bitboard, changed, LEFT_CHANGED):
+                actions.append(LEFT)
+            if _anyRowChanged(bitboard, changed, RIGHT_CHANGED):
+                actions.append(RIGHT)
+            transposed = transpose(bitboard)
+            if _anyRowChanged(transposed, changed, LEFT_CHANGED):
+                actions.append(UP)
+            if _anyRowChanged(transposed, changed, RIGHT_CHANGED):
+                actions.append(DOWN)
+        elif agentIndex == 1:
+            for cell in range(16):
+                if (bitboard >> (4 * cell)) & 0xF == 0:
+                    actions.append((cell << 4) | 1)  # A 2
+                    actions.append((cell << 4) | 2)  # A 4
+        return actions
+
+    def generateSuccessor(self, agentIndex: int, action: int) -> 'BitboardGameState':
+        """
+        Returns the successor game state after the given agent takes the given action.
+        Actions written as strings are also accepted (see `encodeAction`).
+        """
+        if isinstance(action, str):
+            action = encodeAction(agentIndex, action)
+        if agentIndex == 0:
+            return BitboardGameState(move(self.bitboard, action))
+        # The low nibble of a tile action is the exponent and the rest is the cell
+        return BitboardGameState(self.bitboard | ((action & 0xF) << (4 * (action >> 4))))
+
+    def getBoardKey(self) -> int:
+        """
+        Returns the packed board, which is already a hashable key.
+        """
+        return self.bitboard
+
+    def getCanonicalKey(self) -> tuple[int, int]:
+        """
+        Returns the board key shared by all the rotations and reflections of
+        this board, and the transform that maps this board onto it (see
+        `canonicalKey`, `transformAction` and `untransformAction`).
+        """
+        return canonicalKey(self.bitboard)
+
+    def getNumAgents(self) -> int:
+        """
+        Returns the number of agents in the game. 2048 has two agents.
+        """
+        return 2  # Player and random tile generator
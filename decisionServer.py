@@ -0,0 +1,375 @@
+"""
+Long-running move decision service.
+
+Front ends send board states and get back the action chosen by an agent,
+without paying for process startup or a cold cache on every move. The
+server listens on a localhost TCP port or a Unix socket and speaks JSON
+lines: every request is one JSON object on one line, answered by one line.
+
+A move request gives the board, as a 4x4 list of tile values ("board") or
+packed as in `getBoardKey` ("key"), and optionally the agent and its budget:
+
+    {"id": 7, "board": [[2, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 2]],
+     "agent": "expectimax", "depth": 2, "timeLimit": null, "agentIndex": 0}
+
+and is answered with the action, its name and the time the server took:
+
+    {"id": 7, "action": 0, "move": "Left", "latencyMs": 12.5}
+
+Errors are answered with {"id": ..., "error": "..."}. The requests
+{"type": "health"} and {"type": "metrics"} return the state of the server
+and, per agent, its request count, batch sizes, latency percentiles and
+cache counters.
+
+Every combination of agent, depth, time limit, evaluation function and
+rollouts gets one agent, created on its first request and kept with its
+transposition cache for the life of the server. Each agent answers its
+requests in its own thread; requests that arrive while it is busy are
+answered together as one batch, where equal positions are searched once.
+Searches share the interpreter, so with several busy agents use `--workers`
+to give each of them a pool of processes.
+
+Example:
+    python decisionServer.py --port 2048
+    echo '{"board": [[2, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 2]]}' | nc localhost 2048
+"""
+
+import argparse
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from agentRegistry import AGENTS as SEARCH_AGENTS, loadEvaluationFunction
+from bitboardState import BitboardGameState, fromBoard
+from gameState import actionToString
+from instrumentation import percentile
+from multiAgent import MonteCarloAgent
+from transposition import TranspositionTable
+
+AGENTS = {**SEARCH_AGENTS, 'montecarlo': MonteCarloAgent}
+CACHED_AGENTS = ('alphabeta', 'expectimax')  # Agents that take a transposition cache
+
+LATENCY_WINDOW = 1000  # Latencies kept per agent for the percentiles
+
+
+def parseBoard(request: dict) -> int:
+    """
+    Returns the packed board of a move request.
+    """
+    if 'key' in request:
+        key = request['key']
+        if not isinstance(key, int) or not 0 <= key < 1 << 64:
+            raise ValueError("'key' must be a 64-bit packed board")
+        return key
+    board = request.get('board')
+    if (not isinstance(board, list) or len(board) != 4
+            or any(not isinstance(row, list) or len(row) != 4 for row in board)):
+        raise ValueError("'board' must be a 4x4 list of tile values")
+    for row in board:
+        for value in row:
+            if not isinstance(value, int) or value < 0 or value & (value - 1) or value == 1 or value > 1 << 15:
+                raise ValueError(f"Invalid tile value: {value}")
+    return fromBoard(board)
+
+
+class AgentWorker:
+    """
+    One warm agent and the thread that answers its requests.
+    """
+    def __init__(self, config: tuple, evalFn, cacheEntries: int, workers: int = None):
+        agentName, depth, timeLimit, evalName, rollouts = config
+        self.config = config
+        if agentName == 'montecarlo':
+            self.agent = MonteCarloAgent(evalFn=evalFn, rollouts=rollouts, timeLimit=timeLimit, workers=workers)
+        else:
+            kwargs = {'cache': TranspositionTable(cacheEntries)} if agentName in CACHED_AGENTS else {}
+            self.agent = AGENTS[agentName](evalFn=evalFn, depth=depth, timeLimit=timeLimit, workers=workers,
+                                           **kwargs)
+        self.requests = queue.Queue()
+        self.lock = threading.Lock()  # Guards the metrics
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.served = 0
+        self.batches = 0
+        self.searches = 0
+        self.errors = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, board: int, agentIndex: int) -> Future:
+        """
+        Queues a position and returns a future with its action.
+        """
+        future = Future()
+        self.requests.put((board, agentIndex, future, time.perf_counter()))
+        return future
+
+    def run(self):
+        """
+        Answers the queued requests, taking all the pending ones at once.
+        """
+        while True:
+            batch = [self.requests.get()]
+            while True:
+                try:
+                    batch.append(self.requests.get_nowait())
+                except queue.Empty:
+                    break
+            results = {}
+            for board, agentIndex, future, start in batch:
+                position = (board, agentIndex)
+                if position not in results:
+                    try:
+                        results[position] = (self.agent.getAction(BitboardGameState(board), agentIndex), None)
+                    except Exception as error:
+                        results[position] = (None, error)
+                action, error = results[position]
+                if error is None:
+                    future.set_result(action)
+                else:
+                    future.set_exception(error)
+                with self.lock:
+                    self.latencies.append(time.perf_counter() - start)
+                    self.served += 1
+                    self.errors += error is not None
+            with self.lock:
+                self.batches += 1
+                self.searches += len(results)
+
+    def metrics(self) -> dict:
+        """
+        Returns the counters and latency percentiles of this agent.
+        """
+        agentName, depth, timeLimit, evalName, rollouts = self.config
+        with self.lock:
+            latencies = sorted(1000 * latency for latency in self.latencies)
+            served, batches, searches, errors = self.served, self.batches, self.searches, self.errors
+        cache = getattr(self.agent, 'cache', None)
+        return {
+            'agent': agentName,
+            'depth': depth,
+            'timeLimit': timeLimit,
+            'evalFn': evalName,
+            'rollouts': rollouts,
+            'requests': served,
+            'batches': batches,
+            'meanBatchSize': served / batches if batches else 0.0,
+            'searches': searches,
+            'errors': errors,
+            'queued': self.requests.qsize(),
+            'latencyMs': {
+                'p50': percentile(latencies, 50),
+                'p90': percentile(latencies, 90),
+                'p99': percentile(latencies, 99),
+                'max': latencies[-1] if latencies else 0.0,
+            },
+            'cacheHits': cache.hits if cache is not None else 0,
+            'cacheMisses': cache.misses if cache is not None else 0,
+            'cacheEntries': len(cache) if cache is not None else 0,
+        }
+
+
+class DecisionService:
+    """
+    Turns requests into answers, creating the agents as they are needed.
+    Only the evaluation functions named in `evals` can be requested.
+    """
+    def __init__(self, evals: list = ('evaluationFunction2048',), cacheEntries: int = 1_000_000,
+                 workers: int = None):
+        self.evals = {name: loadEvaluationFunction(name) for name in evals}
+        self.cacheEntries = cacheEntries
+        self.workers = workers
+        self.agents = {}
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.requests = 0
+
+    def agentWorker(self, request: dict) -> AgentWorker:
+        """
+        Returns the worker of the agent described by a move request.
+        """
+        agentName = request.get('agent', 'expectimax')
+        if agentName not in AGENTS:
+            raise ValueError(f"Unknown agent: {agentName}")
+        evalName = request.get('evalFn', next(iter(self.evals)))
+        if evalName not in self.evals:
+            raise ValueError(f"Evaluation function not served: {evalName}")
+        timeLimit = request.get('timeLimit')
+        if timeLimit is not None:
+            timeLimit = float(timeLimit)
+            if timeLimit <= 0:
+                raise ValueError("'timeLimit' must be positive")
+        if agentName == 'montecarlo':
+            depth = None
+            rollouts = request.get('rollouts', 200)
+            if rollouts is not None and (not isinstance(rollouts, int) or rollouts < 1):
+                raise ValueError("'rollouts' must be a positive integer")
+        else:
+            depth = request.get('depth', 2)
+            rollouts = None
+            if not isinstance(depth, int) or depth < 1:
+                raise ValueError("'depth' must be a positive integer")
+        config = (agentName, depth, timeLimit, evalName, rollouts)
+        with self.lock:
+            worker = self.agents.get(config)
+            if worker is None:
+                worker = self.agents[config] = AgentWorker(config, self.evals[evalName], self.cacheEntries,
+                                                           self.workers)
+        return worker
+
+    def handle(self, request) -> dict:
+        """
+        Returns the answer to one request, waiting for its search.
+        """
+        if not isinstance(request, dict):
+            return {'error': "Requests must be JSON objects"}
+        requestId = request.get('id')
+        kind = request.get('type', 'move')
+        if kind == 'health':
+            return {'id': requestId, **self.health()}
+        if kind == 'metrics':
+            return {'id': requestId, **self.metrics()}
+        if kind != 'move':
+            return {'id': requestId, 'error': f"Unknown request type: {kind}"}
+        start = time.perf_counter()
+        with self.lock:
+            self.requests += 1
+        try:
+            agentIndex = request.get('agentIndex', 0)
+            if agentIndex not in (0, 1):
+                raise ValueError("'agentIndex' must be 0 (player) or 1 (tile generator)")
+            board = parseBoard(request)
+            action = self.agentWorker(request).submit(board, agentIndex).result()
+        except Exception as error:
+            return {'id': requestId, 'error': str(error)}
+        return {
+            'id': requestId,
+            'action': action,
+            'move': actionToString(agentIndex, action) if action is not None else None,
+            'latencyMs': 1000 * (time.perf_counter() - start),
+        }
+
+    def health(self) -> dict:
+        with self.lock:
+            agents = len(self.agents)
+        return {'status': 'ok', 'uptime': time.monotonic() - self.started, 'agents': agents}
+
+    def metrics(self) -> dict:
+        with self.lock:
+            workers = list(self.agents.values())
+            requests = self.requests
+        return {'uptime': time.monotonic() - self.started, 'requests': requests,
+                'agents': [worker.metrics() for worker in workers]}
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Answers the JSON lines of one connection in order.
+    """
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as error:
+                response = {'error': f"Invalid JSON: {error}"}
+            else:
+                response = self.server.service.handle(request)
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+            self.wfile.flush()
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, 'ThreadingUnixStreamServer'):
+    class _UnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+
+def createServer(service: DecisionService, port: int = None, socketPath: str = None,
+                 host: str = '127.0.0.1') -> socketserver.BaseServer:
+    """
+    Returns a server for the service, listening on `socketPath` if given
+    and on host:port otherwise. Call its serve_forever method to run it.
+    """
+    if socketPath is not None:
+        if os.path.exists(socketPath):
+            os.unlink(socketPath)
+        server = _UnixServer(socketPath, _RequestHandler)
+    else:
+        server = _TCPServer((host, port), _RequestHandler)
+    server.service = service
+    return server
+
+
+class DecisionClient:
+    """
+    A connection to a decision server, for front ends written in Python.
+    """
+    def __init__(self, port: int = None, socketPath: str = None, host: str = '127.0.0.1'):
+        if socketPath is not None:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(socketPath)
+        else:
+            self.socket = socket.create_connection((host, port))
+        self.file = self.socket.makefile('rwb')
+
+    def request(self, request: dict) -> dict:
+        """
+        Sends one request and returns its answer.
+        """
+        self.file.write(json.dumps(request).encode() + b'\n')
+        self.file.flush()
+        return json.loads(self.file.readline())
+
+    def getAction(self, board: list[list[int]], **options) -> int:
+        """
+        Returns the action chosen for the board, raising RuntimeError with
+        the server's message on errors. `options` are the other fields of a
+        move request, like agent, depth or timeLimit.
+        """
+        response = self.request({'board': board, **options})
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response['action']
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Serves 2048 moves over JSON lines.")
+    parser.add_argument('--port', type=int, default=2048, help="localhost TCP port (default: 2048)")
+    parser.add_argument('--socket', help="listen on this Unix socket instead of TCP")
+    parser.add_argument('--evals', nargs='+', default=['evaluationFunction2048'],
+                        help="evaluation functions clients may request, the first is the default")
+    parser.add_argument('--cache-entries', type=int, default=1_000_000,
+                        help="size of the transposition cache of each agent")
+    parser.add_argument('--workers', type=int, default=None, help="processes per agent for its searches")
+    args = parser.parse_args(argv)
+
+    service = DecisionService(args.evals, cacheEntries=args.cache_entries, workers=args.workers)
+    server = createServer(service, port=args.port, socketPath=args.socket)
+    print(f"Serving moves on {args.socket or f'127.0.0.1:{args.port}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket:
+            os.unlink(args.socket)
+
+
+if __name__ == '__main__':
+    main()
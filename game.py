@@ -1,13 +1,30 @@
 import time
 import random
-from gameState import GameState
-from multiAgent import MinimaxAgent, AlphaBetaAgent, ExpectimaxAgent, evaluationFunction2048
-from gameUI import start_ui
+from gameState import createGameState, checkDimensions, tileAction, SPAWN_PROBABILITIES
+from multiAgent import MinimaxAgent, AlphaBetaAgent, ExpectimaxAgent, MonteCarloAgent, evaluationFunction2048
+from instrumentation import summarizeMoves
+
+# The UI modules (and tkinter) are only imported when a windowed Game is
+# built, so GameNoUI works in processes without a display or without tkinter.
 
 class Game:
-    def __init__(self, agent, ui_root, ui_app, delay=0.5):
-        self.gameState = GameState()
+    def __init__(self, agent, ui_root=None, ui_app=None, delay=0.5, engine='list', recorder=None, size=4,
+                 win_tile=2048):
+        """
+        Without `ui_root` and `ui_app`, the game opens its own window with
+        `start_ui`. With a `recorder` (a `GameRecordWriter`), every move of
+        the game is written to its record file. The board has `size` rows
+        and columns and the game is won with a `win_tile` tile; use the
+        'packed' engine for sizes other than 4.
+        """
+        if recorder is not None and size != 4:
+            raise ValueError("Game records only hold 4x4 boards")
+        self.gameState = createGameState(engine, size, win_tile)
+        if ui_root is None:
+            from gameUI import start_ui
+            ui_root, ui_app = start_ui(size=size)
         self.agent = agent
+        self.recorder = recorder
         self.ui_root = ui_root
         self.ui_app = ui_app
         self.delay = delay
@@ -23,15 +40,15 @@ class Game:
         If Minimax or AlphaBeta agents are used, the next tile is generated using the
         result of the agent's algorithm.
         If Expectimax is used, next tile is generated randomly.
+        Returns the tile action, or None if no tile was placed.
         """
         if type(self.agent) == MinimaxAgent or type(self.agent) == AlphaBetaAgent:
             nextMove = self.agent.getAction(self.gameState, agentIndex=1)
         else:
-            self.add_random_tile()
-            return
-        i, j, value = nextMove.split(', ')
-        i, j, value = int(i), int(j), int(value)
-        self.gameState.board[i][j] = value
+            return self.add_random_tile()
+        if nextMove is not None:
+            self.gameState = self.gameState.generateSuccessor(1, nextMove)
+        return nextMove
 
     def add_random_tile(self):
         """
@@ -39,25 +56,31 @@ class Game:
 
         This function is called when Expectimax agent is used.
         """
+        board = self.gameState.board
+        size = self.gameState.size
         empty_cells = []
-        for i in range(4):
-            for j in range(4):
-                if self.gameState.board[i][j] == 0:
+        for i in range(size):
+            for j in range(size):
+                if board[i][j] == 0:
                     empty_cells.append((i, j))
         
         if empty_cells:
             i, j = random.choice(empty_cells)
             # 90% chance of 2, 10% chance of 4
-            value = 2 if random.random() < 0.9 else 4
-            self.gameState.board[i][j] = value
+            value = 2 if random.random() < SPAWN_PROBABILITIES[2] else 4
+            action = tileAction(i, j, value, size)
+            self.gameState = self.gameState.generateSuccessor(1, action)
+            return action
+        return None
 
     def update_ui(self):
         """
-        Updates the score and board in the UI.
+        Updates the score and board in the UI. The board is drawn by the event
+        loop at the UI's frame rate, so fast moves are shown coalesced.
         """
-        self.score = sum(sum(row) for row in self.gameState.board)
-        self.ui_app.update_board(self.gameState.board, self.score)
-        self.ui_root.update()
+        board = self.gameState.board
+        self.score = sum(sum(row) for row in board)
+        self.ui_app.show_board(board, self.score)
 
     def run(self):
         """
@@ -67,38 +90,109 @@ class Game:
         Then, it gets the player's turn and updates UI.
         After that, it checks again if the game is over.
         And lastly, it generates the tile generator's turn.
+
+        The agent searches in a background thread (see `BackgroundSearch`),
+        so the window stays responsive. Pressing Escape cancels the search in
+        progress and ends the game.
         """
-        while not self.gameState.isWin() and not self.gameState.isLose():
-            # Player's turn (Agent 0)
-            action = self.agent.getAction(self.gameState)
-            if not action: # No legal moves
-                break
-            
-            self.gameState = self.gameState.generateSuccessor(0, action)
-            self.update_ui()
-            time.sleep(self.delay)
+        from backgroundSearch import BackgroundSearch
+        self.search = BackgroundSearch(self.ui_root, self.agent)
+        self.ui_root.bind('<Escape>', lambda event: self.search.cancel())
+        if self.recorder is not None:
+            self.recorder.startGame()
+        self.ui_root.after(0, self.player_turn)
+        self.ui_root.mainloop() # Keep window open
 
-            if self.gameState.isWin() or self.gameState.isLose():
-                break
+    def player_turn(self):
+        """
+        Starts the search of the player's move (Agent 0), unless the game is over.
+        """
+        if self.gameState.isWin() or self.gameState.isLose():
+            self.finish()
+            return
+        self.board = self.gameState.getBoardKey()
+        self.search.start(self.gameState, 0, self.player_moved, onCancel=self.finish)
 
-            # Computer's turn (Agent 1) - Add a random tile
-            self.add_tile()
-            self.update_ui()
-            time.sleep(self.delay)
+    def player_moved(self, action):
+        """
+        Applies the player's move and schedules the tile generator's turn.
+        """
+        if action is None: # No legal moves
+            self.finish()
+            return
+        self.action = action
+        self.gameState = self.gameState.generateSuccessor(0, action)
+        self.update_ui()
+
+        if self.gameState.isWin() or self.gameState.isLose():
+            if self.recorder is not None:
+                self.recorder.recordMove(self.board, action)
+            self.finish()
+            return
+        self.ui_root.after(int(self.delay * 1000), self.computer_turn)
+
+    def computer_turn(self):
+        """
+        Computer's turn (Agent 1): searches the tile with the adversarial
+        agents and adds a random tile otherwise.
+        """
+        if type(self.agent) == MinimaxAgent or type(self.agent) == AlphaBetaAgent:
+            self.search.start(self.gameState, 1, self.place_tile, onCancel=self.finish)
+        else:
+            self.end_turn(self.add_random_tile())
+
+    def place_tile(self, action):
+        """
+        Places the tile chosen by the agent, if it found one.
+        """
+        if action is not None:
+            self.gameState = self.gameState.generateSuccessor(1, action)
+        self.end_turn(action)
+
+    def end_turn(self, spawn):
+        """
+        Records the move and its tile and schedules the next player's turn.
+        """
+        if self.recorder is not None:
+            self.recorder.recordMove(self.board, self.action, spawn)
+        self.update_ui()
+        self.ui_root.after(int(self.delay * 1000), self.player_turn)
+
+    def finish(self):
+        """
+        Ends the game and prints its result.
+        """
+        if self.recorder is not None:
+            self.recorder.endGame(self.gameState.getBoardKey())
 
         # Game over
         if self.gameState.isWin():
             print("You Win!")
         else:
             print("Game Over!")
-        self.ui_root.mainloop() # Keep window open
 
 
 class GameNoUI:
-    def __init__(self, agent):
-        self.gameState = GameState()
+    def __init__(self, agent, engine='list', rng=None, verbose=True, recorder=None, size=4, win_tile=2048):
+        """
+        `rng` is the random generator used for the spawned tiles, so a seeded
+        `random.Random` makes the game reproducible. With verbose=False the
+        game does not print its result. With a `recorder` (a
+        `GameRecordWriter`), every move of the game is written to its record
+        file, with the agent's search statistics if the file keeps them.
+        The board has `size` rows and columns and the game is won with a
+        `win_tile` tile; use the 'packed' engine for sizes other than 4.
+        """
+        if recorder is not None and size != 4:
+            raise ValueError("Game records only hold 4x4 boards")
+        self.gameState = createGameState(engine, size, win_tile)
         self.agent = agent
+        self.recorder = recorder
+        self.rng = rng if rng is not None else random
+        self.verbose = verbose
         self.score = 0
+        self.moveTimes = []  # Seconds taken by each of the player's moves
+        self.searchStats = None  # Summary of the agent's search, if it is instrumented
         self.add_random_tile()
         self.add_random_tile()
 
@@ -109,15 +203,15 @@ class GameNoUI:
         If Minimax or AlphaBeta agents are used, the next tile is generated using the
         result of the agent's algorithm.
         If Expectimax is used, next tile is generated randomly.
+        Returns the tile action, or None if no tile was placed.
         """
         if type(self.agent) == MinimaxAgent or type(self.agent) == AlphaBetaAgent:
             nextMove = self.agent.getAction(self.gameState, agentIndex=1)
         else:
-            self.add_random_tile()
-            return
-        i, j, value = nextMove.split(', ')
-        i, j, value = int(i), int(j), int(value)
-        self.gameState.board[i][j] = value
+            return self.add_random_tile()
+        if nextMove is not None:
+            self.gameState = self.gameState.generateSuccessor(1, nextMove)
+        return nextMove
 
     def add_random_tile(self):
         """
@@ -125,17 +219,22 @@ class GameNoUI:
 
         This function is called when Expectimax agent is used.
         """
+        board = self.gameState.board
+        size = self.gameState.size
         empty_cells = []
-        for i in range(4):
-            for j in range(4):
-                if self.gameState.board[i][j] == 0:
+        for i in range(size):
+            for j in range(size):
+                if board[i][j] == 0:
                     empty_cells.append((i, j))
         
         if empty_cells:
-            i, j = random.choice(empty_cells)
+            i, j = self.rng.choice(empty_cells)
             # 90% chance of 2, 10% chance of 4
-            value = 2 if random.random() < 0.9 else 4
-            self.gameState.board[i][j] = value
+            value = 2 if self.rng.random() < SPAWN_PROBABILITIES[2] else 4
+            action = tileAction(i, j, value, size)
+            self.gameState = self.gameState.generateSuccessor(1, action)
+            return action
+        return None
 
     def getMaxTile(self):
         """
@@ -143,7 +242,19 @@ class GameNoUI:
         """
         return max(max(row) for row in self.gameState.board)
 
-    def run(self):
+    def writeStats(self, path: str, records: list):
+        """
+        Appends the search records of the game's moves and its summary to a JSON lines file.
+        """
+        import json
+        with open(path, 'a') as f:
+            for number, record in enumerate(records):
+                f.write(json.dumps({'type': 'move', 'move': number, **record}) + '\n')
+            summary = {'type': 'game', 'score': self.score, 'maxTile': self.getMaxTile(),
+                       'win': self.gameState.isWin(), **self.searchStats}
+            f.write(json.dumps(summary) + '\n')
+
+    def run(self, statsPath: str = None):
         """
         Runs the game.
 
@@ -151,45 +262,91 @@ class GameNoUI:
         Then, it gets the player's turn.
         After that, it checks again if the game is over.
         And lastly, it generates the tile generator's turn.
+
+        If the agent was created with instrument=True, the summary of its
+        search over the game is kept in self.searchStats, and with `statsPath`
+        one JSON line per move and a final line for the game are appended to
+        that file. Both cover only the player's moves: the searches the agent
+        makes to place tiles (see `add_tile`) are left out, so move N is the
+        Nth player move, as in the game records.
         """
+        stats = self.agent.stats
+        if statsPath is not None and stats is None:
+            raise ValueError("Exporting search statistics needs an agent created with instrument=True")
+        firstMove = len(stats.moves) if stats is not None else 0
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.startGame()
         while not self.gameState.isWin() and not self.gameState.isLose():
             # Player's turn (Agent 0)
+            board = self.gameState.getBoardKey()
+            start = time.perf_counter()
             action = self.agent.getAction(self.gameState)
-            if not action: # No legal moves
+            self.moveTimes.append(time.perf_counter() - start)
+            if action is None: # No legal moves
                 break
+            # The agent's record of this move, skipping the ones of its tile placements
+            moveStats = stats.moves[-1] if recorder is not None and stats is not None else None
             
             self.gameState = self.gameState.generateSuccessor(0, action)
 
             if self.gameState.isWin() or self.gameState.isLose():
+                if recorder is not None:
+                    recorder.recordMove(board, action, None, moveStats)
                 break
 
             # Computer's turn (Agent 1) - Add a random tile
-            self.add_tile()
-
-        # Game over
-        if self.gameState.isWin():
-            print("You Win!")
-        else:
-            print("Game Over!")
+            spawn = self.add_tile()
+            if recorder is not None:
+                recorder.recordMove(board, action, spawn, moveStats)
+        if recorder is not None:
+            recorder.endGame(self.gameState.getBoardKey())
 
         score = sum(sum(row) for row in self.gameState.board)
-        print(f"Final Score: {score}")
-        print(f"Max Tile: {max(max(row) for row in self.gameState.board)}")
+        self.score = score
+        if stats is not None:
+            records = [record for record in stats.moves[firstMove:] if record['agentIndex'] == 0]
+            self.searchStats = summarizeMoves(records)
+            if statsPath is not None:
+                self.writeStats(statsPath, records)
+
+        # Game over
+        if self.verbose:
+            if self.gameState.isWin():
+                print("You Win!")
+            else:
+                print("Game Over!")
+            print(f"Final Score: {score}")
+            print(f"Max Tile: {self.getMaxTile()}")
         
         return score
 
 
 if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Lets an agent play 2048.")
+    parser.add_argument('--headless', action='store_true', help="play without a window (tkinter is not loaded)")
+    parser.add_argument('--size', type=int, default=4, help="rows and columns of the board (default: 4)")
+    parser.add_argument('--win-tile', type=int, default=2048, help="tile that wins the game (default: 2048)")
+    args = parser.parse_args()
+    try:
+        checkDimensions(args.size, args.win_tile)
+    except ValueError as e:
+        parser.error(str(e))
+    # The list engine is the reference one; larger boards need the packed engine to play at speed
+    engine = 'list' if args.size == 4 else 'packed'
+
     # --- Configuration ---
     AGENT_DEPTH = 2  # How many moves ahead the agent thinks
     GAME_SPEED_DELAY = 0.01  # Seconds between moves
 
     # --- Setup ---
-    # You can switch to MinimaxAgent or ExpectimaxAgent if you want
+    # You can switch to MinimaxAgent, ExpectimaxAgent or MonteCarloAgent if you want
     agent = ExpectimaxAgent(evalFn=evaluationFunction2048, depth=AGENT_DEPTH)
-    
-    ui_root, ui_app = start_ui()
 
     # --- Start Game ---
-    game = Game(agent, ui_root, ui_app, delay=GAME_SPEED_DELAY)
-    game.run()
+    if args.headless:
+        GameNoUI(agent, engine=engine, size=args.size, win_tile=args.win_tile).run()
+    else:
+        game = Game(agent, delay=GAME_SPEED_DELAY, engine=engine, size=args.size, win_tile=args.win_tile)
+        game.run()
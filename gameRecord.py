@@ -0,0 +1,280 @@
+"""
+Compact binary records of played games.
+
+A record file starts with a 16-byte header followed by fixed-width records,
+one per player move:
+
+    board   uint64  the board before the move, packed as in `getBoardKey`
+    game    uint32  number of the game in the file, starting at 0
+    ply     uint16  number of the move in its game, starting at 0
+    move    uint8   the player's action, or NO_MOVE for the last record of a game
+    spawn   uint8   the tile placed after the move (see `tileAction`), or NO_SPAWN
+
+Files written with search statistics add four fields to every record:
+
+    latency float32 seconds the agent took to choose the move
+    nodes   uint32  nodes expanded by the search
+    leaves  uint32  leaves evaluated by the search
+    depth   uint8   depth reached by the search (plus 3 bytes of padding)
+
+Each game ends with a record holding its final board and NO_MOVE. Records
+are 16 or 32 bytes, so a million games of a few hundred moves take a few
+gigabytes at most. `GameRecordReader` maps the file into memory and finds
+games by binary search on the game number, so it never loads the whole file.
+
+Example:
+    with GameRecordWriter('games.bin') as recorder:
+        GameNoUI(agent, recorder=recorder).run()
+    reader = GameRecordReader('games.bin')
+    for record in reader.game(0):
+        print(record.board, record.move)
+"""
+
+import mmap
+import os
+import struct
+from collections import namedtuple
+
+MAGIC = b'2048REC\x00'
+VERSION = 1
+HAS_STATS = 1
+
+HEADER = struct.Struct('<8sHH4x')
+RECORD = struct.Struct('<QIHBB')
+STATS_RECORD = struct.Struct('<QIHBBfIIB3x')
+
+NO_MOVE = 0xFF
+NO_SPAWN = 0
+
+MoveRecord = namedtuple('MoveRecord', ['board', 'game', 'ply', 'move', 'spawn', 'latency', 'nodes', 'leaves', 'depth'])
+
+
+def _readHeader(f) -> int:
+    """
+    Reads and checks the header of a record file, returning its flags.
+    """
+    data = f.read(HEADER.size)
+    if len(data) != HEADER.size:
+        raise ValueError("Not a game record file: header too short")
+    magic, version, flags = HEADER.unpack(data)
+    if magic != MAGIC:
+        raise ValueError("Not a game record file: wrong magic number")
+    if version != VERSION:
+        raise ValueError(f"Unsupported game record version: {version}")
+    return flags
+
+
+class GameRecordWriter:
+    """
+    Streams games to a record file. Opening an existing file appends to it,
+    numbering the new games after the ones already stored.
+
+    With withStats=True the records include the search statistics of the
+    agent, which must then be created with instrument=True.
+    """
+    def __init__(self, path: str, withStats: bool = False, bufferSize: int = 1 << 20):
+        self.path = path
+        self.withStats = withStats
+        self.record = STATS_RECORD if withStats else RECORD
+        self.nextGame = 0
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, 'rb') as f:
+                flags = _readHeader(f)
+                if bool(flags & HAS_STATS) != withStats:
+                    raise ValueError("The existing record file was written with a different withStats setting")
+                size = os.path.getsize(path) - HEADER.size
+                # Drop a partially written record left by an interrupted run
+                size -= size % self.record.size
+                if size:
+                    f.seek(HEADER.size + size - self.record.size)
+                    self.nextGame = self.record.unpack(f.read(self.record.size))[1] + 1
+            self.file = open(path, 'r+b', buffering=bufferSize)
+            self.file.truncate(HEADER.size + size)
+            self.file.seek(0, os.SEEK_END)
+        else:
+            self.file = open(path, 'wb', buffering=bufferSize)
+            self.file.write(HEADER.pack(MAGIC, VERSION, HAS_STATS if withStats else 0))
+        self.game = None
+        self.ply = 0
+
+    def __enter__(self) -> 'GameRecordWriter':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def startGame(self) -> int:
+        """
+        Starts a new game and returns its number.
+        """
+        if self.game is not None:
+            raise RuntimeError("The previous game was not finished with endGame")
+        self.game = self.nextGame
+        self.nextGame += 1
+        self.ply = 0
+        return self.game
+
+    def recordMove(self, board: int, move: int, spawn: int = None, stats: dict = None):
+        """
+        Records a player move from the packed `board`, with the tile placed
+        after it and, for files with statistics, the agent's move record
+        (see `SearchStats.finishMove`).
+        """
+        if self.game is None:
+            raise RuntimeError("recordMove called outside a game; call startGame first")
+        spawn = NO_SPAWN if spawn is None else spawn
+        if self.withStats:
+            if stats is None:
+                latency = nodes = leaves = depth = 0
+            else:
+                latency = stats['latency']
+                nodes = sum(stats['nodes'].values())
+                leaves = stats['leaves']
+                depth = stats['depth']
+            self.file.write(self.record.pack(board, self.game, self.ply, move, spawn,
+                                             latency, nodes, leaves, depth))
+        else:
+            self.file.write(self.record.pack(board, self.game, self.ply, move, spawn))
+        self.ply += 1
+
+    def endGame(self, board: int):
+        """
+        Records the final board of the current game.
+        """
+        self.recordMove(board, NO_MOVE)
+        self.game = None
+
+    def flush(self):
+        """
+        Writes the buffered records to the file.
+        """
+        self.file.flush()
+
+    def close(self):
+        """
+        Flushes and closes the file. An unfinished game keeps the moves
+        recorded so far, without its final record.
+        """
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class GameRecordReader:
+    """
+    Memory-mapped read access to a record file.
+
+    Records are indexed from 0 in file order; `reader[i]` returns one
+    `MoveRecord` and iterating the reader goes through all of them. `game(k)`
+    returns the records of one game.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            flags = _readHeader(f)
+            self.withStats = bool(flags & HAS_STATS)
+            self.record = STATS_RECORD if self.withStats else RECORD
+            size = os.path.getsize(path) - HEADER.size
+            self.numRecords = size // self.record.size
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.numRecords else None
+
+    def __enter__(self) -> 'GameRecordReader':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+
+    def __len__(self) -> int:
+        return self.numRecords
+
+    def _unpack(self, index: int) -> MoveRecord:
+        values = self.record.unpack_from(self.mmap, HEADER.size + index * self.record.size)
+        if self.withStats:
+            return MoveRecord(*values)
+        return MoveRecord(*values, None, None, None, None)
+
+    def __getitem__(self, index: int) -> MoveRecord:
+        if index < 0:
+            index += self.numRecords
+        if not 0 <= index < self.numRecords:
+            raise IndexError("record index out of range")
+        return self._unpack(index)
+
+    def __iter__(self):
+        return self.iterRecords()
+
+    def iterRecords(self, start: int = 0, stop: int = None):
+        """
+        Yields the records from index `start` up to `stop` (the end by default).
+        """
+        stop = self.numRecords if stop is None else min(stop, self.numRecords)
+        if start >= stop:
+            return
+        size = self.record.size
+        offset = HEADER.size + start * size
+        view = memoryview(self.mmap)[offset:HEADER.size + stop * size]
+        try:
+            if self.withStats:
+                for values in self.record.iter_unpack(view):
+                    yield MoveRecord(*values)
+            else:
+                for values in self.record.iter_unpack(view):
+                    yield MoveRecord(*values, None, None, None, None)
+        finally:
+            view.release()
+
+    def gameNumber(self, index: int) -> int:
+        """
+        Returns the number of the game the record at `index` belongs to.
+        """
+        return struct.unpack_from('<I', self.mmap, HEADER.size + index * self.record.size + 8)[0]
+
+    def numGames(self) -> int:
+        """
+        Returns the number of games in the file, counted from the last record.
+        """
+        return self.gameNumber(self.numRecords - 1) + 1 if self.numRecords else 0
+
+    def _firstRecord(self, game: int) -> int:
+        """
+        Returns the index of the first record of the given game or of the next one.
+        """
+        low, high = 0, self.numRecords
+        while low < high:
+            middle = (low + high) // 2
+            if self.gameNumber(middle) < game:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def gameRange(self, game: int) -> range:
+        """
+        Returns the range of record indices of the given game.
+        """
+        return range(self._firstRecord(game), self._firstRecord(game + 1))
+
+    def game(self, game: int) -> list:
+        """
+        Returns the records of the given game.
+        """
+        indices = self.gameRange(game)
+        return list(self.iterRecords(indices.start, indices.stop))
+
+    def toArray(self):
+        """
+        Returns all the records as a NumPy structured array that shares the
+        mapped memory of the file. Needs NumPy.
+        """
+        import numpy as np
+        fields = [('board', '<u8'), ('game', '<u4'), ('ply', '<u2'), ('move', 'u1'), ('spawn', 'u1')]
+        if self.withStats:
+            fields += [('latency', '<f4'), ('nodes', '<u4'), ('leaves', '<u4'), ('depth', 'u1'), ('pad', 'V3')]
+        if not self.numRecords:
+            return np.zeros(0, dtype=np.dtype(fields))
+        return np.frombuffer(self.mmap, dtype=np.dtype(fields), count=self.numRecords, offset=HEADER.size)
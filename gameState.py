@@ -1,35 +1,157 @@
+from rowTables import getRowTables, MAX_EXPONENT, TILE_VALUES, TILE_EXPONENTS, LEFT_CHANGED, RIGHT_CHANGED
+
+# Probability of each tile value when the game spawns a random tile
+SPAWN_PROBABILITIES = {2: 0.9, 4: 0.1}
+
+
+# Player actions
+LEFT, RIGHT, UP, DOWN = range(4)
+ACTION_NAMES = ('Left', 'Right', 'Up', 'Down')
+
+# Tile generator actions are packed into one int as (cell << 4) | exponent,
+# where cell = size * i + j (4 * i + j on the classic board) and the tile
+# value is 2 ** exponent. They are never 0.
+
+
+def tileAction(i: int, j: int, value: int, size: int = 4) -> int:
+    """
+    Returns the action that places a tile of the given value at (i, j) of a
+    board with `size` rows and columns.
+    """
+    return ((size * i + j) << 4) | (value.bit_length() - 1)
+
+
+def decodeTileAction(action: int, size: int = 4) -> tuple[int, int, int]:
+    """
+    Returns the (i, j, value) placed by a tile generator action.
+    """
+    i, j = divmod(action >> 4, size)
+    return i, j, 1 << (action & 0xF)
+
+
+def getTileValue(action: int) -> int:
+    """
+    Returns the value of the tile placed by a tile generator action.
+    """
+    return 1 << (action & 0xF)
+
+
+def encodeAction(agentIndex: int, action, size: int = 4) -> int:
+    """
+    Converts an action written as a string, like 'Left' for the player or
+    "i, j, value" for the tile generator, into its int encoding. Actions that
+    are already ints are returned unchanged.
+    """
+    if not isinstance(action, str):
+        return action
+    if agentIndex == 0:
+        return ACTION_NAMES.index(action)
+    i, j, value = action.split(', ')
+    return tileAction(int(i), int(j), int(value), size)
+
+
+def actionToString(agentIndex: int, action: int, size: int = 4) -> str:
+    """
+    Returns the string form of an action, the inverse of `encodeAction`.
+    """
+    if agentIndex == 0:
+        return ACTION_NAMES[action]
+    i, j, value = decodeTileAction(action, size)
+    return f"{i}, {j}, {value}"
+
+
+def _rowKey(row) -> int:
+    """
+    Packs the four tile values of a row or column into a row table index.
+    """
+    return (TILE_EXPONENTS[row[0]] | (TILE_EXPONENTS[row[1]] << 4)
+            | (TILE_EXPONENTS[row[2]] << 8) | (TILE_EXPONENTS[row[3]] << 12))
+
+
+def _rowFromKey(key: int) -> list[int]:
+    """
+    Unpacks a row table entry into a list of four tile values.
+    """
+    return [TILE_VALUES[key & 0xF], TILE_VALUES[(key >> 4) & 0xF],
+            TILE_VALUES[(key >> 8) & 0xF], TILE_VALUES[key >> 12]]
+
+
+def _packRow(row) -> int:
+    """
+    Packs a row or column of any length into a row table index.
+    """
+    key = 0
+    for j, value in enumerate(row):
+        key |= TILE_EXPONENTS[value] << (4 * j)
+    return key
+
+
+def _unpackRow(key: int, size: int) -> list[int]:
+    """
+    Unpacks a row table entry of `size` cells into a list of tile values.
+    """
+    return [TILE_VALUES[(key >> (4 * j)) & 0xF] for j in range(size)]
+
+
+_checkedDimensions = {(4, 2048)}  # (size, winTile) pairs already validated
+
+
+def checkDimensions(size: int, winTile: int):
+    """
+    Raises ValueError unless a board of `size` rows and columns can be won
+    with `winTile`: boards need at least 2 rows, and the win tile must be a
+    power of two from 4 to 32768, the largest tile the engines can hold.
+    """
+    if (size, winTile) in _checkedDimensions:
+        return
+    if size < 2:
+        raise ValueError(f"Boards need at least 2 rows and columns, not {size}")
+    winExponent = winTile.bit_length() - 1
+    if winTile != 1 << winExponent or not 2 <= winExponent <= MAX_EXPONENT:
+        raise ValueError(f"The win tile must be a power of two from 4 to {TILE_VALUES[MAX_EXPONENT]}")
+    _checkedDimensions.add((size, winTile))
+
+
 class GameState:    
     """
     A class to represent the state of a 2048 game.
+
+    The board has `size` rows and columns, and the game is won when a tile
+    reaches `winTile` (see `checkDimensions` for the valid values).
     """
-    def __init__(self):
-        self.board = [[0 for _ in range(4)] for _ in range(4)]
+    def __init__(self, size: int = 4, winTile: int = 2048):
+        checkDimensions(size, winTile)
+        self.size = size
+        self.winTile = winTile
+        self.board = [[0 for _ in range(size)] for _ in range(size)]
 
     def isLose(self) -> bool:
         """
         Check if there are no legal moves left
         """
+        size = self.size
         for row in self.board:
             for cell in row:
                 if cell == 0:
                     return False
-        for i in range(4):
-            for j in range(3):
+        for i in range(size):
+            for j in range(size - 1):
                 if self.board[i][j] == self.board[i][j + 1]:
                     return False
-        for j in range(4):
-            for i in range(3):
+        for j in range(size):
+            for i in range(size - 1):
                 if self.board[i][j] == self.board[i + 1][j]:
                     return False
         return True
     
     def isWin(self) -> bool:
         """
-        Check if there is a tile with value 2048
+        Check if there is a tile with value `winTile` (2048 by default)
         """
+        winTile = self.winTile
         for row in self.board:
             for cell in row:
-                if cell == 2048:
+                if cell == winTile:
                     return True
         return False
     
@@ -37,130 +159,148 @@ class GameState:
         """
         Returns a list of legal actions for the given agent.
         Agent 0 is the player, Agent 1 is the random tile generator.
+        Player actions are LEFT, RIGHT, UP and DOWN, and tile generator
+        actions are packed ints (see `tileAction`).
         """
         actions = []
+        size = self.size
         if agentIndex == 0:
-            # Check possible moves for the player
-            # Check left
-            for i in range(4):
-                for j in range(1, 4):
-                    if self.board[i][j] != 0:
-                        if self.board[i][j - 1] == 0 or self.board[i][j - 1] == self.board[i][j]:
-                            actions.append('Left')
-                            break
-            # Check right
-            for i in range(4):
-                for j in range(2, -1, -1):
-                    if self.board[i][j] != 0:
-                        if self.board[i][j + 1] == 0 or self.board[i][j + 1] == self.board[i][j]:
-                            actions.append('Right')
-                            break
-            # Check up
-            for j in range(4):
-                for i in range(1, 4):
-                    if self.board[i][j] != 0:
-                        if self.board[i - 1][j] == 0 or self.board[i - 1][j] == self.board[i][j]:
-                            actions.append('Up')
-                            break
-            # Check down
-            for j in range(4):
-                for i in range(2, -1, -1):
-                    if self.board[i][j] != 0:
-                        if self.board[i + 1][j] == 0 or self.board[i + 1][j] == self.board[i][j]:
-                            actions.append('Down')
-                            break
+            # Check possible moves for the player using the row tables.
+            # Columns are checked as the rows of the transposed board.
+            changed = getRowTables(size).changed
+            pack = _rowKey if size == 4 else _packRow
+            rowFlags = 0
+            for row in self.board:
+                rowFlags |= changed[pack(row)]
+            columnFlags = 0
+            for column in zip(*self.board):
+                columnFlags |= changed[pack(column)]
+            if rowFlags & LEFT_CHANGED:
+                actions.append(LEFT)
+            if rowFlags & RIGHT_CHANGED:
+                actions.append(RIGHT)
+            if columnFlags & LEFT_CHANGED:
+                actions.append(UP)
+            if columnFlags & RIGHT_CHANGED:
+                actions.append(DOWN)
         elif agentIndex == 1:
             # Possible placements for new tiles (2 or 4) in empty cells
             actions = []
-            for i in range(4):
-                for j in range(4):
+            for i in range(size):
+                for j in range(size):
                     if self.board[i][j] == 0:
-                        actions.append(f"{i}, {j}, 2")
-                        actions.append(f"{i}, {j}, 4")
+                        cell = (size * i + j) << 4
+                        actions.append(cell | 1)  # A 2
+                        actions.append(cell | 2)  # A 4
         return actions
 
-    def generateSuccessor(self, agentIndex: int, action: str) -> 'GameState':
+    def generateSuccessor(self, agentIndex: int, action: int) -> 'GameState':
         """
         Returns the successor game state after the given agent takes the given action.
+        Actions written as strings are also accepted (see `encodeAction`).
         """
-        newState = GameState()
+        size = self.size
+        if isinstance(action, str):
+            action = encodeAction(agentIndex, action, size)
+        newState = GameState(size, self.winTile)
+        if size != 4:
+            return self.generateSizedSuccessor(newState, agentIndex, action)
         if agentIndex == 0:
+            tables = getRowTables()
+            if action == LEFT:
+                newState.board = [_rowFromKey(tables.left[_rowKey(row)]) for row in self.board]
+            elif action == RIGHT:
+                newState.board = [_rowFromKey(tables.right[_rowKey(row)]) for row in self.board]
+            elif action == UP:
+                columns = [_rowFromKey(tables.left[_rowKey(column)]) for column in zip(*self.board)]
+                newState.board = [list(row) for row in zip(*columns)]
+            elif action == DOWN:
+                columns = [_rowFromKey(tables.right[_rowKey(column)]) for column in zip(*self.board)]
+                newState.board = [list(row) for row in zip(*columns)]
+            else:
+                newState.board = [row[:] for row in self.board]
+        elif agentIndex == 1:
             newState.board = [row[:] for row in self.board]
-            if action == 'Left':
-                for i in range(4):
-                    filtered = [num for num in newState.board[i] if num != 0]
-                    merged = []
-                    skip = False
-                    for j in range(len(filtered)):
-                        if skip:
-                            skip = False
-                            continue
-                        if j + 1 < len(filtered) and filtered[j] == filtered[j + 1]:
-                            merged.append(filtered[j] * 2)
-                            skip = True
-                        else:
-                            merged.append(filtered[j])
-                    merged += [0] * (4 - len(merged))
-                    newState.board[i] = merged
-            elif action == 'Right':
-                for i in range(4):
-                    filtered = [num for num in newState.board[i] if num != 0]
-                    merged = []
-                    skip = False
-                    for j in range(len(filtered) - 1, -1, -1):
-                        if skip:
-                            skip = False
-                            continue
-                        if j - 1 >= 0 and filtered[j] == filtered[j - 1]:
-                            merged.insert(0, filtered[j] * 2)
-                            skip = True
-                        else:
-                            merged.insert(0, filtered[j])
-                    merged = [0] * (4 - len(merged)) + merged
-                    newState.board[i] = merged
-            elif action == 'Up':
-                for j in range(4):
-                    filtered = [newState.board[i][j] for i in range(4) if newState.board[i][j] != 0]
-                    merged = []
-                    skip = False
-                    for i in range(len(filtered)):
-                        if skip:
-                            skip = False
-                            continue
-                        if i + 1 < len(filtered) and filtered[i] == filtered[i + 1]:
-                            merged.append(filtered[i] * 2)
-                            skip = True
-                        else:
-                            merged.append(filtered[i])
-                    merged += [0] * (4 - len(merged))
-                    for i in range(4):
-                        newState.board[i][j] = merged[i]
-            elif action == 'Down':
-                for j in range(4):
-                    filtered = [newState.board[i][j] for i in range(4) if newState.board[i][j] != 0]
-                    merged = []
-                    skip = False
-                    for i in range(len(filtered) - 1, -1, -1):
-                        if skip:
-                            skip = False
-                            continue
-                        if i - 1 >= 0 and filtered[i] == filtered[i - 1]:
-                            merged.insert(0, filtered[i] * 2)
-                            skip = True
-                        else:
-                            merged.insert(0, filtered[i])
-                    merged = [0] * (4 - len(merged)) + merged
-                    for i in range(4):
-                        newState.board[i][j] = merged[i]
+            i, j = divmod(action >> 4, 4)
+            newState.board[i][j] = TILE_VALUES[action & 0xF]
+        return newState
+
+    def generateSizedSuccessor(self, newState: 'GameState', agentIndex: int, action: int) -> 'GameState':
+        """
+        `generateSuccessor` for boards that are not 4x4, with rows of any length.
+        """
+        size = self.size
+        if agentIndex == 0:
+            tables = getRowTables(size)
+            if action in (LEFT, UP):
+                table = tables.left
+            elif action in (RIGHT, DOWN):
+                table = tables.right
+            else:
+                newState.board = [row[:] for row in self.board]
+                return newState
+            if action in (LEFT, RIGHT):
+                newState.board = [_unpackRow(table[_packRow(row)], size) for row in self.board]
+            else:
+                columns = [_unpackRow(table[_packRow(column)], size) for column in zip(*self.board)]
+                newState.board = [list(row) for row in zip(*columns)]
         elif agentIndex == 1:
             newState.board = [row[:] for row in self.board]
-            i, j, value = action.split(', ')
-            i, j, value = int(i), int(j), int(value)
-            newState.board[i][j] = value
+            i, j = divmod(action >> 4, size)
+            newState.board[i][j] = TILE_VALUES[action & 0xF]
         return newState
 
+    def getBoardKey(self) -> int:
+        """
+        Returns the board packed as 4-bit tile exponents, the same layout used
+        by `BitboardGameState` (and by `PackedGameState` on other sizes).
+        Equal boards always get the same key.
+        """
+        board = self.board
+        if self.size != 4:
+            key = 0
+            for i, row in enumerate(board):
+                key |= _packRow(row) << (4 * self.size * i)
+            return key
+        return (_rowKey(board[0]) | (_rowKey(board[1]) << 16)
+                | (_rowKey(board[2]) << 32) | (_rowKey(board[3]) << 48))
+
+    def getCanonicalKey(self) -> tuple[int, int]:
+        """
+        Returns the board key shared by all the rotations and reflections of
+        this board, and the transform that maps this board onto it. Actions
+        are mapped between both boards with `transformAction` and
+        `untransformAction` of bitboardState.
+        """
+        if self.size != 4:
+            from packedState import getLayout
+            return getLayout(self.size, self.winTile).canonicalKey(self.getBoardKey())
+        from bitboardState import canonicalKey
+        return canonicalKey(self.getBoardKey())
+
     def getNumAgents(self) -> int:
         """
         Returns the number of agents in the game. 2048 has two agents.
         """
         return 2  # Player and random tile generator
+
+
+def createGameState(engine: str = 'list', size: int = 4, winTile: int = 2048):
+    """
+    Returns an empty game state backed by the given board engine, with
+    `size` rows and columns and won with a `winTile` tile. 'list' uses
+    `GameState`, 'bitboard' uses `BitboardGameState` (4x4 to 2048 only) and
+    'packed' uses `PackedGameState`, the fast engine for the other sizes.
+    """
+    checkDimensions(size, winTile)
+    if engine == 'list':
+        return GameState(size, winTile)
+    if engine == 'bitboard':
+        if size != 4 or winTile != 2048:
+            raise ValueError("The bitboard engine only plays 4x4 boards to 2048; use the packed engine")
+        from bitboardState import BitboardGameState
+        return BitboardGameState()
+    if engine == 'packed':
+        from packedState import PackedGameState
+        return PackedGameState(size, winTile)
+    raise ValueError(f"Unknown board engine: {engine}")
@@ -1,35 +1,56 @@
+import time
 import tkinter as tk
 from tkinter import Frame, Label
 
+CELL_COLORS = {
+    0: "#9e948a", 2: "#eee4da", 4: "#ede0c8", 8: "#f2b179",
+    16: "#f59563", 32: "#f67c5f", 64: "#f65e3b", 128: "#edcf72",
+    256: "#edcc61", 512: "#edc850", 1024: "#edc53f", 2048: "#edc22e"
+}
+TEXT_COLORS = {
+    0: "#9e948a", 2: "#776e65", 4: "#776e65", 8: "#f9f6f2",
+    16: "#f9f6f2", 32: "#f9f6f2", 64: "#f9f6f2", 128: "#f9f6f2",
+    256: "#f9f6f2", 512: "#f9f6f2", 1024: "#f9f6f2", 2048: "#f9f6f2"
+}
+
 class GameUI(Frame):
-    def __init__(self, master):
+    def __init__(self, master, max_fps=60, size=4):
         super().__init__(master)
         self.master = master
         self.master.title('2048')
         self.grid()
+        self.size = size  # Rows and columns of the board
         self.cells = []
+        self.shown = [[None] * size for _ in range(size)]  # Values currently drawn in each cell
+        self.shown_score = None
+        self.frame_interval = 1 / max_fps
+        self.last_frame = 0.0
+        self.pending = None  # Latest (board, score) waiting for the next frame
         self.create_widgets()
 
     def create_widgets(self):
         """
         The `create_widgets` function initializes the UI, creating a grid layout with cells and a score
-        label in a Python GUI application.
+        label in a Python GUI application. Boards larger than 4x4 get smaller cells, so the
+        window keeps its size.
         """
         self.main_grid = Frame(
             self, bg='#92877d', bd=3, width=400, height=400
         )
         self.main_grid.grid(pady=(80, 0))
 
-        for i in range(4):
+        cell_size = 400 // max(self.size, 4)
+        font_size = 32 * 4 // max(self.size, 4)
+        for i in range(self.size):
             row = []
-            for j in range(4):
+            for j in range(self.size):
                 cell = Frame(
-                    self.main_grid, bg='#9e948a', width=100, height=100
+                    self.main_grid, bg='#9e948a', width=cell_size, height=cell_size
                 )
                 cell.grid(row=i, column=j, padx=5, pady=5)
                 t = Label(
                     master=cell, text='', bg='#9e948a',
-                    justify='center', font=('Helvetica', 32, 'bold'),
+                    justify='center', font=('Helvetica', font_size, 'bold'),
                     width=4, height=2
                 )
                 t.grid()
@@ -52,31 +73,47 @@ class GameUI(Frame):
         :param score: The `score` parameter in the `update_board` function represents the current score
         in the game. This score is used to update the score label displayed on the game board interface.
         """
-        cell_colors = {
-            0: "#9e948a", 2: "#eee4da", 4: "#ede0c8", 8: "#f2b179",
-            16: "#f59563", 32: "#f67c5f", 64: "#f65e3b", 128: "#edcf72",
-            256: "#edcc61", 512: "#edc850", 1024: "#edc53f", 2048: "#edc22e"
-        }
-        text_colors = {
-            0: "#9e948a", 2: "#776e65", 4: "#776e65", 8: "#f9f6f2",
-            16: "#f9f6f2", 32: "#f9f6f2", 64: "#f9f6f2", 128: "#f9f6f2",
-            256: "#f9f6f2", 512: "#f9f6f2", 1024: "#f9f6f2", 2048: "#f9f6f2"
-        }
-
-        for i in range(4):
-            for j in range(4):
-                value = board[i][j]
+        for i in range(self.size):
+            shown = self.shown[i]
+            for j, value in enumerate(board[i]):
+                # Only the cells whose value changed are reconfigured
+                if value == shown[j]:
+                    continue
+                shown[j] = value
                 text = str(value) if value != 0 else ""
-                bg_color = cell_colors.get(value, "#3c3a32")
-                fg_color = text_colors.get(value, "#f9f6f2")
-                
+                bg_color = CELL_COLORS.get(value, "#3c3a32")
+                fg_color = TEXT_COLORS.get(value, "#f9f6f2")
+
                 self.cells[i][j].config(text=text, bg=bg_color, fg=fg_color)
                 self.cells[i][j].master.config(bg=bg_color)
-        
-        self.score_label.config(text=f"Score: {score}")
+
+        if score != self.shown_score:
+            self.shown_score = score
+            self.score_label.config(text=f"Score: {score}")
         self.master.update_idletasks()
 
-def start_ui():
+    def show_board(self, board: list[list[int]], score: int):
+        """
+        Draws the board on the Tk event loop, at most `max_fps` times per
+        second. Boards that arrive faster than that replace the one waiting
+        to be drawn, so only the latest of them is shown.
+        """
+        waiting = self.pending is not None
+        self.pending = (board, score)
+        if not waiting:
+            delay = max(0.0, self.last_frame + self.frame_interval - time.monotonic())
+            self.after(int(delay * 1000), self.draw_pending)
+
+    def draw_pending(self):
+        """
+        Draws the board waiting for the next frame.
+        """
+        board, score = self.pending
+        self.pending = None
+        self.last_frame = time.monotonic()
+        self.update_board(board, score)
+
+def start_ui(max_fps=60, size=4):
     root = tk.Tk()
-    app = GameUI(master=root)
+    app = GameUI(master=root, max_fps=max_fps, size=size)
     return root, app
@@ -0,0 +1,126 @@
+"""
+Heuristic evaluation of 2048 boards from precomputed per-row tables.
+
+Every term of the heuristic (empty cells, merge potential, monotonicity,
+tile sum, smoothness and corner weighting) depends on a single row or
+column, so its weighted total is computed once for each of the 65536
+possible rows. Evaluating a board then takes eight table lookups: its four
+rows and its four columns.
+
+All the terms treat a row and its reverse alike, so the value of a board
+does not change when it is rotated or reflected.
+"""
+
+from array import array
+
+from bitboardState import transpose
+from rowTables import NUM_ROWS
+
+# Tables already built, by weights, shared by the evaluators with the same weights
+_tableCache = {}
+
+
+def rowHeuristic(exponents: list, emptyWeight: float, mergeWeight: float, monotonicityWeight: float,
+                 monotonicityPower: float, sumWeight: float, sumPower: float, smoothnessWeight: float,
+                 cornerWeight: float) -> float:
+    """
+    Returns the heuristic value of one row, given the exponents of its four cells.
+    """
+    empty = exponents.count(0)
+
+    # Each run of equal tiles (ignoring empty cells) can be merged
+    merges = 0
+    previous = 0
+    counter = 0
+    for exponent in exponents:
+        if exponent == 0:
+            continue
+        if exponent == previous:
+            counter += 1
+        elif counter > 0:
+            merges += 1 + counter
+            counter = 0
+        previous = exponent
+    if counter > 0:
+        merges += 1 + counter
+
+    # Penalty for breaking the order of the row, in its best direction
+    decreasing = 0.0
+    increasing = 0.0
+    for i in range(1, 4):
+        left = exponents[i - 1] ** monotonicityPower
+        right = exponents[i] ** monotonicityPower
+        if exponents[i - 1] > exponents[i]:
+            decreasing += left - right
+        else:
+            increasing += right - left
+    monotonicity = min(decreasing, increasing)
+
+    tileSum = sum(exponent ** sumPower for exponent in exponents)
+
+    smoothness = sum(abs(exponents[i] - exponents[i - 1])
+                     for i in range(1, 4) if exponents[i] and exponents[i - 1])
+
+    # Reward the largest tile of the row sitting at one of its ends
+    largest = max(exponents)
+    corner = largest if largest and (exponents[0] == largest or exponents[3] == largest) else 0
+
+    return (emptyWeight * empty + mergeWeight * merges - monotonicityWeight * monotonicity
+            - sumWeight * tileSum - smoothnessWeight * smoothness + cornerWeight * corner)
+
+
+def buildHeuristicTable(weights: tuple) -> array:
+    """
+    Computes the heuristic of all 65536 rows for the given weights.
+    """
+    table = array('d', bytes(8 * NUM_ROWS))
+    for row in range(NUM_ROWS):
+        exponents = [(row >> (4 * j)) & 0xF for j in range(4)]
+        table[row] = rowHeuristic(exponents, *weights)
+    return table
+
+
+class HeuristicEvaluator:
+    """
+    Evaluation function for 2048 game states built from per-row tables.
+
+    Instances are called like any other evaluation function. The table is
+    built the first time the evaluator is used and shared with every other
+    evaluator with the same weights. Only 4x4 boards are supported
+    (`boardSize`); other sizes raise ValueError.
+    """
+    boardSize = 4
+
+    def __init__(self, emptyWeight: float = 270.0, mergeWeight: float = 700.0,
+                 monotonicityWeight: float = 47.0, monotonicityPower: float = 4.0,
+                 sumWeight: float = 11.0, sumPower: float = 3.5,
+                 smoothnessWeight: float = 0.0, cornerWeight: float = 0.0):
+        self.weights = (emptyWeight, mergeWeight, monotonicityWeight, monotonicityPower,
+                        sumWeight, sumPower, smoothnessWeight, cornerWeight)
+        self.table = None
+
+    def getTable(self) -> array:
+        """
+        Returns the heuristic table for the weights of this evaluator.
+        """
+        if self.table is None:
+            table = _tableCache.get(self.weights)
+            if table is None:
+                table = _tableCache[self.weights] = buildHeuristicTable(self.weights)
+            self.table = table
+        return self.table
+
+    def __call__(self, currentGameState) -> float:
+        if currentGameState.size != self.boardSize:
+            raise ValueError("HeuristicEvaluator only evaluates 4x4 boards")
+        table = self.table if self.table is not None else self.getTable()
+        board = currentGameState.getBoardKey()
+        columns = transpose(board)
+        return (table[board & 0xFFFF] + table[(board >> 16) & 0xFFFF]
+                + table[(board >> 32) & 0xFFFF] + table[board >> 48]
+                + table[columns & 0xFFFF] + table[(columns >> 16) & 0xFFFF]
+                + table[(columns >> 32) & 0xFFFF] + table[columns >> 48])
+
+
+# Evaluator with the default weights, usable wherever an evaluation function is expected
+heuristicEvaluation = HeuristicEvaluator()
@@ -0,0 +1,188 @@
+"""
+Opt-in instrumentation of the search agents.
+
+An agent created with instrument=True keeps a `SearchStats` object in
+`agent.stats` that counts the nodes it expands (by node type), the leaves it
+evaluates, the cutoffs it makes and the hits of its transposition cache,
+and stores one record per move with those counters, the time taken by each
+completed depth, the effective branching factor and the latency of the move.
+`summarizeMoves` aggregates a list of move records, for example those of one
+game, and `GameNoUI.run` can write both as JSON lines.
+
+Agents without instrumentation only pay for a `stats is not None` check per node.
+"""
+
+import time
+
+from transposition import MAX_NODE, MIN_NODE, CHANCE_NODE
+
+NODE_TYPE_NAMES = {MAX_NODE: 'max', MIN_NODE: 'min', CHANCE_NODE: 'chance'}
+
+
+class CountingEvaluation:
+    """
+    Wraps an evaluation function, counting in `stats.leaves` every state it
+    evaluates, one by one or in batches.
+    """
+    def __init__(self, evalFn, stats: 'SearchStats'):
+        self.evalFn = evalFn
+        self.stats = stats
+
+    def __call__(self, gameState):
+        self.stats.leaves += 1
+        return self.evalFn(gameState)
+
+    @property
+    def evaluateBatch(self):
+        # Only offered when the wrapped function accepts batches
+        if getattr(self.evalFn, 'evaluateBatch', None) is None:
+            return None
+        return self._evaluateBatch
+
+    def _evaluateBatch(self, states: list) -> list:
+        self.stats.leaves += len(states)
+        return self.evalFn.evaluateBatch(states)
+
+
+class SearchStats:
+    """
+    Counters of the work done by a search agent and the records of its moves.
+
+    The counters (`nodes`, `leaves` and `cutoffs`) are reset at the start of
+    every move. With workers, the counters of the worker processes are added
+    to those of the agent, while cache hits only count the parent's cache.
+    """
+    def __init__(self):
+        self.nodes = [0, 0, 0]  # Indexed by node type
+        self.leaves = 0
+        self.cutoffs = 0
+        self.moves = []
+        self.moveStart = None
+        self.depthTimes = []
+        self.cacheStart = (0, 0)
+
+    def resetCounters(self):
+        """
+        Zeroes the node, leaf and cutoff counters.
+        """
+        self.nodes = [0, 0, 0]
+        self.leaves = 0
+        self.cutoffs = 0
+
+    def counters(self) -> tuple:
+        """
+        Returns the current counters, in the format `addCounters` takes.
+        """
+        return list(self.nodes), self.leaves, self.cutoffs
+
+    def addCounters(self, counters: tuple):
+        """
+        Adds the counters of another search, like one run in a worker.
+        """
+        nodes, leaves, cutoffs = counters
+        for nodeType, count in enumerate(nodes):
+            self.nodes[nodeType] += count
+        self.leaves += leaves
+        self.cutoffs += cutoffs
+
+    def totalWork(self) -> int:
+        """
+        Returns the nodes expanded plus the leaves evaluated so far in the move.
+        """
+        return sum(self.nodes) + self.leaves
+
+    def startMove(self, cache=None):
+        """
+        Starts measuring a move.
+        """
+        self.resetCounters()
+        self.depthTimes = []
+        self.cacheStart = (cache.hits, cache.misses) if cache is not None else (0, 0)
+        self.moveStart = time.perf_counter()
+
+    def depthFinished(self, depth: int):
+        """
+        Records that the search of the current move completed the given depth.
+        """
+        elapsed = time.perf_counter() - self.moveStart
+        previous = self.depthTimes[-1] if self.depthTimes else {'elapsed': 0.0, 'work': 0}
+        work = self.totalWork()
+        self.depthTimes.append({'depth': depth, 'time': elapsed - previous['elapsed'],
+                                'elapsed': elapsed, 'work': work - previous['work']})
+
+    def finishMove(self, agentIndex: int, depthReached: int, cache=None) -> dict:
+        """
+        Closes the record of the current move, stores it in `moves` and returns it.
+        """
+        latency = time.perf_counter() - self.moveStart
+        hits, misses = (cache.hits, cache.misses) if cache is not None else self.cacheStart
+        record = {
+            'agentIndex': agentIndex,
+            'depth': depthReached,
+            'latency': latency,
+            'nodes': {NODE_TYPE_NAMES[nodeType]: count for nodeType, count in enumerate(self.nodes)},
+            'leaves': self.leaves,
+            'cutoffs': self.cutoffs,
+            'cacheHits': hits - self.cacheStart[0],
+            'cacheMisses': misses - self.cacheStart[1],
+            'branchingFactor': branchingFactor(self.depthTimes),
+            'depthTimes': [{'depth': entry['depth'], 'time': entry['time']} for entry in self.depthTimes],
+        }
+        self.moves.append(record)
+        return record
+
+    def clear(self):
+        """
+        Forgets all the stored move records.
+        """
+        self.moves = []
+
+
+def branchingFactor(depthTimes: list) -> float:
+    """
+    Effective branching factor of the deepest completed search: the b such
+    that a uniform tree with one ply per agent and turn, 2 * depth plies in
+    all, would have as many nodes and leaves as the search visited.
+    """
+    if not depthTimes:
+        return 0.0
+    last = depthTimes[-1]
+    plies = 2 * last['depth']
+    if last['work'] <= 1 or plies == 0:
+        return 0.0
+    return last['work'] ** (1 / plies)
+
+
+def percentile(sortedValues: list, q: float) -> float:
+    """
+    Returns the q-th percentile (0-100) of an already sorted list, using the nearest rank.
+    """
+    if not sortedValues:
+        return 0.0
+    rank = max(1, -(-len(sortedValues) * q // 100))
+    return sortedValues[min(int(rank), len(sortedValues)) - 1]
+
+
+def summarizeMoves(records: list) -> dict:
+    """
+    Aggregates a list of move records, for example the moves of one game.
+    """
+    latencies = sorted(record['latency'] for record in records)
+    nodes = {name: sum(record['nodes'][name] for record in records) for name in NODE_TYPE_NAMES.values()}
+    hits = sum(record['cacheHits'] for record in records)
+    misses = sum(record['cacheMisses'] for record in records)
+    return {
+        'moves': len(records),
+        'nodes': nodes,
+        'leaves': sum(record['leaves'] for record in records),
+        'cutoffs': sum(record['cutoffs'] for record in records),
+        'cacheHits': hits,
+        'cacheMisses': misses,
+        'cacheHitRate': hits / (hits + misses) if hits + misses else 0.0,
+        'meanDepth': sum(record['depth'] for record in records) / len(records) if records else 0.0,
+        'meanBranchingFactor': (sum(record['branchingFactor'] for record in records) / len(records)
+                                if records else 0.0),
+        'totalTime': sum(latencies),
+        'meanLatency': sum(latencies) / len(latencies) if latencies else 0.0,
+        'maxLatency': latencies[-1] if latencies else 0.0,
+    }
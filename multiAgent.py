@@ -1,6 +1,12 @@
-from gameState import GameState
-from math import inf
-from typing import Callable
+from gameState import GameState, SPAWN_PROBABILITIES, getTileValue
+import random
+import time
+from collections.abc import Callable
+from math import inf, log, sqrt
+from bitboardState import transformAction, untransformAction
+from packedState import getLayout
+from instrumentation import SearchStats, CountingEvaluation
+from transposition import TranspositionTable, SharedTranspositionTable, MAX_NODE, MIN_NODE, CHANCE_NODE, EXACT, LOWER_BOUND, UPPER_BOUND
 
 def evalFunctionPlaceholder(gameState: GameState) -> int:
     """
@@ -8,15 +14,430 @@ def evalFunctionPlaceholder(gameState: GameState) -> int:
     """
     return 0
 
+def batchEvaluation(batchFn: Callable[[list], list]):
+    """
+    Decorator declaring that an evaluation function also accepts batches.
+    `batchFn` takes a list of game states and returns their values in order,
+    which must be the same values the evaluation function gives one by one.
+    """
+    def decorator(evalFn):
+        evalFn.evaluateBatch = batchFn
+        return evalFn
+    return decorator
+
+_workerAgent = None
+
+
+def _initWorker(agent: 'MultiAgentSearchAgent'):
+    """
+    Keeps the copy of the agent that the processes of its pool work with.
+    """
+    global _workerAgent
+    _workerAgent = agent
+
+
+def _runInWorker(method: str, depth: int, deadline: float, args: tuple):
+    """
+    Runs one piece of a parallel search with the depth and deadline of the
+    search in the parent process. With instrumentation, the counters of the
+    piece are returned along with its result.
+    """
+    _workerAgent.depth = depth
+    _workerAgent.deadline = deadline
+    stats = _workerAgent.stats
+    if stats is None:
+        return getattr(_workerAgent, method)(*args)
+    stats.resetCounters()
+    return getattr(_workerAgent, method)(*args), stats.counters()
+
+
+def _addLeaf(leaves: dict, gameState: GameState) -> int:
+    """
+    Adds a leaf state to be evaluated, returning its index. Equal boards
+    share the same index, so each of them is only evaluated once.
+    """
+    key = gameState.getBoardKey()
+    entry = leaves.get(key)
+    if entry is None:
+        entry = leaves[key] = (len(leaves), gameState)
+    return entry[0]
+
+
+def placementThreat(board: int, action: int, size: int = 4) -> int:
+    """
+    Cheap static score of how much a tile placement hurts the player: the
+    number of tiles next to it that it cannot merge with, minus the ones it
+    can merge with. `board` is the packed board (see `getBoardKey`) and
+    `size` its number of rows and columns.
+    """
+    cell = action >> 4
+    exponent = action & 0xF
+    i, j = divmod(cell, size)
+    last = size - 1
+    threat = 0
+    for neighbour, onBoard in ((cell - size, i > 0), (cell + size, i < last), (cell - 1, j > 0), (cell + 1, j < last)):
+        if onBoard:
+            other = (board >> (4 * neighbour)) & 0xF
+            if other == exponent:
+                threat -= 1
+            elif other:
+                threat += 1
+    return threat
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside a search when the time budget of the current move runs out.
+    """
+    pass
+
+
+class SearchCancelled(Exception):
+    """
+    Raised by `getAction` when its search was stopped with `cancel`.
+    """
+    pass
+
+
 class MultiAgentSearchAgent():
     """
     Abstract class for multi-agent search agents
+
+    By default agents search to a fixed `depth`. When `timeLimit` (seconds per
+    move) is given, `getAction` instead deepens iteratively from depth 1 until
+    the time runs out or `maxDepth` is reached, and returns the best action of
+    the last depth it completed. That depth is kept in `lastDepthReached`.
+
+    With `workers` set, the root of every search is split across a pool of
+    that many processes. The pool is started on the first search and gets a
+    copy of the agent at that time, so the evaluation function must be
+    picklable (a module level function, not a lambda). Call `close` to stop it.
+
+    With `batchLeaves` set, the search first expands the whole tree, then
+    scores all of its distinct leaves with a single call to the evaluation
+    function's batch version (see `batchEvaluation`) and finally backs the
+    values up. The transposition cache is not used in this mode.
+
+    With `symmetricCache` set, agents with a transposition cache key it by
+    `getCanonicalKey`, so the eight rotations and reflections of a board
+    share one entry. This is only valid for evaluation functions that give
+    symmetric boards the same value, like `evaluationFunction2048`.
+
+    With `instrument` set, the agent records the work of every move in
+    `self.stats` (see instrumentation.py).
+
+    A search running in another thread can be stopped with `cancel`, which
+    makes its `getAction` raise SearchCancelled (see backgroundSearch.py).
+
+    With a `policyStore` (see policyStore.py), fixed-depth searches first look
+    the board up in the store and save their result there, so positions
+    searched in earlier games or by other processes are not searched again.
+    A stored action has the best value but, on ties, may differ from the one
+    a new search would choose on a rotated or reflected board. Searches with
+    `timeLimit` do not use the store, since their depth varies from move to move.
+    The store holds 4x4 boards only.
     """
 
-    def __init__(self, evalFn: Callable[[GameState], int] = evalFunctionPlaceholder, depth: int = 2):
+    def __init__(self, evalFn: Callable[[GameState], int] = evalFunctionPlaceholder, depth: int = 2,
+                 timeLimit: float = None, maxDepth: int = None, workers: int = None, batchLeaves: bool = False,
+                 symmetricCache: bool = False, instrument: bool = False, policyStore=None):
         self.index = 0 # Pacman is always agent index 0
-        self.evaluationFunction = evalFn
+        self.stats = SearchStats() if instrument else None
+        self.evaluationFunction = CountingEvaluation(evalFn, self.stats) if instrument else evalFn
         self.depth = depth
+        self.timeLimit = timeLimit
+        self.maxDepth = maxDepth
+        self.lastDepthReached = 0
+        self.deadline = None
+        self.cancelled = False
+        self.workers = workers
+        self.pool = None
+        self.batchLeaves = batchLeaves
+        self.symmetricCache = symmetricCache
+        self.cache = None
+        self.policyStore = policyStore
+        self.lastValue = None
+
+    def __getstate__(self):
+        # The worker pool and the policy store stay in the process that created them
+        state = self.__dict__.copy()
+        state['pool'] = None
+        state['policyStore'] = None
+        return state
+
+    def parallelMap(self, method: str, argsList: list) -> list:
+        """
+        Calls the given method of the agent once per tuple of arguments in the
+        worker pool and returns the results in order.
+        """
+        if self.pool is None:
+            # Imported on first use, since most agents never start a pool
+            from concurrent.futures import ProcessPoolExecutor
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_initWorker, initargs=(self,))
+        futures = [self.pool.submit(_runInWorker, method, self.depth, self.deadline, args) for args in argsList]
+        results = [future.result() for future in futures]
+        if self.stats is None:
+            return results
+        for _, counters in results:
+            self.stats.addCounters(counters)
+        return [result for result, _ in results]
+
+    def close(self):
+        """
+        Shuts down the worker pool, if one was started.
+        """
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    def cacheKey(self, gameState: GameState) -> tuple[int, int]:
+        """
+        Returns the key of a state in the transposition cache and the
+        transform that maps the state onto the board of that key.
+        """
+        if self.symmetricCache:
+            return gameState.getCanonicalKey()
+        return gameState.getBoardKey(), 0
+
+    def selectAction(self, actions: list, values: list, agentIndex: int) -> int:
+        """
+        Returns the first action with the best value: the highest for the
+        player and the lowest for the tile generator. Returns None if there
+        are no actions. The best value is kept in `lastValue`.
+        """
+        best_action = None
+        best_value = -inf if agentIndex == 0 else inf
+        for action, value in zip(actions, values):
+            if (value > best_value) if agentIndex == 0 else (value < best_value):
+                best_value = value
+                best_action = action
+        self.lastValue = best_value
+        return best_action
+
+    def evaluateBatch(self, states: list) -> list:
+        """
+        Evaluates a list of states, in one call if the evaluation function accepts batches.
+        """
+        evaluateBatch = getattr(self.evaluationFunction, 'evaluateBatch', None)
+        if evaluateBatch is not None:
+            return list(evaluateBatch(states))
+        return [self.evaluationFunction(state) for state in states]
+
+    def adversaryOutcomes(self, gameState: GameState, agent: int) -> tuple[list, list]:
+        """
+        Returns the actions of an adversary node and their probabilities, or
+        None instead of the probabilities if the adversary minimizes.
+        """
+        return gameState.getLegalActions(agent), None
+
+    def cutsOff(self, probability: float) -> bool:
+        """
+        Checks if a path reached with the given probability is evaluated
+        statically instead of expanded.
+        """
+        return False
+
+    def expandNode(self, gameState: GameState, agent: int, totalAgents: int, actualDepth: int,
+                   probability: float, leaves: dict) -> tuple:
+        """
+        Expands the subtree below a node without evaluating it, following the
+        same rules as the recursive search. Returns a (nodeType, children,
+        probabilities) tuple where each child is either another such tuple or
+        the index of a leaf state in `leaves`, which maps board keys to
+        (index, state) pairs.
+        """
+        if self.deadline is not None:
+            self.checkDeadline()
+        children = []
+        if agent == 0:
+            if self.stats is not None:
+                self.stats.nodes[MAX_NODE] += 1
+            for action in gameState.getLegalActions(agent):
+                successor = gameState.generateSuccessor(agent, action)
+                if successor.isWin() or successor.isLose():
+                    children.append(_addLeaf(leaves, successor))
+                else:
+                    children.append(self.expandNode(successor, agent + 1, totalAgents, actualDepth, probability, leaves))
+            return MAX_NODE, children, None
+        nextAgent = (agent + 1) % totalAgents
+        actions, probabilities = self.adversaryOutcomes(gameState, agent)
+        if self.stats is not None:
+            self.stats.nodes[MIN_NODE if probabilities is None else CHANCE_NODE] += 1
+        for index, action in enumerate(actions):
+            successor = gameState.generateSuccessor(agent, action)
+            successorProbability = probability * probabilities[index] if probabilities else probability
+            if successor.isWin() or successor.isLose():
+                children.append(_addLeaf(leaves, successor))
+            elif nextAgent == 0:
+                if self.depth == actualDepth:
+                    children.append(_addLeaf(leaves, successor))
+                elif self.cutsOff(successorProbability):
+                    if self.stats is not None:
+                        self.stats.cutoffs += 1
+                    children.append(_addLeaf(leaves, successor))
+                else:
+                    children.append(self.expandNode(successor, nextAgent, totalAgents, actualDepth + 1,
+                                                    successorProbability, leaves))
+            else:
+                children.append(self.expandNode(successor, nextAgent, totalAgents, actualDepth,
+                                                successorProbability, leaves))
+        return (MIN_NODE if probabilities is None else CHANCE_NODE), children, probabilities
+
+    def expandRoot(self, gameState: GameState, agentIndex: int, action: int, leaves: dict):
+        """
+        Expands the subtree of a root action, like `rootValue` does with values.
+        """
+        successor = gameState.generateSuccessor(agentIndex, action)
+        if successor.isWin() or successor.isLose():
+            return _addLeaf(leaves, successor)
+        totalAgents = gameState.getNumAgents()
+        nextAgent = (agentIndex + 1) % totalAgents
+        if nextAgent == 0:
+            if self.depth == 1:
+                return _addLeaf(leaves, successor)
+            return self.expandNode(successor, nextAgent, totalAgents, 2, 1.0, leaves)
+        return self.expandNode(successor, nextAgent, totalAgents, 1, 1.0, leaves)
+
+    def backUp(self, node, values: list) -> float:
+        """
+        Computes the value of an expanded node from the values of the leaves.
+        """
+        if type(node) is int:
+            return values[node]
+        nodeType, children, probabilities = node
+        childValues = [self.backUp(child, values) for child in children]
+        if nodeType == MAX_NODE:
+            return max(childValues, default=-inf)
+        if nodeType == MIN_NODE:
+            return min(childValues, default=inf)
+        return self.combineChance(probabilities, childValues) if childValues else 0
+
+    def batchedRootValues(self, gameState: GameState, agentIndex: int, actions: list) -> list:
+        """
+        Computes the root values of the given actions evaluating all the
+        leaves of the search in a single batch.
+        """
+        leaves = {}
+        roots = [self.expandRoot(gameState, agentIndex, action, leaves) for action in actions]
+        values = self.evaluateBatch([state for _, state in leaves.values()])
+        return [self.backUp(root, values) for root in roots]
+
+    def batchedRootValue(self, gameState: GameState, agentIndex: int, action: int) -> float:
+        """
+        Batched version of `rootValue` for a single root action.
+        """
+        return self.batchedRootValues(gameState, agentIndex, [action])[0]
+
+    def checkDeadline(self):
+        """
+        Aborts the current search if its deadline has passed.
+        """
+        if time.monotonic() > self.deadline:
+            raise SearchTimeout()
+
+    def cancel(self):
+        """
+        Stops the search in progress, from another thread. Every node checks
+        the deadline when there is one, so moving it to the past stops the
+        search at the next node. With workers, the pieces already running in
+        the pool still finish.
+        """
+        # The deadline goes first, so getAction never sees the flag without it
+        self.deadline = -inf
+        self.cancelled = True
+
+    def getAction(self, gameState: GameState, agentIndex: int = 0) -> int:
+        """
+        Returns the action chosen for the given agent, searching to self.depth
+        or within self.timeLimit seconds, or None if it has no legal actions.
+        Actions use the int encoding of gameState (use `actionToString` to
+        get their names). Raises SearchCancelled if `cancel` is called
+        before the search ends.
+        """
+        if self.policyStore is not None and gameState.size != 4:
+            raise ValueError("The policy store only holds 4x4 boards")
+        if isinstance(self.cache, SharedTranspositionTable) and gameState.size != 4:
+            raise ValueError("The shared transposition table only holds 4x4 boards")
+        self.cancelled = False
+        self.deadline = None
+        stats = self.stats
+        if stats is not None:
+            stats.startMove(self.cache)
+        try:
+            if self.timeLimit is None:
+                self.lastDepthReached = self.depth
+                action = self.storedAction(gameState, agentIndex) if self.policyStore is not None else None
+                if action is None:
+                    action = self.searchAction(gameState, agentIndex)
+                    if self.policyStore is not None and action is not None and not self.cancelled:
+                        key, transform = gameState.getCanonicalKey()
+                        self.policyStore.store(key, self.depth, agentIndex,
+                                               transformAction(agentIndex, action, transform), self.lastValue)
+                if stats is not None:
+                    stats.depthFinished(self.depth)
+            else:
+                action = self.iterativeDeepening(gameState, agentIndex)
+        except SearchTimeout:
+            # Searches to a fixed depth only time out when cancelled
+            self.cancelled = True
+        finally:
+            if self.cancelled:
+                self.deadline = None
+        if self.cancelled:
+            raise SearchCancelled()
+        if stats is not None:
+            stats.finishMove(agentIndex, self.lastDepthReached, self.cache)
+        return action
+
+    def storedAction(self, gameState: GameState, agentIndex: int) -> int:
+        """
+        Returns the action saved in the policy store for this board and
+        self.depth, or None if there is none.
+        """
+        key, transform = gameState.getCanonicalKey()
+        entry = self.policyStore.lookup(key, self.depth, agentIndex)
+        if entry is None:
+            return None
+        action, self.lastValue = entry
+        action = untransformAction(agentIndex, action, transform)
+        # Guards against a store written by an incompatible agent
+        return action if action in gameState.getLegalActions(agentIndex) else None
+
+    def iterativeDeepening(self, gameState: GameState, agentIndex: int = 0) -> int:
+        """
+        Searches with increasing depth until the time budget runs out and
+        returns the action found by the deepest completed search.
+        """
+        legalActions = gameState.getLegalActions(agentIndex)
+        if not legalActions:
+            return None
+        best_action = legalActions[0]
+        fixedDepth = self.depth
+        self.lastDepthReached = 0
+        self.deadline = time.monotonic() + self.timeLimit
+        try:
+            depth = 1
+            while self.maxDepth is None or depth <= self.maxDepth:
+                self.depth = depth
+                action = self.searchAction(gameState, agentIndex)
+                if action is not None:
+                    best_action = action
+                self.lastDepthReached = depth
+                if self.stats is not None:
+                    self.stats.depthFinished(depth)
+                depth += 1
+        except SearchTimeout:
+            pass
+        finally:
+            self.depth = fixedDepth
+            self.deadline = None
+        return best_action
+
+    def searchAction(self, gameState: GameState, agentIndex: int = 0) -> int:
+        """
+        Returns the best action for the given agent searching to self.depth.
+        """
+        raise NotImplementedError
 
 
 class MinimaxAgent(MultiAgentSearchAgent):
@@ -28,6 +449,10 @@ class MinimaxAgent(MultiAgentSearchAgent):
         """
         Max value function for minimax algorithm
         """
+        if self.deadline is not None:
+            self.checkDeadline()
+        if self.stats is not None:
+            self.stats.nodes[MAX_NODE] += 1
         v = -inf
         for action in gameState.getLegalActions(agent):
             successor = gameState.generateSuccessor(agent, action)
@@ -41,6 +466,10 @@ class MinimaxAgent(MultiAgentSearchAgent):
         """
         Min value function for minimax algorithm
         """
+        if self.deadline is not None:
+            self.checkDeadline()
+        if self.stats is not None:
+            self.stats.nodes[MIN_NODE] += 1
         v = inf
         nextAgent = (agent+1) % totalAgents
         for action in gameState.getLegalActions(agent):
@@ -57,184 +486,734 @@ class MinimaxAgent(MultiAgentSearchAgent):
                     v = min(v, self.min_value(successor, nextAgent, totalAgents, actualDepth))
         return v
 
-    def getAction(self, gameState: GameState, agentIndex: int = 0) -> str:
+    def rootValue(self, gameState: GameState, agentIndex: int, action: int) -> float:
+        """
+        Returns the minimax value of the given agent taking `action` at the root.
+        """
+        successor = gameState.generateSuccessor(agentIndex, action)
+        if successor.isWin() or successor.isLose():
+            return self.evaluationFunction(successor)
+        totalAgents = gameState.getNumAgents()
+        nextAgent = (agentIndex + 1) % totalAgents
+        if nextAgent == 0:
+            if self.depth == 1:
+                return self.evaluationFunction(successor)
+            return self.max_value(successor, nextAgent, totalAgents, 2)
+        return self.min_value(successor, nextAgent, totalAgents, 1)
+
+    def searchAction(self, gameState: GameState, agentIndex: int = 0) -> int:
         """
         Returns the minimax action from the current gameState using self.depth
         and self.evaluationFunction.
         """
-        best_action = ''
-        if agentIndex == 0:
-            best_value = -inf
-            for action in gameState.getLegalActions(0):
-                successor = gameState.generateSuccessor(0, action)
-                if successor.isWin() or successor.isLose():
-                    value = self.evaluationFunction(successor)
-                else:
-                    value = self.min_value(successor, 1, gameState.getNumAgents(), 1)
-                if value > best_value:
-                    best_value = value
-                    best_action = action
-        else: 
-            best_value = inf
-            for action in gameState.getLegalActions(agentIndex):
-                successor = gameState.generateSuccessor(agentIndex, action)
-                if successor.isWin() or successor.isLose():
-                    value = self.evaluationFunction(successor)
-                else:
-                    nextAgent = (agentIndex + 1) % gameState.getNumAgents()
-                    if nextAgent == 0:
-                        if self.depth == 1:
-                            value = self.evaluationFunction(successor)
-                        else:
-                            value = self.max_value(successor, nextAgent, gameState.getNumAgents(), 2)
-                    else:
-                        value = self.min_value(successor, nextAgent, gameState.getNumAgents(), 1)
-                if value < best_value:
-                    best_value = value
-                    best_action = action
-        return best_action
+        actions = gameState.getLegalActions(agentIndex)
+        if self.workers:
+            method = 'batchedRootValue' if self.batchLeaves else 'rootValue'
+            values = self.parallelMap(method, [(gameState, agentIndex, action) for action in actions])
+        elif self.batchLeaves:
+            values = self.batchedRootValues(gameState, agentIndex, actions)
+        else:
+            values = [self.rootValue(gameState, agentIndex, action) for action in actions]
+        return self.selectAction(actions, values, agentIndex)
         
 
 class AlphaBetaAgent(MultiAgentSearchAgent):
     """
     Minimax agent with alpha-beta pruning.
+
+    With `moveOrdering` (on by default) the most promising children are
+    searched first, which prunes far more of the tree without changing the
+    chosen action: the best move stored for a position, or found for it by
+    the previous iteration of iterative deepening, goes first, and tile
+    placements are sorted by `placementThreat`.
+
+    An optional transposition table (`cache`) stores the value of every node
+    together with its kind (exact, lower or upper bound, see transposition.py)
+    and its best move, and can be kept between moves.
     """
 
+    def __init__(self, evalFn: Callable[[GameState], int] = evalFunctionPlaceholder, depth: int = 2,
+                 cache: TranspositionTable = None, moveOrdering: bool = True, **kwargs):
+        super().__init__(evalFn, depth, **kwargs)
+        self.cache = cache
+        self.moveOrdering = moveOrdering
+
+    def orderActions(self, gameState: GameState, agent: int, actions: list, bestAction: int = None) -> list:
+        """
+        Returns the actions in the order they should be searched.
+        """
+        if agent != 0:
+            board = gameState.getBoardKey()
+            size = gameState.size
+            actions = sorted(actions, key=lambda action: placementThreat(board, action, size), reverse=True)
+        if bestAction is not None and bestAction in actions:
+            actions = [bestAction] + [action for action in actions if action != bestAction]
+        return actions
+
+    def probeCache(self, key: int, transform: int, remaining: int, nodeType: int, alpha: float, beta: float,
+                   size: int = 4) -> tuple:
+        """
+        Looks a node up in the cache. Returns (value, alpha, beta, bestAction):
+        value is not None when the stored result already settles the node,
+        the window is narrowed by the stored bound and bestAction is the move
+        to search first, if any is known. `size` is the side of the board.
+        """
+        entry = self.cache.lookup(key, remaining, nodeType)
+        if entry is None and remaining > 0 and self.moveOrdering:
+            # The previous iteration of iterative deepening searched this node one level shallower.
+            # That entry only orders the moves, so it is kept out of the hit and miss counters
+            entry = self.cache.lookup(key, remaining - 1, nodeType, count=False)
+            if entry is not None:
+                entry = (None, None, entry[2])
+        if entry is None:
+            return None, alpha, beta, None
+        value, kind, bestAction = entry
+        if transform and bestAction is not None:
+            # Stored moves are relative to the canonical board
+            bestAction = untransformAction(0 if nodeType == MAX_NODE else 1, bestAction, transform, size)
+        if value is None:
+            return None, alpha, beta, bestAction
+        if kind == EXACT:
+            return value, alpha, beta, bestAction
+        if kind == LOWER_BOUND:
+            if value > beta:
+                return value, alpha, beta, bestAction
+            alpha = max(alpha, value)
+        else:
+            if value < alpha:
+                return value, alpha, beta, bestAction
+            beta = min(beta, value)
+        return None, alpha, beta, bestAction
+
+    def storeCache(self, key: int, transform: int, remaining: int, nodeType: int, value: float, alpha: float,
+                   beta: float, bestAction: int, size: int = 4):
+        """
+        Stores the result of a node searched within the (alpha, beta) window.
+        """
+        if transform and bestAction is not None:
+            bestAction = transformAction(0 if nodeType == MAX_NODE else 1, bestAction, transform, size)
+        if value < alpha:
+            kind = UPPER_BOUND
+        elif value > beta:
+            kind = LOWER_BOUND
+        else:
+            kind = EXACT
+        self.cache.store(key, remaining, nodeType, (value, kind, bestAction))
+
     def max_value(self, gameState: GameState, agent: int, totalAgents: int, actualDepth: int, alpha: float, beta: float) -> float:
         """
         Max value function for minimax algorithm with alpha-beta pruning
         """
+        if self.deadline is not None:
+            self.checkDeadline()
+        bestAction = None
+        if self.cache is not None:
+            key, transform = self.cacheKey(gameState)
+            remaining = self.depth - actualDepth
+            originalAlpha, originalBeta = alpha, beta
+            cached, alpha, beta, bestAction = self.probeCache(key, transform, remaining, MAX_NODE, alpha, beta)
+            if cached is not None:
+                return cached
+        if self.stats is not None:
+            self.stats.nodes[MAX_NODE] += 1
+        actions = gameState.getLegalActions(agent)
+        if self.moveOrdering:
+            actions = self.orderActions(gameState, agent, actions, bestAction)
         v = -inf
-        for action in gameState.getLegalActions(agent):
+        for action in actions:
             successor = gameState.generateSuccessor(agent, action)
             if successor.isWin() or successor.isLose():
-                v = max(v, self.evaluationFunction(successor))
+                value = self.evaluationFunction(successor)
             else:
-                v = max(v, self.min_value(successor, agent + 1, totalAgents, actualDepth, alpha, beta))
+                value = self.min_value(successor, agent + 1, totalAgents, actualDepth, alpha, beta)
+            if value > v:
+                v = value
+                bestAction = action
             alpha = max(alpha, v)
             if v > beta:
+                if self.stats is not None:
+                    self.stats.cutoffs += 1
                 break
+        if self.cache is not None:
+            self.storeCache(key, transform, remaining, MAX_NODE, v, originalAlpha, originalBeta, bestAction)
         return v
 
     def min_value(self, gameState: GameState, agent: int, totalAgents: int, actualDepth: int, alpha: float, beta: float) -> float:
         """
         Min value function for minimax algorithm with alpha-beta pruning
         """
+        if self.deadline is not None:
+            self.checkDeadline()
+        bestAction = None
+        if self.cache is not None:
+            key, transform = self.cacheKey(gameState)
+            remaining = self.depth - actualDepth
+            originalAlpha, originalBeta = alpha, beta
+            cached, alpha, beta, bestAction = self.probeCache(key, transform, remaining, MIN_NODE, alpha, beta,
+                                                              gameState.size)
+            if cached is not None:
+                return cached
+        if self.stats is not None:
+            self.stats.nodes[MIN_NODE] += 1
         v = inf
         nextAgent = (agent+1) % totalAgents
-        for action in gameState.getLegalActions(agent):
-            successor = gameState.generateSuccessor(agent, action)
-            if successor.isWin() or successor.isLose():
-                v = min(v, self.evaluationFunction(successor))
-            else:
-                if nextAgent == 0:
+        if self.batchLeaves and nextAgent == 0 and self.depth == actualDepth:
+            v, bestAction = self.min_frontier_value(gameState, agent, alpha)
+        else:
+            actions = gameState.getLegalActions(agent)
+            if self.moveOrdering:
+                actions = self.orderActions(gameState, agent, actions, bestAction)
+            for action in actions:
+                successor = gameState.generateSuccessor(agent, action)
+                if successor.isWin() or successor.isLose():
+                    value = self.evaluationFunction(successor)
+                elif nextAgent == 0:
                     if self.depth == actualDepth:
-                        v = min(v, self.evaluationFunction(successor))
+                        value = self.evaluationFunction(successor)
                     else:
-                        v = min(v, self.max_value(successor, nextAgent, totalAgents, actualDepth + 1, alpha, beta))
+                        value = self.max_value(successor, nextAgent, totalAgents, actualDepth + 1, alpha, beta)
                 else:
-                    v = min(v, self.min_value(successor, nextAgent, totalAgents, actualDepth, alpha, beta))
-            beta = min(beta, v)
+                    value = self.min_value(successor, nextAgent, totalAgents, actualDepth, alpha, beta)
+                if value < v:
+                    v = value
+                    bestAction = action
+                beta = min(beta, v)
+                if v < alpha:
+                    if self.stats is not None:
+                        self.stats.cutoffs += 1
+                    break
+        if self.cache is not None:
+            self.storeCache(key, transform, remaining, MIN_NODE, v, originalAlpha, originalBeta, bestAction,
+                            gameState.size)
+        return v
+
+    def min_frontier_value(self, gameState: GameState, agent: int, alpha: float) -> tuple[float, int]:
+        """
+        Min value of a node whose children are all leaves, evaluating them in
+        one batch, and the action that reaches it. Pruning needs the values
+        one by one, so with alpha-beta the batches are per frontier node
+        rather than for the whole tree.
+        """
+        actions = gameState.getLegalActions(agent)
+        successors = [gameState.generateSuccessor(agent, action) for action in actions]
+        v = inf
+        bestAction = None
+        for action, value in zip(actions, self.evaluateBatch(successors)):
+            if value < v:
+                v = value
+                bestAction = action
             if v < alpha:
+                if self.stats is not None:
+                    self.stats.cutoffs += 1
                 break
-        return v
+        return v, bestAction
 
-    def getAction(self, gameState: GameState, agentIndex: int = 0) -> str:
+    def rootValue(self, gameState: GameState, agentIndex: int, action: int,
+                  alpha: float = -inf, beta: float = inf) -> float:
         """
-        Returns the minimax action using self.depth and self.evaluationFunction
+        Returns the value of the given agent taking `action` at the root,
+        searched within the (alpha, beta) window.
         """
-        best_action = ''
-        if agentIndex == 0:
-            best_value = -inf
-            alpha = -inf
-            beta = inf
-            for action in gameState.getLegalActions(0):
-                successor = gameState.generateSuccessor(0, action)
-                if successor.isWin() or successor.isLose():
-                    value = self.evaluationFunction(successor)
-                else:
-                    value = self.min_value(successor, 1, gameState.getNumAgents(), 1, alpha, beta)
-                alpha = max(alpha, value)
+        successor = gameState.generateSuccessor(agentIndex, action)
+        if successor.isWin() or successor.isLose():
+            return self.evaluationFunction(successor)
+        totalAgents = gameState.getNumAgents()
+        nextAgent = (agentIndex + 1) % totalAgents
+        if nextAgent == 0:
+            if self.depth == 1:
+                return self.evaluationFunction(successor)
+            return self.max_value(successor, nextAgent, totalAgents, 2, alpha, beta)
+        return self.min_value(successor, nextAgent, totalAgents, 1, alpha, beta)
 
-                if value > best_value:
-                    best_value = value
-                    best_action = action
-        else: 
-            best_value = inf
+    def searchAction(self, gameState: GameState, agentIndex: int = 0) -> int:
+        """
+        Returns the minimax action using self.depth and self.evaluationFunction
+
+        The parallel search gives every root action a full window. Actions that
+        the serial search would prune then get exact values instead of bounds,
+        but those values never beat the best one, so the chosen action is the same.
+        For the same reason, the order in which the serial search visits the
+        root actions does not change the action it returns.
+        """
+        actions = gameState.getLegalActions(agentIndex)
+        # The root is the node the recursive search would reach at depth 1
+        nodeType = MAX_NODE if agentIndex == 0 else MIN_NODE
+        if self.cache is not None:
+            key, transform = self.cacheKey(gameState)
+            bestAction = self.probeCache(key, transform, self.depth - 1, nodeType, -inf, inf, gameState.size)[3]
+        else:
+            bestAction = None
+        if self.workers:
+            values = self.parallelMap('rootValue', [(gameState, agentIndex, action) for action in actions])
+        else:
+            order = self.orderActions(gameState, agentIndex, actions, bestAction) if self.moveOrdering else actions
+            valueOf = {}
             alpha = -inf
             beta = inf
-            for action in gameState.getLegalActions(agentIndex):
-                successor = gameState.generateSuccessor(agentIndex, action)
-                if successor.isWin() or successor.isLose():
-                    value = self.evaluationFunction(successor)
+            for action in order:
+                value = self.rootValue(gameState, agentIndex, action, alpha, beta)
+                if agentIndex == 0:
+                    alpha = max(alpha, value)
                 else:
-                    nextAgent = (agentIndex + 1) % gameState.getNumAgents()
-                    if nextAgent == 0:
-                        if self.depth == 1:
-                            value = self.evaluationFunction(successor)
-                        else:
-                            value = self.max_value(successor, nextAgent, gameState.getNumAgents(), 2, alpha, beta)
-                    else:
-                        value = self.min_value(successor, nextAgent, gameState.getNumAgents(), 1, alpha, beta)
-                beta = min(beta, value)
-                if value < best_value:
-                    best_value = value
-                    best_action = action
-        return best_action
+                    beta = min(beta, value)
+                valueOf[action] = value
+            values = [valueOf[action] for action in actions]
+        action = self.selectAction(actions, values, agentIndex)
+        if self.cache is not None and action is not None:
+            value = max(values) if agentIndex == 0 else min(values)
+            self.storeCache(key, transform, self.depth - 1, nodeType, value, value, value, action, gameState.size)
+        return action
     
 
 class ExpectimaxAgent(MultiAgentSearchAgent):
     """
     Expectimax agent
+
+    An optional transposition table (`cache`) stores the value of every max
+    and chance node, so positions reached through different move and spawn
+    orders are only searched once.
+
+    With chanceModel='uniform' every tile placement is equally likely. With
+    chanceModel='weighted' placements follow the real spawn rates in
+    SPAWN_PROBABILITIES. Either way, a path whose cumulative probability
+    falls below `probabilityCutoff` is not expanded further and its board is
+    evaluated statically. Cached values do not depend on the probability of
+    the path that reached them, so with a cutoff they are approximations.
     """
 
-    def max_value(self, gameState: GameState, agent: int, totalAgents: int, actualDepth: int) -> float:
+    def __init__(self, evalFn: Callable[[GameState], int] = evalFunctionPlaceholder, depth: int = 2,
+                 cache: TranspositionTable = None, chanceModel: str = 'uniform', probabilityCutoff: float = 0.0,
+                 **kwargs):
+        super().__init__(evalFn, depth, **kwargs)
+        if chanceModel not in ('uniform', 'weighted'):
+            raise ValueError(f"Unknown chance model: {chanceModel}")
+        self.cache = cache
+        self.chanceModel = chanceModel
+        self.probabilityCutoff = probabilityCutoff
+
+    @property
+    def cacheHits(self) -> int:
+        return self.cache.hits if self.cache is not None else 0
+
+    @property
+    def cacheMisses(self) -> int:
+        return self.cache.misses if self.cache is not None else 0
+
+    def max_value(self, gameState: GameState, agent: int, totalAgents: int, actualDepth: int,
+                  probability: float = 1.0) -> float:
+        if self.deadline is not None:
+            self.checkDeadline()
+        if self.cache is not None:
+            key = self.cacheKey(gameState)[0]
+            cached = self.cache.lookup(key, self.depth - actualDepth, MAX_NODE)
+            if cached is not None:
+                return cached
+        if self.stats is not None:
+            self.stats.nodes[MAX_NODE] += 1
         v = -inf
         for action in gameState.getLegalActions(agent):
             successor = gameState.generateSuccessor(agent, action)
             if successor.isWin() or successor.isLose():
                 v = max(v, self.evaluationFunction(successor))
             else:
-                v = max(v, self.exp_value(successor, agent + 1, totalAgents, actualDepth))
+                v = max(v, self.exp_value(successor, agent + 1, totalAgents, actualDepth, probability))
+        if self.cache is not None:
+            self.cache.store(key, self.depth - actualDepth, MAX_NODE, v)
         return v
     
-    def exp_value(self, gameState: GameState, agent: int, totalAgents: int, actualDepth: int) -> float:
-        v = inf
+    def chanceOutcomes(self, gameState: GameState, agent: int) -> tuple[list, list]:
+        """
+        Returns the possible tile placements and their probabilities under the chance model.
+        """
+        actions = gameState.getLegalActions(agent)
+        if not actions:
+            return actions, []
+        if self.chanceModel == 'weighted':
+            # Every empty cell can receive any of the tiles in SPAWN_PROBABILITIES
+            numCells = len(actions) // len(SPAWN_PROBABILITIES)
+            probabilities = [SPAWN_PROBABILITIES[getTileValue(action)] / numCells for action in actions]
+        else:
+            probabilities = [1 / len(actions)] * len(actions)
+        return actions, probabilities
+
+    def adversaryOutcomes(self, gameState: GameState, agent: int) -> tuple[list, list]:
+        return self.chanceOutcomes(gameState, agent)
+
+    def cutsOff(self, probability: float) -> bool:
+        return probability < self.probabilityCutoff
+
+    def chanceValue(self, successor: GameState, nextAgent: int, totalAgents: int, actualDepth: int,
+                    probability: float) -> float:
+        """
+        Returns the value of one outcome of a chance node, reached with the given cumulative probability.
+        """
+        if successor.isWin() or successor.isLose():
+            return self.evaluationFunction(successor)
+        if nextAgent == 0:
+            if self.depth == actualDepth:
+                return self.evaluationFunction(successor)
+            if probability < self.probabilityCutoff:
+                if self.stats is not None:
+                    self.stats.cutoffs += 1
+                return self.evaluationFunction(successor)
+            return self.max_value(successor, nextAgent, totalAgents, actualDepth + 1, probability)
+        return self.exp_value(successor, nextAgent, totalAgents, actualDepth, probability)
+
+    def combineChance(self, probabilities: list, scores: list) -> float:
+        """
+        Returns the expected value of a chance node from the values of its outcomes.
+        """
+        if self.chanceModel == 'weighted':
+            return sum(p * score for p, score in zip(probabilities, scores))
+        return sum(scores) / len(scores)
+
+    def exp_value(self, gameState: GameState, agent: int, totalAgents: int, actualDepth: int,
+                  probability: float = 1.0) -> float:
+        if self.deadline is not None:
+            self.checkDeadline()
+        if self.cache is not None:
+            key = self.cacheKey(gameState)[0]
+            cached = self.cache.lookup(key, self.depth - actualDepth, CHANCE_NODE)
+            if cached is not None:
+                return cached
+        if self.stats is not None:
+            self.stats.nodes[CHANCE_NODE] += 1
         nextAgent = (agent+1) % totalAgents
+        actions, probabilities = self.chanceOutcomes(gameState, agent)
+        if not actions:
+            return 0
         scores = []
-        for action in gameState.getLegalActions(agent):
+        for action, actionProbability in zip(actions, probabilities):
             successor = gameState.generateSuccessor(agent, action)
-            if successor.isWin() or successor.isLose():
-                scores.append(self.evaluationFunction(successor))
-            else:
-                if nextAgent == 0:
-                    if self.depth == actualDepth:
-                        scores.append(self.evaluationFunction(successor))
-                    else:
-                        scores.append(self.max_value(successor, nextAgent, totalAgents, actualDepth + 1))
-                else:
-                    scores.append(self.exp_value(successor, nextAgent, totalAgents, actualDepth))
-        v = sum(scores) / len(scores) if scores else 0
+            scores.append(self.chanceValue(successor, nextAgent, totalAgents, actualDepth,
+                                           probability * actionProbability))
+        v = self.combineChance(probabilities, scores)
+        if self.cache is not None:
+            self.cache.store(key, self.depth - actualDepth, CHANCE_NODE, v)
         return v
 
-    def getAction(self, gameState: GameState) -> str:
+    def rootValue(self, gameState: GameState, agentIndex: int, action: int) -> float:
         """
-        Returns the expectimax action using self.depth and self.evaluationFunction
+        Returns the expected value of the given agent taking `action` at the root.
         """
-        best_action = ''
-        best_value = -inf
-        for action in gameState.getLegalActions(0):
+        successor = gameState.generateSuccessor(agentIndex, action)
+        if successor.isWin() or successor.isLose():
+            return self.evaluationFunction(successor)
+        if agentIndex == 0:
+            return self.exp_value(successor, 1, gameState.getNumAgents(), 1)
+        if self.depth == 1:
+            return self.evaluationFunction(successor)
+        return self.max_value(successor, 0, gameState.getNumAgents(), 2)
+
+    def parallelRootValues(self, gameState: GameState, actions: list) -> list:
+        """
+        Computes the root values of the player's actions, farming every
+        (move, spawn) pair out to the worker pool.
+        """
+        totalAgents = gameState.getNumAgents()
+        values = [None] * len(actions)
+        tasks = []
+        outcomes = []
+        for index, action in enumerate(actions):
             successor = gameState.generateSuccessor(0, action)
             if successor.isWin() or successor.isLose():
-                value = self.evaluationFunction(successor)
-            else:
-                value = self.exp_value(successor, 1, gameState.getNumAgents(), 1)
-            if value > best_value:
-                best_value = value
-                best_action = action
-        return best_action
+                values[index] = self.evaluationFunction(successor)
+                continue
+            spawns, probabilities = self.chanceOutcomes(successor, 1)
+            outcomes.append((index, probabilities, len(tasks), len(spawns)))
+            for spawn, probability in zip(spawns, probabilities):
+                tasks.append((successor.generateSuccessor(1, spawn), 0, totalAgents, 1, probability))
+        results = self.parallelMap('chanceValue', tasks)
+        for index, probabilities, start, count in outcomes:
+            values[index] = self.combineChance(probabilities, results[start:start + count]) if count else 0
+        return values
+
+    def searchAction(self, gameState: GameState, agentIndex: int = 0) -> int:
+        """
+        Returns the expectimax action using self.depth and self.evaluationFunction.
+        For the tile generator (agentIndex=1) it returns the placement that
+        minimizes the expected value of the player's reply.
+        """
+        actions = gameState.getLegalActions(agentIndex)
+        if self.workers and self.batchLeaves:
+            values = self.parallelMap('batchedRootValue', [(gameState, agentIndex, action) for action in actions])
+        elif self.batchLeaves:
+            values = self.batchedRootValues(gameState, agentIndex, actions)
+        elif not self.workers:
+            values = [self.rootValue(gameState, agentIndex, action) for action in actions]
+        elif agentIndex == 0:
+            values = self.parallelRootValues(gameState, actions)
+        else:
+            values = self.parallelMap('rootValue', [(gameState, agentIndex, action) for action in actions])
+        return self.selectAction(actions, values, agentIndex)
     
 
+class _DecisionNode:
+    """
+    A node of the UCT tree where the player moves.
+    """
+    __slots__ = ('board', 'visits', 'children', 'untried')
+
+    def __init__(self, board: int):
+        self.board = board
+        self.visits = 0
+        self.children = {}  # Action -> _MoveNode
+        self.untried = None  # Legal (action, board) pairs not expanded yet, computed on the first visit
+
+
+class _MoveNode:
+    """
+    A node of the UCT tree after a player move, before the random tile.
+    Its outcomes are the decision nodes of the spawns sampled so far.
+    """
+    __slots__ = ('board', 'visits', 'total', 'outcomes')
+
+    def __init__(self, board: int):
+        self.board = board
+        self.visits = 0
+        self.total = 0.0
+        self.outcomes = {}  # Board after the spawn -> _DecisionNode
+
+
+class MonteCarloAgent(MultiAgentSearchAgent):
+    """
+    Player agent that chooses moves from random playouts instead of an
+    exhaustive search, so its cost grows with its budget and not with the
+    number of empty cells.
+
+    Every playout (rollout) starts after one of the player's moves, plays
+    `rolloutDepth` more moves (or until the game is lost, if None) with
+    `rolloutPolicy`, spawning tiles at the real rates, and scores the final
+    board with the evaluation function. With 'random' the moves are chosen
+    uniformly, and with 'greedy' the move that leaves the most empty cells is
+    chosen, breaking ties at random.
+
+    With method='flat' the rollouts are spread evenly over the legal moves and
+    the move with the best mean wins. With method='uct' they grow a search
+    tree, choosing moves with UCB1 (`exploration` weighs unvisited moves over
+    good ones) and sampling the tiles, and the most visited move wins.
+
+    A move stops after `rollouts` rollouts or when `timeLimit` seconds have
+    passed, whichever comes first; use rollouts=None to only limit the time.
+    With `workers`, each process of the pool runs its own search with a share
+    of the budget and their root statistics are added up. `seed` makes the
+    rollouts repeatable. The rollouts of the last move are kept in `lastRollouts`.
+
+    Playouts work on packed boards with the `BoardLayout` of the game's size
+    (see packedState.py), so every board size is supported. Only the player
+    is supported; the tile generator is left to the game.
+    """
+
+    def __init__(self, evalFn: Callable[[GameState], int] = evalFunctionPlaceholder, rollouts: int = 200,
+                 timeLimit: float = None, method: str = 'uct', rolloutDepth: int = 20, rolloutPolicy: str = 'random',
+                 exploration: float = 1.0, seed: int = None, **kwargs):
+        super().__init__(evalFn, timeLimit=timeLimit, **kwargs)
+        if method not in ('flat', 'uct'):
+            raise ValueError(f"Unknown Monte Carlo method: {method}")
+        if rolloutPolicy not in ('random', 'greedy'):
+            raise ValueError(f"Unknown rollout policy: {rolloutPolicy}")
+        if rollouts is None and timeLimit is None:
+            raise ValueError("MonteCarloAgent needs a rollout count, a time limit or both")
+        self.rollouts = rollouts
+        self.method = method
+        self.rolloutDepth = rolloutDepth
+        self.rolloutPolicy = rolloutPolicy
+        self.exploration = exploration
+        self.rng = random.Random(seed)
+        self.lastRollouts = 0
+        self.layout = None  # Board layout of the move being searched
+
+    def spawn(self, board: int, rng: random.Random) -> int:
+        """
+        Places a random tile on an empty cell of the board, at the real spawn rates.
+        """
+        cells = self.layout.emptyCells(board)
+        if not cells:
+            return board
+        exponent = 1 if rng.random() < SPAWN_PROBABILITIES[2] else 2
+        return board | (exponent << (4 * rng.choice(cells)))
+
+    def rollout(self, board: int, rng: random.Random) -> float:
+        """
+        Plays from a board where the player is to move and returns the value
+        of the board where the playout stops.
+        """
+        greedy = self.rolloutPolicy == 'greedy'
+        layout = self.layout
+        playerMoves = layout.playerMoves
+        countEmpty = layout.countEmpty
+        steps = 0
+        while self.rolloutDepth is None or steps < self.rolloutDepth:
+            moves = playerMoves(board)
+            if not moves:
+                break
+            if greedy:
+                rng.shuffle(moves)
+                board = max(moves, key=lambda move: countEmpty(move[1]))[1]
+            else:
+                board = rng.choice(moves)[1]
+            board = self.spawn(board, rng)
+            steps += 1
+        return self.evaluationFunction(layout.state(board))
+
+    def outOfBudget(self, done: int, rollouts: int) -> bool:
+        """
+        Checks if a search that has run `done` rollouts must stop.
+        """
+        if rollouts is not None and done >= rollouts:
+            return True
+        return self.deadline is not None and time.monotonic() > self.deadline
+
+    def rootStatistics(self, board: int, rollouts: int, seed: int, layout) -> dict:
+        """
+        Runs a search from the board, packed with the given `BoardLayout`,
+        with the given rollout budget and returns, for every legal move, its
+        number of rollouts and the sum of their values.
+        """
+        self.layout = layout
+        rng = random.Random(seed)
+        if self.method == 'flat':
+            return self.flatStatistics(board, rollouts, rng)
+        return self.uctStatistics(board, rollouts, rng)
+
+    def flatStatistics(self, board: int, rollouts: int, rng: random.Random) -> dict:
+        """
+        Flat Monte Carlo: gives every legal move the same number of rollouts.
+        """
+        moves = self.layout.playerMoves(board)
+        statistics = {action: [0, 0.0] for action, _ in moves}
+        done = 0
+        while not self.outOfBudget(done, rollouts):
+            action, after = moves[done % len(moves)]
+            value = self.rollout(self.spawn(after, rng), rng)
+            statistics[action][0] += 1
+            statistics[action][1] += value
+            done += 1
+        return statistics
+
+    def uctStatistics(self, board: int, rollouts: int, rng: random.Random) -> dict:
+        """
+        UCT: grows a tree from the board, adding one node per rollout.
+        """
+        root = _DecisionNode(board)
+        stats = self.stats
+        # Values are normalized to [0, 1] with the range seen so far, since
+        # the scale of the evaluation function is unknown
+        low = inf
+        high = -inf
+        done = 0
+        while not self.outOfBudget(done, rollouts):
+            node = root
+            path = []
+            while True:
+                if stats is not None:
+                    stats.nodes[MAX_NODE] += 1
+                if node.untried is None:
+                    node.untried = self.layout.playerMoves(node.board)
+                    rng.shuffle(node.untried)
+                if node.untried:
+                    action, after = node.untried.pop()
+                    child = node.children[action] = _MoveNode(after)
+                elif node.children:
+                    child = self.selectChild(node, low, high)
+                else:
+                    # The game is lost at this node
+                    value = self.evaluationFunction(self.layout.state(node.board))
+                    break
+                path.append((node, child))
+                if stats is not None:
+                    stats.nodes[CHANCE_NODE] += 1
+                spawned = self.spawn(child.board, rng)
+                outcome = child.outcomes.get(spawned)
+                if outcome is None:
+                    child.outcomes[spawned] = _DecisionNode(spawned)
+                    value = self.rollout(spawned, rng)
+                    break
+                node = outcome
+            low = min(low, value)
+            high = max(high, value)
+            for node, child in path:
+                node.visits += 1
+                child.visits += 1
+                child.total += value
+            done += 1
+        return {action: [child.visits, child.total] for action, child in root.children.items()}
+
+    def selectChild(self, node: _DecisionNode, low: float, high: float) -> _MoveNode:
+        """
+        Returns the child of a fully expanded node with the best UCB1 score.
+        """
+        scale = high - low if high > low else 1.0
+        logVisits = log(node.visits)
+        best = None
+        bestScore = -inf
+        for child in node.children.values():
+            score = ((child.total / child.visits - low) / scale
+                     + self.exploration * sqrt(logVisits / child.visits))
+            if score > bestScore:
+                best = child
+                bestScore = score
+        return best
+
+    def getAction(self, gameState: GameState, agentIndex: int = 0) -> int:
+        """
+        Returns the player's move chosen by the Monte Carlo search, or None if
+        it has no legal moves. Raises SearchCancelled if `cancel` is called
+        before the search ends.
+        """
+        if agentIndex != 0:
+            raise ValueError("MonteCarloAgent only plays the player's moves")
+        self.cancelled = False
+        self.deadline = None
+        stats = self.stats
+        if stats is not None:
+            stats.startMove()
+        actions = gameState.getLegalActions(0)
+        self.lastRollouts = 0
+        if len(actions) <= 1:
+            action = actions[0] if actions else None
+        else:
+            board = gameState.getBoardKey()
+            layout = getLayout(gameState.size, gameState.winTile)
+            if self.timeLimit is not None:
+                self.deadline = time.monotonic() + self.timeLimit
+            try:
+                if self.workers:
+                    shares = [None] * self.workers
+                    if self.rollouts is not None:
+                        shares = [len(range(k, self.rollouts, self.workers)) for k in range(self.workers)]
+                    results = self.parallelMap('rootStatistics',
+                                               [(board, share, self.rng.getrandbits(64), layout) for share in shares])
+                else:
+                    results = [self.rootStatistics(board, self.rollouts, self.rng.getrandbits(64), layout)]
+            finally:
+                self.deadline = None
+            if self.cancelled:
+                raise SearchCancelled()
+            statistics = {action: [0, 0.0] for action in actions}
+            for result in results:
+                for move, (visits, total) in result.items():
+                    statistics[move][0] += visits
+                    statistics[move][1] += total
+            self.lastRollouts = sum(visits for visits, _ in statistics.values())
+            action = self.bestAction(actions, statistics)
+        if stats is not None:
+            stats.finishMove(agentIndex, 0)
+        return action
+
+    def bestAction(self, actions: list, statistics: dict) -> int:
+        """
+        Returns the move with the best mean value for flat Monte Carlo, or the
+        most visited one for UCT, taking the first one in `actions` on ties.
+        """
+        def score(action):
+            visits, total = statistics[action]
+            if not visits:
+                return -inf
+            return total / visits if self.method == 'flat' else visits
+        return max(actions, key=score)
+
+
 def evaluationFunction2048(currentGameState: GameState) -> int:
     """
     Evaluation function for 2048 game state.
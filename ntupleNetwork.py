@@ -0,0 +1,412 @@
+"""
+N-tuple network evaluation of 2048 boards, learned by self-play.
+
+An n-tuple network values a board as a sum of table lookups. Each pattern
+is a fixed set of cells, and the tile exponents found in those cells,
+4 bits each, index a table of weights. Every pattern is also applied to
+the eight rotations and reflections of the board, all of them reading the
+same table, so a 6-cell pattern adds 8 lookups in a table of 16**6 weights.
+
+The weights are learned with temporal-difference learning (TD(0) on
+afterstates): the network plays games against random tiles, always taking
+the move with the highest merge score plus value of the board it leaves,
+and moves the value of each such board towards the score and value of the
+next one. The network thus estimates the score the game will still make
+from a board. `trainNetwork` spreads the games over several processes that
+update one copy of the weights in shared memory without locks, as in
+Hogwild!: the rare collisions between updates cost less than they save.
+
+`NTupleEvaluator` uses a trained network as an evaluation function. It
+adds the score already made, which only depends on the tiles on the board,
+so the value of a search leaf estimates the final score of the game.
+
+Weight files start with a 16-byte header followed by, for each pattern, its
+cells and its zlib-compressed float32 table. Most weights of a big network
+are never visited and stay 0, so the files are much smaller than the tables.
+
+Example:
+    python ntupleNetwork.py --games 100000 --workers 8 --output ntuple.weights
+    python tournament.py --evals ntupleNetwork:ntupleEvaluation --depths 1 2
+"""
+
+import argparse
+import os
+import random
+import struct
+import sys
+import time
+import zlib
+from array import array
+
+from bitboardState import emptyCells, playerMoves, symmetries, WIN_EXPONENT
+from gameState import SPAWN_PROBABILITIES
+from rowTables import NUM_ROWS
+from transposition import attachSharedMemory
+
+MAGIC = b'2048NTN\x00'
+VERSION = 1
+
+HEADER = struct.Struct('<8sHH4x')  # magic, version, number of patterns
+PATTERN = struct.Struct('<BI')  # number of cells, size of the compressed table
+
+# Two 6-cell lines and two 2x3 rectangles, by cell index (4 * i + j). The
+# network needs 4 * 16**6 weights (256 MB) and plays well after about 10**5
+# training games.
+DEFAULT_PATTERNS = ((0, 1, 2, 3, 4, 5), (4, 5, 6, 7, 8, 9), (0, 1, 2, 4, 5, 6), (4, 5, 6, 8, 9, 10))
+
+# The outer and inner rows and three 2x2 squares, of 16**4 weights each. It
+# learns an order of magnitude faster but plays weaker.
+SMALL_PATTERNS = ((0, 1, 2, 3), (4, 5, 6, 7), (0, 1, 4, 5), (1, 2, 5, 6), (5, 6, 9, 10))
+
+DEFAULT_WEIGHTS_PATH = os.environ.get('NTUPLE_WEIGHTS', 'ntuple.weights')
+
+_rowScores = None  # Score made to build the tiles of each packed row
+
+
+def getRowScores() -> array:
+    """
+    Returns, for every packed row, the score made by the merges that built
+    its tiles, counting every tile as grown from 2s: a tile of 2**e cost
+    (e - 1) * 2**e points. A merge into 2**e then raises the total by
+    exactly the 2**e points it scores.
+    """
+    global _rowScores
+    if _rowScores is None:
+        scores = array('d', bytes(8 * NUM_ROWS))
+        for row in range(NUM_ROWS):
+            total = 0
+            for j in range(4):
+                exponent = (row >> (4 * j)) & 0xF
+                if exponent > 1:
+                    total += (exponent - 1) << exponent
+            scores[row] = total
+        _rowScores = scores
+    return _rowScores
+
+
+def boardScore(bitboard: int) -> float:
+    """
+    Returns the score made to build the tiles of the board (see `getRowScores`).
+    """
+    scores = _rowScores if _rowScores is not None else getRowScores()
+    return (scores[bitboard & 0xFFFF] + scores[(bitboard >> 16) & 0xFFFF]
+            + scores[(bitboard >> 32) & 0xFFFF] + scores[bitboard >> 48])
+
+
+def _patternRuns(pattern: tuple) -> tuple:
+    """
+    Splits a pattern into runs of consecutive cells, so that its index is
+    read with one shift and mask per run. Returns (shift, mask, position)
+    triples: the run is read from the board at `shift` and stored in the
+    index at `position`.
+    """
+    runs = []
+    start = 0
+    while start < len(pattern):
+        end = start + 1
+        while end < len(pattern) and pattern[end] == pattern[end - 1] + 1:
+            end += 1
+        runs.append((4 * pattern[start], (1 << (4 * (end - start))) - 1, 4 * start))
+        start = end
+    return tuple(runs)
+
+
+class NTupleNetwork:
+    """
+    The weight tables of an n-tuple network, one array per pattern.
+
+    `tables` may be given to use existing arrays or memoryviews of float32
+    weights, like the shared ones of `trainNetwork`.
+    """
+    def __init__(self, patterns: tuple = DEFAULT_PATTERNS, tables: list = None):
+        for pattern in patterns:
+            if not pattern or len(set(pattern)) != len(pattern) or not all(0 <= cell < 16 for cell in pattern):
+                raise ValueError(f"Invalid pattern: {pattern}")
+        self.patterns = tuple(tuple(pattern) for pattern in patterns)
+        self.runs = tuple(_patternRuns(pattern) for pattern in self.patterns)
+        if tables is None:
+            tables = [array('f', bytes(4 << (4 * len(pattern)))) for pattern in self.patterns]
+        self.tables = tables
+        self.features = 8 * len(self.patterns)  # Weights read per board
+
+    def indices(self, bitboard: int) -> list:
+        """
+        Returns the (table, index) pairs of the weights read for a board.
+        """
+        boards = symmetries(bitboard)
+        features = []
+        for table, runs in zip(self.tables, self.runs):
+            for board in boards:
+                index = 0
+                for shift, mask, position in runs:
+                    index |= ((board >> shift) & mask) << position
+                features.append((table, index))
+        return features
+
+    def value(self, bitboard: int) -> float:
+        """
+        Returns the value of a board: the score the network expects the game
+        to make from it.
+        """
+        boards = symmetries(bitboard)
+        total = 0.0
+        for table, runs in zip(self.tables, self.runs):
+            for board in boards:
+                index = 0
+                for shift, mask, position in runs:
+                    index |= ((board >> shift) & mask) << position
+                total += table[index]
+        return total
+
+    def update(self, bitboard: int, target: float, learningRate: float) -> float:
+        """
+        Moves the value of a board towards `target`, spreading the step over
+        all its weights. Returns the error before the update.
+        """
+        features = self.indices(bitboard)
+        error = target - sum(table[index] for table, index in features)
+        step = learningRate * error / self.features
+        for table, index in features:
+            table[index] += step
+        return error
+
+    def bestMove(self, bitboard: int) -> tuple:
+        """
+        Returns the (action, board after the move, merge score) of the move
+        with the highest score plus value, or None if no move is legal.
+        """
+        best = None
+        bestValue = 0.0
+        before = boardScore(bitboard)
+        for action, after in playerMoves(bitboard):
+            reward = boardScore(after) - before
+            value = reward + self.value(after)
+            if best is None or value > bestValue:
+                best = (action, after, reward)
+                bestValue = value
+        return best
+
+    def save(self, path: str):
+        """
+        Writes the patterns and weights to a file.
+        """
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(self.patterns)))
+            for pattern, table in zip(self.patterns, self.tables):
+                weights = array('f', table) if not isinstance(table, array) else table
+                if sys.byteorder == 'big':
+                    weights = array('f', weights)
+                    weights.byteswap()
+                data = zlib.compress(weights.tobytes(), 1)
+                f.write(PATTERN.pack(len(pattern), len(data)))
+                f.write(bytes(pattern))
+                f.write(data)
+
+    @classmethod
+    def load(cls, path: str) -> 'NTupleNetwork':
+        """
+        Reads a network written by `save`.
+        """
+        with open(path, 'rb') as f:
+            data = f.read(HEADER.size)
+            if len(data) != HEADER.size:
+                raise ValueError("Not an n-tuple network file: header too short")
+            magic, version, numPatterns = HEADER.unpack(data)
+            if magic != MAGIC:
+                raise ValueError("Not an n-tuple network file: bad magic")
+            if version != VERSION:
+                raise ValueError(f"Unsupported n-tuple network version: {version}")
+            patterns = []
+            tables = []
+            for _ in range(numPatterns):
+                length, size = PATTERN.unpack(f.read(PATTERN.size))
+                patterns.append(tuple(f.read(length)))
+                table = array('f')
+                table.frombytes(zlib.decompress(f.read(size)))
+                if sys.byteorder == 'big':
+                    table.byteswap()
+                if len(table) != 1 << (4 * length):
+                    raise ValueError("Corrupt n-tuple network file: wrong table size")
+                tables.append(table)
+        return cls(patterns, tables)
+
+
+def spawnTile(bitboard: int, rng: random.Random) -> int:
+    """
+    Returns the board with a random tile in a random empty cell.
+    """
+    cell = rng.choice(emptyCells(bitboard))
+    exponent = 1 if rng.random() < SPAWN_PROBABILITIES[2] else 2
+    return bitboard | (exponent << (4 * cell))
+
+
+def playTrainingGame(network: NTupleNetwork, rng: random.Random, learningRate: float) -> tuple[int, int]:
+    """
+    Plays one game with the moves chosen by the network, learning from it as
+    it goes. Returns the score of the game and its largest tile exponent.
+    """
+    board = spawnTile(spawnTile(0, rng), rng)
+    score = 0
+    previous = None  # Board left by the last move
+    while True:
+        move = network.bestMove(board)
+        if move is None:
+            break
+        _, after, reward = move
+        if previous is not None:
+            network.update(previous, reward + network.value(after), learningRate)
+        previous = after
+        score += reward
+        board = spawnTile(after, rng)
+    if previous is not None:
+        network.update(previous, 0.0, learningRate)  # Nothing more to score after the last move
+    largest = max((board >> (4 * cell)) & 0xF for cell in range(16))
+    return int(score), largest
+
+
+_workerNetwork = None  # Network over the shared weights, in each training process
+_workerBlock = None
+
+
+def _initTrainer(name: str, patterns: tuple):
+    global _workerNetwork, _workerBlock
+    _workerBlock = attachSharedMemory(name)
+    _workerNetwork = NTupleNetwork(patterns, _sharedTables(_workerBlock, patterns))
+
+
+def _sharedTables(block, patterns: tuple) -> list:
+    """
+    Returns float32 views of the tables of the patterns, laid out one after
+    the other in a shared memory block.
+    """
+    weights = block.buf.cast('f')
+    tables = []
+    offset = 0
+    for pattern in patterns:
+        size = 1 << (4 * len(pattern))
+        tables.append(weights[offset:offset + size])
+        offset += size
+    return tables
+
+
+def _trainGames(task: tuple) -> list:
+    first, count, seed, learningRate = task
+    rng = random.Random(seed + first)
+    return [playTrainingGame(_workerNetwork, rng, learningRate) for _ in range(count)]
+
+
+def trainNetwork(network: NTupleNetwork, games: int, learningRate: float = 0.1, workers: int = 1,
+                 seed: int = 0, reportEvery: int = 1000, log=print) -> list:
+    """
+    Trains the network with `games` self-play games over `workers`
+    processes. Every `reportEvery` games, the mean score, the rate of games
+    reaching 2048 and the speed of the last ones are passed to `log`.
+    Returns the (score, largest tile exponent) of every game, in the order
+    they ended.
+    """
+    results = []
+    start = time.perf_counter()
+
+    def report():
+        recent = results[-reportEvery:]
+        meanScore = sum(score for score, _ in recent) / len(recent)
+        wins = sum(largest >= WIN_EXPONENT for _, largest in recent) / len(recent)
+        log(f"{len(results):>8} games  mean score {meanScore:>9.1f}  2048 rate {100 * wins:5.1f} %"
+            f"  {len(results) / (time.perf_counter() - start):.1f} games/s")
+
+    if workers <= 1:
+        rng = random.Random(seed)
+        for _ in range(games):
+            results.append(playTrainingGame(network, rng, learningRate))
+            if reportEvery and len(results) % reportEvery == 0:
+                report()
+        return results
+
+    from multiprocessing import Pool, shared_memory
+    sizes = [len(table) for table in network.tables]
+    block = shared_memory.SharedMemory(create=True, size=4 * sum(sizes))
+    tables = _sharedTables(block, network.patterns)
+    try:
+        for shared, table in zip(tables, network.tables):
+            shared[:] = array('f', table)
+        # Small tasks keep every process busy until the end and the reports regular
+        chunk = max(1, min(reportEvery or games, games) // (4 * workers))
+        tasks = [(first, min(chunk, games - first), seed, learningRate) for first in range(0, games, chunk)]
+        with Pool(processes=workers, initializer=_initTrainer, initargs=(block.name, network.patterns)) as pool:
+            for chunkResults in pool.imap_unordered(_trainGames, tasks):
+                for result in chunkResults:
+                    results.append(result)
+                    if reportEvery and len(results) % reportEvery == 0:
+                        report()
+        for table, shared in zip(network.tables, tables):
+            table[:] = array('f', shared.tobytes())
+    finally:
+        for shared in tables:
+            shared.release()
+        block.close()
+        block.unlink()
+    return results
+
+
+class NTupleEvaluator:
+    """
+    Evaluation function for 2048 game states backed by an n-tuple network:
+    the score made so far plus the score the network expects to come.
+
+    The network is read from `path` the first time the evaluator is used.
+    Lost boards are worth only their score. Only 4x4 boards are supported
+    (`boardSize`); other sizes raise ValueError.
+    """
+    boardSize = 4
+
+    def __init__(self, path: str = DEFAULT_WEIGHTS_PATH, network: NTupleNetwork = None):
+        self.path = path
+        self.network = network
+
+    def getNetwork(self) -> NTupleNetwork:
+        """
+        Returns the network of this evaluator, loading it if needed.
+        """
+        if self.network is None:
+            self.network = NTupleNetwork.load(self.path)
+        return self.network
+
+    def __call__(self, currentGameState) -> float:
+        if currentGameState.size != self.boardSize:
+            raise ValueError("NTupleEvaluator only evaluates 4x4 boards")
+        network = self.network if self.network is not None else self.getNetwork()
+        board = currentGameState.getBoardKey()
+        if currentGameState.isLose():
+            return boardScore(board)
+        return boardScore(board) + network.value(board)
+
+
+# Evaluator of the network in NTUPLE_WEIGHTS (ntuple.weights by default),
+# usable wherever an evaluation function is expected
+ntupleEvaluation = NTupleEvaluator()
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Trains an n-tuple network for 2048 by self-play.")
+    parser.add_argument('--games', type=int, default=10000, help="training games")
+    parser.add_argument('--workers', type=int, default=1, help="processes playing games")
+    parser.add_argument('--learning-rate', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--small', action='store_true', help="use SMALL_PATTERNS instead of DEFAULT_PATTERNS")
+    parser.add_argument('--resume', action='store_true', help="continue training the network in --output")
+    parser.add_argument('--report-every', type=int, default=1000, help="games between progress lines")
+    parser.add_argument('--output', default=DEFAULT_WEIGHTS_PATH, help="weights file (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if args.resume:
+        network = NTupleNetwork.load(args.output)
+    else:
+        network = NTupleNetwork(SMALL_PATTERNS if args.small else DEFAULT_PATTERNS)
+    trainNetwork(network, args.games, learningRate=args.learning_rate, workers=args.workers,
+                 seed=args.seed, reportEvery=args.report_every)
+    network.save(args.output)
+    print(f"Weights written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
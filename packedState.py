@@ -0,0 +1,365 @@
+"""
+Packed board engine for 2048 boards of any size.
+
+A board of n rows and columns is packed like the 4x4 bitboard: cell (i, j)
+is the 4-bit tile exponent at bit 4 * (n * i + j), so row i takes the 4 * n
+bits starting at 4 * n * i and the whole board is a single int, which is
+also its key (see `getBoardKey`). Tiles stop at 32768, as in the other
+engines.
+
+Rows are moved with the row tables of their length (see `getRowTables`):
+precomputed up to 5 cells and filled as rows are met for longer ones.
+Columns are moved as the rows of the transposed board. Transposing spreads
+every row over its column with a table that, like the long row tables, is
+filled as rows are met, so each move costs a few operations per row
+instead of a few per cell.
+
+Everything that depends on the size and the win tile lives in a
+`BoardLayout`, shared by all the states of a game through `getLayout`.
+
+Example:
+    state = PackedGameState(size=6, winTile=4096)
+    state = state.generateSuccessor(1, tileAction(0, 0, 2, size=6))
+"""
+
+from gameState import LEFT, RIGHT, UP, DOWN, checkDimensions, encodeAction
+from rowTables import getRowTables, reverseRow, TILE_VALUES, LEFT_CHANGED, RIGHT_CHANGED
+
+
+class _SpreadTable(dict):
+    """
+    Maps a packed row to the same cells placed down the first column of a
+    board, filled as rows are met.
+    """
+    def __init__(self, size: int):
+        super().__init__()
+        self.size = size
+
+    def __missing__(self, row: int) -> int:
+        size = self.size
+        spread = 0
+        for j in range(size):
+            spread |= ((row >> (4 * j)) & 0xF) << (4 * size * j)
+        self[row] = spread
+        return spread
+
+
+class BoardLayout:
+    """
+    The tables and board operations for one board size and win tile.
+
+    Boards are passed around as packed ints. For 4x4 boards, the layout
+    uses the bitboard functions of bitboardState, and its states are
+    `BitboardGameState`s when the game is won with 2048.
+    """
+    def __init__(self, size: int, winTile: int):
+        checkDimensions(size, winTile)
+        self.size = size
+        self.winTile = winTile
+        self.cells = size * size
+        self.rowMask = (1 << (4 * size)) - 1
+        self.rowShifts = tuple(range(0, 4 * self.cells, 4 * size))
+        self.tables = getRowTables(size)
+        self.spread = _SpreadTable(size)
+        # A 1 in the lowest bit and an 8 in the highest bit of every cell
+        self.lowBits = sum(1 << (4 * cell) for cell in range(self.cells))
+        self.highBits = 8 * self.lowBits
+        self.winPattern = (winTile.bit_length() - 1) * self.lowBits
+        if size == 4:
+            from bitboardState import BitboardGameState, transpose, playerMoves, emptyCells, countEmpty
+            self.transpose = transpose
+            self.playerMoves = playerMoves
+            self.emptyCells = emptyCells
+            self.countEmpty = countEmpty
+            if winTile == 2048:
+                self.state = BitboardGameState
+
+    def __reduce__(self):
+        # Layouts are rebuilt from their parameters, so they pickle without their tables
+        return getLayout, (self.size, self.winTile)
+
+    def state(self, bitboard: int = 0) -> 'PackedGameState':
+        """
+        Returns a game state for a packed board of this layout.
+        """
+        return PackedGameState(bitboard=bitboard, layout=self)
+
+    def transpose(self, bitboard: int) -> int:
+        """
+        Returns the board reflected over its main diagonal.
+        """
+        spread = self.spread
+        rowMask = self.rowMask
+        result = 0
+        for i, shift in enumerate(self.rowShifts):
+            row = (bitboard >> shift) & rowMask
+            if row:
+                result |= spread[row] << (4 * i)
+        return result
+
+    def mirrorRows(self, bitboard: int) -> int:
+        """
+        Returns the board reflected left to right.
+        """
+        size = self.size
+        rowMask = self.rowMask
+        result = 0
+        for shift in self.rowShifts:
+            result |= reverseRow((bitboard >> shift) & rowMask, size) << shift
+        return result
+
+    def mirrorColumns(self, bitboard: int) -> int:
+        """
+        Returns the board reflected top to bottom.
+        """
+        rowMask = self.rowMask
+        result = 0
+        for shift, mirrored in zip(self.rowShifts, reversed(self.rowShifts)):
+            result |= ((bitboard >> shift) & rowMask) << mirrored
+        return result
+
+    def symmetries(self, bitboard: int) -> tuple:
+        """
+        Returns the eight symmetric versions of the board, indexed by
+        transform number as in bitboardState.
+        """
+        transposed = self.transpose(bitboard)
+        rows = self.mirrorRows(bitboard)
+        transposedRows = self.mirrorRows(transposed)
+        return (bitboard, rows, self.mirrorColumns(bitboard), self.mirrorColumns(rows),
+                transposed, transposedRows, self.mirrorColumns(transposed), self.mirrorColumns(transposedRows))
+
+    def canonicalKey(self, bitboard: int) -> tuple[int, int]:
+        """
+        Returns the smallest of the eight symmetric versions of the board and
+        the transform that produces it (see `canonicalKey` of bitboardState).
+        """
+        keys = self.symmetries(bitboard)
+        best = min(keys)
+        return best, keys.index(best)
+
+    def moveRows(self, bitboard: int, table) -> int:
+        """
+        Replaces each row of the board by its entry in `table`.
+        """
+        rowMask = self.rowMask
+        result = 0
+        for shift in self.rowShifts:
+            result |= table[(bitboard >> shift) & rowMask] << shift
+        return result
+
+    def move(self, bitboard: int, action: int) -> int:
+        """
+        Returns the board after the player slides the tiles in the direction
+        given by `action`.
+        """
+        tables = self.tables
+        if action == LEFT:
+            return self.moveRows(bitboard, tables.left)
+        if action == RIGHT:
+            return self.moveRows(bitboard, tables.right)
+        if action == UP:
+            return self.transpose(self.moveRows(self.transpose(bitboard), tables.left))
+        if action == DOWN:
+            return self.transpose(self.moveRows(self.transpose(bitboard), tables.right))
+        return bitboard
+
+    def playerMoves(self, bitboard: int) -> list[tuple[int, int]]:
+        """
+        Returns the (action, board after the move) pairs of the player's
+        legal moves, transposing the board only once.
+        """
+        tables = self.tables
+        moves = []
+        left = self.moveRows(bitboard, tables.left)
+        if left != bitboard:
+            moves.append((LEFT, left))
+        right = self.moveRows(bitboard, tables.right)
+        if right != bitboard:
+            moves.append((RIGHT, right))
+        transposed = self.transpose(bitboard)
+        up = self.moveRows(transposed, tables.left)
+        if up != transposed:
+            moves.append((UP, self.transpose(up)))
+        down = self.moveRows(transposed, tables.right)
+        if down != transposed:
+            moves.append((DOWN, self.transpose(down)))
+        return moves
+
+    def changedFlags(self, bitboard: int) -> int:
+        """
+        Returns the LEFT_CHANGED and RIGHT_CHANGED bits of the moves that
+        change some row of the board.
+        """
+        changed = self.tables.changed
+        rowMask = self.rowMask
+        flags = 0
+        for shift in self.rowShifts:
+            flags |= changed[(bitboard >> shift) & rowMask]
+        return flags
+
+    def emptyCells(self, bitboard: int) -> list[int]:
+        """
+        Returns the indices (size * i + j) of the empty cells of the board.
+        """
+        return [cell for cell in range(self.cells) if not (bitboard >> (4 * cell)) & 0xF]
+
+    def countEmpty(self, bitboard: int) -> int:
+        """
+        Returns the number of empty cells of the board.
+        """
+        x = bitboard | (bitboard >> 1)
+        x = (x | (x >> 2)) & self.lowBits
+        return self.cells - bin(x).count('1')
+
+    def isWin(self, bitboard: int) -> bool:
+        """
+        Checks if some tile of the board is the win tile.
+        """
+        # Same "has zero nibble" trick as BitboardGameState.isWin
+        x = bitboard ^ self.winPattern
+        return ((x - self.lowBits) & ~x & self.highBits) != 0
+
+    def isLose(self, bitboard: int) -> bool:
+        """
+        Checks if the player has no legal moves on the board.
+        """
+        moves = LEFT_CHANGED | RIGHT_CHANGED
+        return not (self.changedFlags(bitboard) & moves or self.changedFlags(self.transpose(bitboard)) & moves)
+
+    def toBoard(self, bitboard: int) -> list[list[int]]:
+        """
+        Unpacks a board into a list of rows of tile values.
+        """
+        size = self.size
+        return [[TILE_VALUES[(bitboard >> (4 * (size * i + j))) & 0xF] for j in range(size)]
+                for i in range(size)]
+
+    def fromBoard(self, board: list[list[int]]) -> int:
+        """
+        Packs a list of rows of tile values into a board.
+        """
+        size = self.size
+        if len(board) != size or any(len(row) != size for row in board):
+            raise ValueError(f"Expected a {size}x{size} board")
+        bitboard = 0
+        for i, row in enumerate(board):
+            for j, value in enumerate(row):
+                if value:
+                    bitboard |= (value.bit_length() - 1) << (4 * (size * i + j))
+        return bitboard
+
+
+_layouts = {}
+
+
+def getLayout(size: int = 4, winTile: int = 2048) -> BoardLayout:
+    """
+    Returns the layout of the given board size and win tile, building its
+    tables on the first call.
+    """
+    layout = _layouts.get((size, winTile))
+    if layout is None:
+        layout = _layouts[(size, winTile)] = BoardLayout(size, winTile)
+    return layout
+
+
+class PackedGameState:
+    """
+    A drop-in replacement for `GameState` for boards of any size, stored as
+    one packed int. `size` and `winTile` are those of its `layout`.
+    """
+    def __init__(self, size: int = 4, winTile: int = 2048, bitboard: int = 0, layout: BoardLayout = None):
+        self.layout = layout if layout is not None else getLayout(size, winTile)
+        self.bitboard = bitboard
+
+    @property
+    def size(self) -> int:
+        return self.layout.size
+
+    @property
+    def winTile(self) -> int:
+        return self.layout.winTile
+
+    @property
+    def board(self) -> list[list[int]]:
+        """
+        The board as a list of rows of tile values. It is rebuilt on every
+        access, so changes to the returned lists are not reflected in the state.
+        """
+        return self.layout.toBoard(self.bitboard)
+
+    @board.setter
+    def board(self, board: list[list[int]]):
+        self.bitboard = self.layout.fromBoard(board)
+
+    def isLose(self) -> bool:
+        """
+        Check if there are no legal moves left
+        """
+        return self.layout.isLose(self.bitboard)
+
+    def isWin(self) -> bool:
+        """
+        Check if there is a tile with value `winTile`
+        """
+        return self.layout.isWin(self.bitboard)
+
+    def getLegalActions(self, agentIndex: int = 0) -> list:
+        """
+        Returns a list of legal actions for the given agent.
+        Agent 0 is the player, Agent 1 is the random tile generator.
+        """
+        layout = self.layout
+        bitboard = self.bitboard
+        actions = []
+        if agentIndex == 0:
+            rowFlags = layout.changedFlags(bitboard)
+            if rowFlags & LEFT_CHANGED:
+                actions.append(LEFT)
+            if rowFlags & RIGHT_CHANGED:
+                actions.append(RIGHT)
+            columnFlags = layout.changedFlags(layout.transpose(bitboard))
+            if columnFlags & LEFT_CHANGED:
+                actions.append(UP)
+            if columnFlags & RIGHT_CHANGED:
+                actions.append(DOWN)
+        elif agentIndex == 1:
+            for cell in layout.emptyCells(bitboard):
+                actions.append((cell << 4) | 1)  # A 2
+                actions.append((cell << 4) | 2)  # A 4
+        return actions
+
+    def generateSuccessor(self, agentIndex: int, action: int) -> 'PackedGameState':
+        """
+        Returns the successor game state after the given agent takes the given action.
+        Actions written as strings are also accepted (see `encodeAction`).
+        """
+        layout = self.layout
+        if isinstance(action, str):
+            action = encodeAction(agentIndex, action, layout.size)
+        if agentIndex == 0:
+            return PackedGameState(bitboard=layout.move(self.bitboard, action), layout=layout)
+        # The low nibble of a tile action is the exponent and the rest is the cell
+        return PackedGameState(bitboard=self.bitboard | ((action & 0xF) << (4 * (action >> 4))), layout=layout)
+
+    def getBoardKey(self) -> int:
+        """
+        Returns the packed board, which is already a hashable key.
+        """
+        return self.bitboard
+
+    def getCanonicalKey(self) -> tuple[int, int]:
+        """
+        Returns the board key shared by all the rotations and reflections of
+        this board, and the transform that maps this board onto it. Actions
+        are mapped between both boards with `transformAction` and
+        `untransformAction` of bitboardState, passing the board size.
+        """
+        return self.layout.canonicalKey(self.bitboard)
+
+    def getNumAgents(self) -> int:
+        """
+        Returns the number of agents in the game. 2048 has two agents.
+        """
+        return 2  # Player and random tile generator
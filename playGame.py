@@ -8,21 +8,31 @@ mientras que la computadora coloca nuevas fichas en el tablero de acuerdo a un m
 import tkinter as tk
 import random
 import time
-from gameState import GameState
+from gameState import createGameState, LEFT, RIGHT, UP, DOWN, tileAction, SPAWN_PROBABILITIES
 from multiAgent import AlphaBetaAgent, evaluationFunction2048
+from transposition import TranspositionTable
+from backgroundSearch import BackgroundSearch
 from gameUI import start_ui
 
 class InteractiveGame:
-    def __init__(self, master, app, computer_mode='random', agent_depth=2):
+    def __init__(self, master, app, computer_mode='random', agent_depth=2, size=4, win_tile=2048):
         self.master = master
         self.app = app
-        self.gameState = GameState()
+        # Los tableros de otros tamaños usan el motor empaquetado, que es más rápido
+        engine = 'list' if size == 4 else 'packed'
+        self.gameState = createGameState(engine, size, win_tile)
         
         # --- Configuración del modo de juego ---
         self.computer_mode = computer_mode
         if self.computer_mode == 'alphabeta':
-            self.computer_agent = AlphaBetaAgent(evalFn=evaluationFunction2048, depth=agent_depth)
+            # La tabla de transposición se conserva entre turnos
+            self.computer_agent = AlphaBetaAgent(evalFn=evaluationFunction2048, depth=agent_depth,
+                                                 cache=TranspositionTable())
             self.computer_agent.index = 1 
+            # El agente busca en segundo plano para que la ventana no se congele
+            self.search = BackgroundSearch(master, self.computer_agent)
+        else:
+            self.search = None
         
         self.score = 0
         self.bind_keys()
@@ -42,18 +52,24 @@ class InteractiveGame:
         """ Maneja el evento de presionar una tecla. """
         key = event.keysym
         action = None
+
+        if self.search is not None and self.search.running:
+            # Escape cancela la búsqueda del agente; las demás teclas esperan a que termine
+            if key == 'Escape':
+                self.search.cancel()
+            return
         
         # Mapeo de teclas a acciones
         if key in ['Up', 'w', 'W']:
-            action = 'Up'
+            action = UP
         elif key in ['Down', 's', 'S']:
-            action = 'Down'
+            action = DOWN
         elif key in ['Left', 'a', 'A']:
-            action = 'Left'
+            action = LEFT
         elif key in ['Right', 'd', 'D']:
-            action = 'Right'
+            action = RIGHT
         
-        if action and action in self.gameState.getLegalActions(0):
+        if action is not None and action in self.gameState.getLegalActions(0):
             # 1. El jugador realiza su movimiento
             self.gameState = self.gameState.generateSuccessor(0, action)
             self.update_ui()
@@ -70,34 +86,50 @@ class InteractiveGame:
             self.add_random_tile()
         elif self.computer_mode == 'alphabeta':
             self.add_alphabeta_tile()
+            return  # La ficha se coloca cuando termina la búsqueda
         
         self.update_ui()
         self.check_game_over()
 
     def add_random_tile(self):
         """ Añade una ficha (2 o 4) en una celda vacía al azar. """
+        board = self.gameState.board
+        size = self.gameState.size
         empty_cells = []
-        for i in range(4):
-            for j in range(4):
-                if self.gameState.board[i][j] == 0:
+        for i in range(size):
+            for j in range(size):
+                if board[i][j] == 0:
                     empty_cells.append((i, j))
         
         if empty_cells:
             i, j = random.choice(empty_cells)
-            value = 2 if random.random() < 0.9 else 4
-            self.gameState.board[i][j] = value
+            value = 2 if random.random() < SPAWN_PROBABILITIES[2] else 4
+            self.gameState = self.gameState.generateSuccessor(1, tileAction(i, j, value, size))
 
     def add_alphabeta_tile(self):
-        """ El agente Alpha-Beta elige dónde colocar la siguiente ficha. """
-        action = self.computer_agent.getAction(self.gameState, agentIndex=1)
-        if action:
+        """
+        El agente Alpha-Beta elige dónde colocar la siguiente ficha, en segundo plano.
+        Si se cancela la búsqueda, la ficha se coloca al azar.
+        """
+        self.search.start(self.gameState, 1, self.place_agent_tile, onCancel=self.place_random_tile)
+
+    def place_agent_tile(self, action):
+        """ Coloca la ficha elegida por el agente. """
+        if action is not None:
             self.gameState = self.gameState.generateSuccessor(1, action)
+        self.update_ui()
+        self.check_game_over()
+
+    def place_random_tile(self):
+        """ Coloca una ficha al azar en lugar de la del agente. """
+        self.add_random_tile()
+        self.update_ui()
+        self.check_game_over()
 
     def update_ui(self):
         """ Actualiza el tablero y la puntuación en la interfaz gráfica. """
         self.score = sum(sum(row) for row in self.gameState.board)
-        self.app.update_board(self.gameState.board, self.score)
-        self.master.update()
+        self.app.show_board(self.gameState.board, self.score)
 
     def check_game_over(self):
         """ Verifica si el juego ha terminado (victoria o derrota). """
@@ -114,9 +146,12 @@ class InteractiveGame:
 if __name__ == '__main__':
     # --- Configuración ---
     COMPUTER_MODE = 'random'  # Cambia a 'alphabeta' para un desafío mayor
-    AGENT_DEPTH = 2  # Profundidad para el agente Alpha-Beta
+    AGENT_DEPTH = 2  # Profundidad para el agente Alpha-Beta (3 sigue respondiendo al instante)
+    BOARD_SIZE = 4  # Filas y columnas del tablero
+    WIN_TILE = 2048  # Ficha con la que se gana
 
     # --- Iniciar UI y Juego ---
-    root, app = start_ui()
-    game = InteractiveGame(root, app, computer_mode=COMPUTER_MODE, agent_depth=AGENT_DEPTH)
+    root, app = start_ui(size=BOARD_SIZE)
+    game = InteractiveGame(root, app, computer_mode=COMPUTER_MODE, agent_depth=AGENT_DEPTH,
+                           size=BOARD_SIZE, win_tile=WIN_TILE)
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,154 @@
+"""
+Persistent store of search results shared between processes and runs.
+
+A `PolicyStore` keeps, in a local SQLite database, the action chosen and
+the value found by a search for each (canonical board, depth, agent). An
+agent created with a store looks the position up before searching and
+saves every new result, so later games, and other processes using the
+same file, start warm.
+
+Boards are stored by their canonical key (see `getCanonicalKey`) and
+actions relative to the canonical board, so the eight rotations and
+reflections of a position share one entry. Like `symmetricCache`, this is
+only valid for evaluation functions that give symmetric boards the same
+value. Results of different agents or evaluation functions must not be
+mixed, so each configuration uses its own `namespace` within the file.
+
+The store is capped at `maxEntries` positions. When it grows past the cap,
+`compact` keeps the most used and deepest entries and drops the rest.
+"""
+
+import sqlite3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS namespaces (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS positions (
+    namespace INTEGER NOT NULL,
+    board INTEGER NOT NULL,
+    depth INTEGER NOT NULL,
+    agent INTEGER NOT NULL,
+    action INTEGER NOT NULL,
+    value REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (namespace, board, depth, agent)
+) WITHOUT ROWID;
+"""
+
+
+def _toSigned(board: int) -> int:
+    """
+    Converts a 64-bit board key to the signed range of SQLite integers.
+    """
+    return board - (1 << 64) if board >= 1 << 63 else board
+
+
+class PolicyStore:
+    """
+    An on-disk map from (canonical board, depth, agent) to (action, value).
+
+    Writes are grouped into transactions of `commitEvery` new entries; call
+    `commit` or `close` to save the rest.
+    """
+    def __init__(self, path: str, namespace: str = 'default', maxEntries: int = 1_000_000,
+                 commitEvery: int = 1000):
+        self.path = path
+        self.namespaceName = namespace
+        self.maxEntries = maxEntries
+        self.commitEvery = commitEvery
+        self.hits = 0
+        self.misses = 0
+        self.pendingStores = 0
+        self.pendingHits = {}
+        self.connection = sqlite3.connect(path, timeout=60)
+        # WAL lets several processes read while one of them writes
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(_SCHEMA)
+        self.connection.execute('INSERT OR IGNORE INTO namespaces (name) VALUES (?)', (namespace,))
+        self.namespace = self.connection.execute('SELECT id FROM namespaces WHERE name = ?',
+                                                 (namespace,)).fetchone()[0]
+        self.connection.commit()
+
+    def __enter__(self) -> 'PolicyStore':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        """
+        Returns the number of entries of all the namespaces in the file.
+        """
+        return self.connection.execute('SELECT COUNT(*) FROM positions').fetchone()[0]
+
+    def lookup(self, board: int, depth: int, agentIndex: int):
+        """
+        Returns the stored (action, value) of a canonical board, or None if
+        it has not been searched to that depth.
+        """
+        key = (self.namespace, _toSigned(board), depth, agentIndex)
+        row = self.connection.execute(
+            'SELECT action, value FROM positions WHERE namespace = ? AND board = ? AND depth = ? AND agent = ?',
+            key).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.pendingHits[key] = self.pendingHits.get(key, 0) + 1
+        return row
+
+    def store(self, board: int, depth: int, agentIndex: int, action: int, value: float):
+        """
+        Saves the result of a search of a canonical board.
+        """
+        self.connection.execute(
+            'INSERT OR REPLACE INTO positions (namespace, board, depth, agent, action, value) VALUES (?, ?, ?, ?, ?, ?)',
+            (self.namespace, _toSigned(board), depth, agentIndex, action, value))
+        self.pendingStores += 1
+        if self.pendingStores >= self.commitEvery:
+            self.commit()
+
+    def commit(self):
+        """
+        Saves the pending entries and hit counts, compacting the store if it
+        has grown past `maxEntries`.
+        """
+        if self.pendingHits:
+            self.connection.executemany(
+                'UPDATE positions SET hits = hits + ? WHERE namespace = ? AND board = ? AND depth = ? AND agent = ?',
+                [(count, *key) for key, count in self.pendingHits.items()])
+            self.pendingHits = {}
+        stored = self.pendingStores
+        self.pendingStores = 0
+        self.connection.commit()
+        if stored and len(self) > self.maxEntries:
+            self.compact()
+
+    def compact(self, maxEntries: int = None, vacuum: bool = False):
+        """
+        Keeps at most `maxEntries` entries (self.maxEntries by default),
+        dropping the least used ones and, among those, the shallowest. With
+        vacuum=True the file is also rewritten to give the space back.
+        """
+        maxEntries = self.maxEntries if maxEntries is None else maxEntries
+        excess = len(self) - maxEntries
+        if excess > 0:
+            self.connection.execute(
+                'DELETE FROM positions WHERE (namespace, board, depth, agent) IN '
+                '(SELECT namespace, board, depth, agent FROM positions ORDER BY hits, depth LIMIT ?)',
+                (excess,))
+            self.connection.commit()
+        if vacuum:
+            self.connection.execute('VACUUM')
+
+    def close(self):
+        """
+        Saves the pending work and closes the database.
+        """
+        if self.connection is not None:
+            self.commit()
+            self.connection.close()
+            self.connection = None
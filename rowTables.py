@@ -0,0 +1,245 @@
+"""
+Precomputed transition tables for every possible 4-cell row of 2048.
+
+A row is packed as four 4-bit tile exponents (the leftmost cell in the lowest
+nibble), so there are only 65536 different rows. For each of them the tables
+hold the row after a move to the left and to the right, the score gained by
+the merges and whether the move changes the row at all. Up and Down moves use
+the same tables on the columns of the board.
+
+The tables are built once per process, the first time `getRowTables` is
+called, and saved to a cache file so that later processes only need to read
+it back. The cache location can be changed with the ROW_TABLES_CACHE
+environment variable; setting it to an empty string disables the file.
+
+Boards of other sizes use rows of `size` cells, packed the same way. Up to
+MAX_TABLE_SIZE cells (16**5 rows, 13 MB of tables) they get the same
+precomputed tables, cached in a file next to the 4-cell one. Longer rows
+have too many combinations to precompute, and their tables are filled in
+as rows are met, which only ever happens for a small fraction of them.
+"""
+
+import os
+from array import array
+
+NUM_ROWS = 1 << 16
+MAX_EXPONENT = 0xF  # 2 ** 15 == 32768 is the largest tile a nibble can hold
+MAX_TABLE_SIZE = 5  # Longest rows with fully precomputed tables
+
+# Tile value for each exponent and the other way around
+TILE_VALUES = [0] + [1 << e for e in range(1, MAX_EXPONENT + 1)]
+TILE_EXPONENTS = {value: e for e, value in enumerate(TILE_VALUES)}
+
+# Bits of `RowTables.changed`
+LEFT_CHANGED = 1
+RIGHT_CHANGED = 2
+
+_CACHE_VERSION = 1
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.expanduser('~'), '.cache', '2048_agent', f'rowTables-v{_CACHE_VERSION}.bin'
+)
+
+
+class RowTables:
+    """
+    The row transition tables, indexed by packed row.
+
+    left[row] and right[row] are the packed rows after moving, score[row] is
+    the sum of the tiles created by merges (it is the same for both
+    directions) and changed[row] has the LEFT_CHANGED and RIGHT_CHANGED bits
+    set when the corresponding move alters the row.
+    """
+    def __init__(self, left: array, right: array, score: array, changed: bytearray):
+        self.left = left
+        self.right = right
+        self.score = score
+        self.changed = changed
+
+
+class LazyRowTables:
+    """
+    Row tables for rows too long to precompute, with the same interface as
+    `RowTables`. Each row is computed the first time any table is indexed
+    with it.
+    """
+    def __init__(self, size: int):
+        self.size = size
+        self.left = _LazyTable(self)
+        self.right = _LazyTable(self)
+        self.score = _LazyTable(self)
+        self.changed = _LazyTable(self)
+
+    def fill(self, row: int):
+        """
+        Computes the entries of a row in all the tables.
+        """
+        size = self.size
+        moved, gained = _slideLeft(row, size)
+        flags = LEFT_CHANGED if moved != row else 0
+        self.left[row] = moved
+        self.score[row] = gained
+        moved = reverseRow(_slideLeft(reverseRow(row, size), size)[0], size)
+        self.right[row] = moved
+        if moved != row:
+            flags |= RIGHT_CHANGED
+        self.changed[row] = flags
+
+
+class _LazyTable(dict):
+    def __init__(self, tables: LazyRowTables):
+        super().__init__()
+        self.tables = tables
+
+    def __missing__(self, row: int) -> int:
+        self.tables.fill(row)
+        return self[row]
+
+
+def reverseRow(row: int, size: int = 4) -> int:
+    """
+    Returns the packed row with its cells in reverse order.
+    """
+    if size == 4:
+        return ((row & 0xF) << 12) | ((row & 0xF0) << 4) | ((row >> 4) & 0xF0) | (row >> 12)
+    reversed_row = 0
+    for j in range(size):
+        reversed_row = (reversed_row << 4) | ((row >> (4 * j)) & 0xF)
+    return reversed_row
+
+
+def _slideLeft(row: int, size: int = 4) -> tuple[int, int]:
+    """
+    Slides a packed row to the left, returning the new row and the score gained.
+    Two 32768 tiles merge into another 32768, as a nibble cannot hold more.
+    """
+    filtered = [e for e in ((row >> (4 * j)) & 0xF for j in range(size)) if e != 0]
+    merged = []
+    score = 0
+    skip = False
+    for j in range(len(filtered)):
+        if skip:
+            skip = False
+            continue
+        if j + 1 < len(filtered) and filtered[j] == filtered[j + 1]:
+            exponent = min(filtered[j] + 1, MAX_EXPONENT)
+            merged.append(exponent)
+            score += TILE_VALUES[exponent]
+            skip = True
+        else:
+            merged.append(filtered[j])
+    result = 0
+    for j, exponent in enumerate(merged):
+        result |= exponent << (4 * j)
+    return result, score
+
+
+def _rowTypecode(size: int) -> str:
+    """
+    Returns the array typecode that holds the packed rows of a size.
+    """
+    return 'H' if size <= 4 else 'I'
+
+
+def buildRowTables(size: int = 4) -> RowTables:
+    """
+    Computes the tables for all the rows of `size` cells (65536 for 4 cells).
+    """
+    numRows = 1 << (4 * size)
+    typecode = _rowTypecode(size)
+    left = array(typecode, bytes(array(typecode).itemsize * numRows))
+    right = array(typecode, bytes(array(typecode).itemsize * numRows))
+    score = array('I', bytes(array('I').itemsize * numRows))
+    changed = bytearray(numRows)
+    for row in range(numRows):
+        moved, gained = _slideLeft(row, size)
+        left[row] = moved
+        score[row] = gained
+        if moved != row:
+            changed[row] |= LEFT_CHANGED
+        reversed_row = reverseRow(row, size)
+        moved = reverseRow(_slideLeft(reversed_row, size)[0], size)
+        right[row] = moved
+        if moved != row:
+            changed[row] |= RIGHT_CHANGED
+    return RowTables(left, right, score, changed)
+
+
+def _loadRowTables(path: str, size: int = 4):
+    """
+    Reads the tables from a cache file, returning None if it is missing or corrupt.
+    """
+    numRows = 1 << (4 * size)
+    try:
+        with open(path, 'rb') as f:
+            left = array(_rowTypecode(size))
+            right = array(_rowTypecode(size))
+            score = array('I')
+            left.fromfile(f, numRows)
+            right.fromfile(f, numRows)
+            score.fromfile(f, numRows)
+            changed = bytearray(f.read(numRows))
+    except (OSError, EOFError):
+        return None
+    if len(changed) != numRows:
+        return None
+    return RowTables(left, right, score, changed)
+
+
+def _saveRowTables(tables: RowTables, path: str):
+    """
+    Writes the tables to a cache file. Failures are ignored, since the cache
+    only saves startup time.
+    """
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so that concurrent workers never
+        # read a half written cache
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            tables.left.tofile(f)
+            tables.right.tofile(f)
+            tables.score.tofile(f)
+            f.write(tables.changed)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+_tables = None
+_sizedTables = {}  # Tables of the other row sizes, by size
+
+
+def getRowTables(size: int = 4) -> RowTables:
+    """
+    Returns the row tables for rows of `size` cells, loading or building
+    them on the first call.
+    """
+    global _tables
+    if size == 4:
+        if _tables is None:
+            path = os.environ.get('ROW_TABLES_CACHE', DEFAULT_CACHE_PATH)
+            tables = _loadRowTables(path) if path else None
+            if tables is None:
+                tables = buildRowTables()
+                if path:
+                    _saveRowTables(tables, path)
+            _tables = tables
+        return _tables
+    tables = _sizedTables.get(size)
+    if tables is None:
+        if size < 2:
+            raise ValueError(f"Rows need at least 2 cells, not {size}")
+        if size > MAX_TABLE_SIZE:
+            tables = LazyRowTables(size)
+        else:
+            path = os.environ.get('ROW_TABLES_CACHE', DEFAULT_CACHE_PATH)
+            if path:
+                root, extension = os.path.splitext(path)
+                path = f"{root}-{size}{extension}"
+            tables = _loadRowTables(path, size) if path else None
+            if tables is None:
+                tables = buildRowTables(size)
+                if path:
+                    _saveRowTables(tables, path)
+        _sizedTables[size] = tables
+    return tables
@@ -0,0 +1,217 @@
+"""
+Headless tournament runner.
+
+Plays many games for every combination of agent, depth and evaluation
+function, spreading them over all the cores of the machine, and prints a
+summary with the score, the distribution of the maximum tile, the moves per
+second and percentiles of the time taken by each move.
+
+Game number k of every configuration uses the spawn seed `seed + k`, so all
+configurations play the same sequences of random tiles and a run can be
+repeated exactly.
+
+With --policy-store, the agents share a persistent store of searched
+positions (see policyStore.py), one namespace per agent and evaluation
+function, so later runs skip the positions earlier ones already searched.
+With --shared-cache, the games of every configuration share one
+transposition table in shared memory (see `SharedTranspositionTable`).
+With --size and --win-tile, the games are played on larger (or smaller)
+boards, by default with the packed engine (see packedState.py).
+
+Example:
+    python tournament.py --agents expectimax alphabeta --depths 1 2 --games 1000 --engine bitboard
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+from collections import Counter
+from multiprocessing import Pool
+
+from agentRegistry import AGENTS, loadEvaluationFunction
+from game import GameNoUI
+from gameState import checkDimensions
+from instrumentation import percentile
+from policyStore import PolicyStore
+from transposition import SharedTranspositionTable
+
+_policyStores = {}  # Open stores of this process, by (path, namespace)
+_sharedCaches = {}  # Shared tables this process is attached to, by name
+
+
+def getPolicyStore(path: str, namespace: str) -> PolicyStore:
+    """
+    Returns the policy store of the given file and namespace, opening it
+    once per process.
+    """
+    if (path, namespace) not in _policyStores:
+        _policyStores[path, namespace] = PolicyStore(path, namespace=namespace)
+    return _policyStores[path, namespace]
+
+
+def getSharedCache(name: str) -> SharedTranspositionTable:
+    """
+    Returns the shared table with the given name, attaching to it once per process.
+    """
+    if name not in _sharedCaches:
+        _sharedCaches[name] = SharedTranspositionTable(name=name)
+    return _sharedCaches[name]
+
+
+def playGame(task: tuple) -> dict:
+    """
+    Plays one game for a configuration (agent, depth, evaluation function,
+    engine, board size, win tile) with the given spawn seed and returns its
+    statistics.
+    """
+    config, seed, storePath, cacheName = task
+    agentName, depth, evalName, engine, size, winTile = config
+    store = getPolicyStore(storePath, f"{agentName}:{evalName}") if storePath else None
+    kwargs = {'cache': getSharedCache(cacheName)} if cacheName else {}
+    agent = AGENTS[agentName](evalFn=loadEvaluationFunction(evalName), depth=depth, policyStore=store, **kwargs)
+    game = GameNoUI(agent, engine=engine, rng=random.Random(seed), verbose=False, size=size, win_tile=winTile)
+    start = time.perf_counter()
+    score = game.run()
+    elapsed = time.perf_counter() - start
+    if store is not None:
+        store.commit()
+    return {
+        'config': config,
+        'seed': seed,
+        'score': score,
+        'maxTile': game.getMaxTile(),
+        'win': game.gameState.isWin(),
+        'moves': len(game.moveTimes),
+        'time': elapsed,
+        'moveTimes': game.moveTimes,
+    }
+
+
+def summarize(config: tuple, results: list) -> dict:
+    """
+    Aggregates the results of all the games of one configuration.
+    """
+    agentName, depth, evalName, engine, size, winTile = config
+    scores = [result['score'] for result in results]
+    moves = sum(result['moves'] for result in results)
+    totalTime = sum(result['time'] for result in results)
+    moveTimes = sorted(t for result in results for t in result['moveTimes'])
+    maxTiles = Counter(result['maxTile'] for result in results)
+    return {
+        'agent': agentName,
+        'depth': depth,
+        'evalFn': evalName,
+        'engine': engine,
+        'size': size,
+        'winTile': winTile,
+        'games': len(results),
+        'meanScore': sum(scores) / len(scores),
+        'minScore': min(scores),
+        'maxScore': max(scores),
+        'winRate': sum(result['win'] for result in results) / len(results),
+        'maxTiles': {str(tile): maxTiles[tile] for tile in sorted(maxTiles)},
+        'movesPerSecond': moves / totalTime if totalTime else 0.0,
+        'latencyMs': {
+            'p50': 1000 * percentile(moveTimes, 50),
+            'p90': 1000 * percentile(moveTimes, 90),
+            'p99': 1000 * percentile(moveTimes, 99),
+            'max': 1000 * moveTimes[-1] if moveTimes else 0.0,
+        },
+    }
+
+
+def runTournament(configs: list, games: int, seed: int = 0, workers: int = None, policyStore: str = None,
+                  sharedCache: int = None) -> list:
+    """
+    Plays `games` games for each configuration over a pool of `workers`
+    processes (all cores by default) and returns one summary per configuration.
+    With `policyStore`, the agents use the policy store in that file. With
+    `sharedCache`, the games of each configuration share a transposition
+    table in shared memory with that many entries.
+    """
+    caches = {config: SharedTranspositionTable(sharedCache) for config in configs} if sharedCache else {}
+    tasks = [(config, seed + k, policyStore, caches[config].name if caches else None)
+             for config in configs for k in range(games)]
+    results = {config: [] for config in configs}
+    try:
+        with Pool(processes=workers or os.cpu_count()) as pool:
+            for result in pool.imap_unordered(playGame, tasks):
+                results[result['config']].append(result)
+    finally:
+        for cache in caches.values():
+            cache.close()
+            cache.unlink()
+    return [summarize(config, results[config]) for config in configs]
+
+
+def formatSummary(summaries: list) -> str:
+    """
+    Formats the summaries as a text table.
+    """
+    header = (f"{'agent':<11}{'depth':>6}  {'evalFn':<32}{'engine':<9}{'board':<6}{'games':>6}{'mean':>9}{'win%':>7}"
+              f"{'moves/s':>10}{'p50ms':>8}{'p90ms':>8}{'p99ms':>9}  max tiles")
+    lines = [header, '-' * len(header)]
+    for summary in summaries:
+        latency = summary['latencyMs']
+        tiles = ' '.join(f"{tile}:{count}" for tile, count in summary['maxTiles'].items())
+        lines.append(
+            f"{summary['agent']:<11}{summary['depth']:>6}  {summary['evalFn']:<32}{summary['engine']:<9}"
+            f"{str(summary['size']) + 'x' + str(summary['size']):<6}"
+            f"{summary['games']:>6}{summary['meanScore']:>9.1f}{100 * summary['winRate']:>7.1f}"
+            f"{summary['movesPerSecond']:>10.1f}{latency['p50']:>8.2f}{latency['p90']:>8.2f}{latency['p99']:>9.2f}"
+            f"  {tiles}"
+        )
+    return '\n'.join(lines)
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Plays a tournament of 2048 agents without UI.")
+    parser.add_argument('--agents', nargs='+', choices=sorted(AGENTS), default=['expectimax'])
+    parser.add_argument('--depths', nargs='+', type=int, default=[2])
+    parser.add_argument('--evals', nargs='+', default=['evaluationFunction2048'],
+                        help="evaluation functions from multiAgent, or as module:name")
+    parser.add_argument('--engine', choices=['list', 'bitboard', 'packed'], default=None,
+                        help="board engine (default: bitboard for 4x4 games to 2048, packed otherwise)")
+    parser.add_argument('--size', type=int, default=4, help="rows and columns of the board (default: 4)")
+    parser.add_argument('--win-tile', type=int, default=2048, help="tile that wins the game (default: 2048)")
+    parser.add_argument('--games', type=int, default=100, help="games per configuration")
+    parser.add_argument('--seed', type=int, default=0, help="spawn seed of the first game")
+    parser.add_argument('--workers', type=int, default=None, help="processes to use (default: all cores)")
+    parser.add_argument('--output', help="also write the summaries to this JSON file")
+    parser.add_argument('--policy-store', help="persistent store of searched positions shared by the agents")
+    parser.add_argument('--shared-cache', type=int, default=None, metavar='ENTRIES',
+                        help="share a transposition table of this size between the games of each configuration")
+    args = parser.parse_args(argv)
+    if args.shared_cache and 'minimax' in args.agents:
+        parser.error("--shared-cache needs agents with a transposition cache (alphabeta, expectimax)")
+    try:
+        checkDimensions(args.size, args.win_tile)
+    except ValueError as e:
+        parser.error(str(e))
+    classic = args.size == 4 and args.win_tile == 2048
+    engine = args.engine or ('bitboard' if classic else 'packed')
+    if engine == 'bitboard' and not classic:
+        parser.error("the bitboard engine only plays 4x4 games to 2048; use --engine packed")
+    if args.size != 4 and (args.shared_cache or args.policy_store):
+        parser.error("--shared-cache and --policy-store only hold 4x4 boards")
+
+    configs = [(agent, depth, evalName, engine, args.size, args.win_tile)
+               for agent in args.agents for depth in args.depths for evalName in args.evals]
+    for evalName in args.evals:
+        evalFn = loadEvaluationFunction(evalName)  # Fail early on a wrong name
+        if getattr(evalFn, 'boardSize', args.size) != args.size:
+            parser.error(f"{evalName} only evaluates {evalFn.boardSize}x{evalFn.boardSize} boards")
+    start = time.perf_counter()
+    summaries = runTournament(configs, args.games, seed=args.seed, workers=args.workers,
+                              policyStore=args.policy_store, sharedCache=args.shared_cache)
+    print(formatSummary(summaries))
+    print(f"\n{len(configs) * args.games} games in {time.perf_counter() - start:.1f} s")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summaries, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
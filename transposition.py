@@ -0,0 +1,280 @@
+"""
+Transposition tables for the search agents.
+
+Entries are keyed by the packed board (see `getBoardKey`), the remaining
+search depth and the type of node, since the same board is worth different
+amounts at a max node and at a chance node.
+
+Searches with alpha-beta pruning only learn bounds on the value of the nodes
+that fall outside their window, so their entries also record which kind of
+value they hold: EXACT, LOWER_BOUND (the true value is at least the stored
+one) or UPPER_BOUND (it is at most the stored one).
+
+`TranspositionTable` lives in the memory of one process. `SharedTranspositionTable`
+keeps fixed-width entries in a block of `multiprocessing.shared_memory`, so
+every process on the machine that attaches to it, like the workers of an
+agent or the games of a tournament, reuses the work of the others.
+"""
+
+import struct
+from collections import OrderedDict
+from itertools import islice
+
+MAX_NODE = 0
+MIN_NODE = 1
+CHANCE_NODE = 2
+
+# Kinds of value stored by alpha-beta searches
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+# Rough memory used by one entry: the OrderedDict node, the key tuple and the
+# stored value. Only used to turn a byte cap into an entry cap.
+ENTRY_BYTES = 200
+
+# Number of least recently used entries examined by the 'depth' policy
+EVICTION_SAMPLE = 8
+
+
+class TranspositionTable:
+    """
+    A bounded cache of search results.
+
+    When the table is full, the 'lru' policy evicts the least recently used
+    entry, while the 'depth' policy evicts the shallowest of the
+    EVICTION_SAMPLE least recently used entries, keeping the results that
+    were most expensive to compute.
+    """
+    def __init__(self, maxEntries: int = 1_000_000, maxBytes: int = None, policy: str = 'lru'):
+        if policy not in ('lru', 'depth'):
+            raise ValueError(f"Unknown eviction policy: {policy}")
+        if maxBytes is not None:
+            maxEntries = min(maxEntries, maxBytes // ENTRY_BYTES)
+        self.maxEntries = max(1, maxEntries)
+        self.policy = policy
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def lookup(self, board: int, depth: int, nodeType: int, count: bool = True):
+        """
+        Returns the stored entry for the given position, or None if there is none.
+        With count=False the lookup is left out of the hit and miss counters.
+        """
+        key = (board, depth, nodeType)
+        entry = self.entries.get(key)
+        if entry is None:
+            if count:
+                self.misses += 1
+            return None
+        if count:
+            self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def store(self, board: int, depth: int, nodeType: int, entry):
+        """
+        Stores an entry for the given position, evicting another one if the table is full.
+        """
+        key = (board, depth, nodeType)
+        entries = self.entries
+        if key not in entries and len(entries) >= self.maxEntries:
+            if self.policy == 'lru':
+                entries.popitem(last=False)
+            else:
+                victim = min(islice(entries, EVICTION_SAMPLE), key=lambda k: k[1])
+                del entries[victim]
+        entries[key] = entry
+        entries.move_to_end(key)
+
+    def clear(self):
+        """
+        Removes all entries and resets the counters.
+        """
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+# Slots of the shared table: the check word, the metadata word and the bits of
+# the value as a double. The check word is board ^ metadata ^ value bits, so a
+# slot torn by two processes writing at once no longer matches its board and
+# reads as a miss.
+SLOT = struct.Struct('<QQQ')
+_BITS = struct.Struct('<Q')
+_DOUBLE = struct.Struct('<d')
+
+# Fields of the metadata word: depth in bits 0-15, node type in bits 16-23,
+# bound kind in bits 24-31, best action in bits 32-47 and flags above
+POSITION_MASK = 0xFFFFFF  # Depth and node type
+OCCUPIED = 1 << 48
+TUPLE_ENTRY = 1 << 49  # The entry is an alpha-beta (value, kind, bestAction) tuple
+NO_ACTION = 0xFFFF
+
+# Slots sharing one hash bucket, among which the replacement policy chooses
+BUCKET_SLOTS = 4
+
+BUCKET = struct.Struct('<' + 'QQQ' * BUCKET_SLOTS)
+
+_MASK64 = (1 << 64) - 1
+
+_createdBlocks = set()  # Names of the shared tables created by this process
+
+
+def attachSharedMemory(name: str) -> 'shared_memory.SharedMemory':
+    """
+    Attaches to the existing shared memory block `name` without letting the
+    resource tracker of this process remove it when the process exits, so
+    the process that created the block stays in charge of unlinking it.
+    Used by the shared tables and by any other module that shares a block
+    between processes.
+    """
+    from multiprocessing import parent_process, resource_tracker, shared_memory
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        block = shared_memory.SharedMemory(name=name)
+        # The creator and the processes it starts with multiprocessing share
+        # one tracker, where the block is already registered
+        if parent_process() is None and name not in _createdBlocks:
+            resource_tracker.unregister(block._name, 'shared_memory')
+        return block
+
+
+class SharedTranspositionTable:
+    """
+    A fixed-size cache of search results in shared memory, with the same
+    lookup/store interface as `TranspositionTable`.
+
+    Entries hold the board, the depth, the node type, the value and, for
+    alpha-beta searches, the kind of bound and the best action. A position
+    may go in any of the BUCKET_SLOTS slots of its bucket; when all of them
+    are taken, the new entry replaces the shallowest one.
+
+    Writers do not take locks. An entry written by two processes at once may
+    be lost or torn, but torn entries fail their check and read as misses.
+
+    The table is created by one process and reaches the others by pickling,
+    for example inside an agent sent to a worker pool, or by attaching with
+    `SharedTranspositionTable(name=...)`. Every process calls `close` when
+    done, and the creator calls `unlink` to free the memory.
+    """
+    def __init__(self, maxEntries: int = 1_000_000, maxBytes: int = None, name: str = None):
+        # Imported here so that processes without shared tables do not pay for multiprocessing
+        from multiprocessing import shared_memory
+        if name is None:
+            if maxBytes is not None:
+                maxEntries = min(maxEntries, maxBytes // SLOT.size)
+            numBuckets = max(1, -(-maxEntries // BUCKET_SLOTS))
+            self.block = shared_memory.SharedMemory(create=True, size=numBuckets * BUCKET_SLOTS * SLOT.size)
+            self.block.buf[:] = bytes(self.block.size)
+            _createdBlocks.add(self.block.name)
+        else:
+            self.block = attachSharedMemory(name)
+        self.name = self.block.name
+        self.maxEntries = len(self.block.buf) // SLOT.size // BUCKET_SLOTS * BUCKET_SLOTS
+        self.numBuckets = self.maxEntries // BUCKET_SLOTS
+        self.hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        # Other processes attach to the same block by name
+        return {'name': self.name}
+
+    def __setstate__(self, state):
+        self.__init__(name=state['name'])
+
+    def __len__(self) -> int:
+        """
+        Counts the occupied slots, going through the whole table.
+        """
+        return sum(1 for _, meta, _ in SLOT.iter_unpack(self.block.buf) if meta & OCCUPIED)
+
+    def bucket(self, board: int, depth: int, nodeType: int) -> int:
+        """
+        Returns the offset of the first slot of a position's bucket.
+        """
+        h = ((board ^ (depth << 56) ^ (nodeType << 62)) * 0x9E3779B97F4A7C15) & _MASK64
+        return (h >> 32) % self.numBuckets * BUCKET.size
+
+    def lookup(self, board: int, depth: int, nodeType: int, count: bool = True):
+        """
+        Returns the stored entry for the given position, or None if there is none.
+        With count=False the lookup is left out of the hit and miss counters.
+        """
+        buf = self.block.buf
+        offset = self.bucket(board, depth, nodeType)
+        position = (nodeType << 16) | depth
+        slots = BUCKET.unpack_from(buf, offset)
+        for i in range(0, 3 * BUCKET_SLOTS, 3):
+            check, meta, bits = slots[i:i + 3]
+            if meta & OCCUPIED and meta & POSITION_MASK == position and check ^ meta ^ bits == board:
+                if count:
+                    self.hits += 1
+                # Decode the checked snapshot: the slot may be rewritten after the bucket was read
+                value = _DOUBLE.unpack(_BITS.pack(bits))[0]
+                if meta & TUPLE_ENTRY:
+                    action = (meta >> 32) & 0xFFFF
+                    return value, (meta >> 24) & 0xFF, None if action == NO_ACTION else action
+                return value
+        if count:
+            self.misses += 1
+        return None
+
+    def store(self, board: int, depth: int, nodeType: int, entry):
+        """
+        Stores an entry for the given position, replacing the shallowest
+        entry of its bucket if the bucket is full.
+        """
+        if isinstance(entry, tuple):
+            value, kind, action = entry
+            meta = (OCCUPIED | TUPLE_ENTRY | ((NO_ACTION if action is None else action) << 32)
+                    | (kind << 24) | (nodeType << 16) | depth)
+        else:
+            value = entry
+            meta = OCCUPIED | (nodeType << 16) | depth
+        bits = _BITS.unpack(_DOUBLE.pack(value))[0]
+        buf = self.block.buf
+        offset = self.bucket(board, depth, nodeType)
+        slots = BUCKET.unpack_from(buf, offset)
+        target = None
+        targetDepth = None
+        for i in range(0, 3 * BUCKET_SLOTS, 3):
+            check, slotMeta, slotBits = slots[i:i + 3]
+            slotOffset = offset + 8 * i
+            if not slotMeta & OCCUPIED:
+                slotDepth = -1  # Empty slots are taken first
+            elif slotMeta & POSITION_MASK == meta & POSITION_MASK and check ^ slotMeta ^ slotBits == board:
+                target = slotOffset
+                break
+            else:
+                slotDepth = slotMeta & 0xFFFF
+            if target is None or slotDepth < targetDepth:
+                target, targetDepth = slotOffset, slotDepth
+        SLOT.pack_into(buf, target, board ^ meta ^ bits, meta, bits)
+
+    def clear(self):
+        """
+        Removes all entries and resets the counters of this process.
+        """
+        self.block.buf[:] = bytes(self.block.size)
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        """
+        Detaches this process from the table.
+        """
+        self.block.close()
+
+    def unlink(self):
+        """
+        Frees the shared memory. Only the creator should call it, once the
+        other processes are done.
+        """
+        self.block.unlink()
+        _createdBlocks.discard(self.name)